@@ -2,20 +2,32 @@ from __future__ import annotations
 
 import asyncio
 import cProfile
+import random
 from contextlib import contextmanager
 from dataclasses import dataclass
 from subprocess import check_call
 from time import monotonic
 from typing import Dict, Iterator, List, Optional, Tuple
 
+from chia_rs import G2Element, Spend, SpendBundleConditions
+
 from chia.consensus.coinbase import create_farmer_coin, create_pool_coin
+from chia.consensus.cost_calculator import NPCResult
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
+from chia.full_node.bitcoin_fee_estimator import create_bitcoin_fee_estimator
+from chia.full_node.fee_estimation import MempoolInfo
+from chia.full_node.mempool import Mempool, MempoolRemoveReason
 from chia.full_node.mempool_manager import MempoolManager
 from chia.simulator.wallet_tools import WalletTool
 from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.serialized_program import SerializedProgram
 from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.clvm_cost import CLVMCost
 from chia.types.coin_record import CoinRecord
+from chia.types.coin_spend import CoinSpend
+from chia.types.fee_rate import FeeRate
 from chia.types.mempool_inclusion_status import MempoolInclusionStatus
+from chia.types.mempool_item import MempoolItem
 from chia.types.spend_bundle import SpendBundle
 from chia.util.ints import uint32, uint64
 from chia.util.misc import to_batches
@@ -260,6 +272,146 @@ async def run_mempool_benchmark() -> None:
         print(f"  per call: {(stop - start) / len(blocks) * 1000:0.2f}ms")
 
 
+def fake_mempool_item(rng: random.Random, idx: int, assert_before_height: Optional[uint32] = None) -> MempoolItem:
+    """
+    A mempool item spending a single made-up coin. It's not valid, but it's
+    good enough for the Mempool class, which doesn't validate items.
+    """
+    coin = Coin(make_hash(idx), make_hash(idx + 1), uint64(idx))
+    cost = uint64(rng.randint(5000000, 15000000))
+    fee = uint64(rng.randint(0, 10) * cost)
+    spend = Spend(
+        coin.name(),
+        coin.parent_coin_info,
+        coin.puzzle_hash,
+        coin.amount,
+        None,
+        None,
+        None,
+        None,
+        None,
+        None,
+        [],
+        [],
+        [],
+        [],
+        [],
+        [],
+        [],
+        [],
+        0,
+    )
+    conds = SpendBundleConditions([spend], 0, 0, 0, None, None, [], cost, 0, 0)
+    spend_bundle = SpendBundle([CoinSpend(coin, SerializedProgram(), SerializedProgram())], G2Element())
+    return MempoolItem(
+        spend_bundle,
+        fee,
+        NPCResult(None, conds, cost),
+        spend_bundle.name(),
+        uint32(0),
+        assert_before_height=assert_before_height,
+    )
+
+
+def run_mempool_items_benchmark() -> None:
+    """
+    Benchmarks the Mempool class directly, on a full mempool, without the
+    validation overhead of MempoolManager
+    """
+    rng = random.Random(1337)
+    max_block_cost = uint64(DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM // 2)
+    mempool_info = MempoolInfo(
+        CLVMCost(uint64(DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM * DEFAULT_CONSTANTS.MEMPOOL_BLOCK_BUFFER)),
+        FeeRate(uint64(5)),
+        CLVMCost(max_block_cost),
+    )
+    mempool = Mempool(mempool_info, create_bitcoin_fee_estimator(max_block_cost))
+
+    print("\n== Mempool")
+    items: List[MempoolItem] = []
+    idx = 0
+    total_cost = 0
+    while total_cost < mempool_info.max_size_in_cost:
+        expires = uint32(rng.randint(100, 1000)) if idx % 10 == 0 else None
+        item = fake_mempool_item(rng, idx, expires)
+        items.append(item)
+        total_cost += item.cost
+        idx += 2
+
+    print(f"\nProfiling add_to_pool() until full ({len(items)} items)")
+    with enable_profiler(True, "mempool-fill"):
+        start = monotonic()
+        for item in items:
+            mempool.add_to_pool(item)
+        stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / len(items) * 1000:0.4f}ms")
+
+    evicting_items = [fake_mempool_item(rng, idx + i * 2) for i in range(NUM_ITERS * 10)]
+    print(f"\nProfiling add_to_pool() on full mempool, evicting items ({len(evicting_items)} items)")
+    with enable_profiler(True, "mempool-evict"):
+        start = monotonic()
+        for item in evicting_items:
+            mempool.add_to_pool(item)
+        stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / len(evicting_items) * 1000:0.4f}ms")
+
+    print(f"\nProfiling create_bundle_from_mempool_items() ({mempool.size()} items)")
+    with enable_profiler(True, "mempool-create"):
+        start = monotonic()
+        for _ in range(NUM_ITERS):
+            mempool.create_bundle_from_mempool_items(lambda _: True)
+        stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / NUM_ITERS * 1000:0.2f}ms")
+
+    print(f"\nProfiling create_bundle_from_mempool_items() from the block template ({mempool.size()} items)")
+    with enable_profiler(True, "mempool-create-template"):
+        start = monotonic()
+        for _ in range(NUM_ITERS):
+            mempool.create_bundle_from_mempool_items()
+        stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / NUM_ITERS * 1000:0.2f}ms")
+
+    template_items = [fake_mempool_item(rng, idx + (NUM_ITERS * 10 + i) * 2) for i in range(NUM_ITERS)]
+    print("\nProfiling create_bundle_from_mempool_items() from the block template, after an add_to_pool()")
+    with enable_profiler(True, "mempool-create-template-add"):
+        start = monotonic()
+        for item in template_items:
+            mempool.add_to_pool(item)
+            mempool.create_bundle_from_mempool_items()
+        stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / NUM_ITERS * 1000:0.2f}ms")
+
+    print("\nProfiling get_min_fee_rate()")
+    start = monotonic()
+    for _ in range(NUM_ITERS):
+        mempool.get_min_fee_rate(10000000)
+    stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / NUM_ITERS * 1000:0.2f}ms")
+
+    print("\nProfiling new_tx_block() with expiring items")
+    start = monotonic()
+    for height in range(100, 1001, 10):
+        mempool.new_tx_block(uint32(height), uint64(0))
+    stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / 91 * 1000:0.2f}ms")
+
+    print("\nProfiling remove_from_pool()")
+    names = mempool.all_item_ids()
+    start = monotonic()
+    for name in names:
+        mempool.remove_from_pool([name], MempoolRemoveReason.CONFLICT)
+    stop = monotonic()
+    print(f"  time: {stop - start:0.4f}s")
+    print(f"  per call: {(stop - start) / len(names) * 1000:0.4f}ms")
+
+
 if __name__ == "__main__":
     import logging
 
@@ -267,3 +419,4 @@ if __name__ == "__main__":
     logger.addHandler(logging.StreamHandler())
     logger.setLevel(logging.WARNING)
     asyncio.run(run_mempool_benchmark())
+    run_mempool_items_benchmark()
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from chia.consensus.block_record import BlockRecord
+from chia.consensus.blockchain_interface import BlockchainInterface
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
+from chia.types.blockchain_format.vdf import VDFInfo
+from chia.types.header_block import HeaderBlock
+from chia.types.weight_proof import SubEpochChallengeSegment
+from chia.util.ints import uint32
+
+
+class AugmentedBlockchain(BlockchainInterface):
+    """
+    Extends the main chain of an underlying blockchain with block records that
+    have been pre-validated but not yet added to it. This allows the next batch
+    of blocks to be pre-validated while the previous batch is still being added.
+
+    The extra blocks must extend the peak of the underlying chain. Block records
+    added to the cache at or below the underlying peak are forwarded to the
+    underlying chain, anything above it is only kept here.
+    """
+
+    _underlying: BlockchainInterface
+    _extra_blocks: Dict[bytes32, BlockRecord]
+    _height_to_hash: Dict[uint32, bytes32]
+    _cache: Dict[bytes32, BlockRecord]
+
+    def __init__(self, underlying: BlockchainInterface) -> None:
+        self._underlying = underlying
+        self._extra_blocks = {}
+        self._height_to_hash = {}
+        self._cache = {}
+
+    def add_extra_block(self, block_record: BlockRecord) -> None:
+        self._extra_blocks[block_record.header_hash] = block_record
+        self._height_to_hash[block_record.height] = block_record.header_hash
+
+    def remove_extra_block(self, header_hash: bytes32) -> None:
+        block_record = self._extra_blocks.pop(header_hash, None)
+        if block_record is not None and self._height_to_hash.get(block_record.height) == header_hash:
+            del self._height_to_hash[block_record.height]
+
+    def num_extra_blocks(self) -> int:
+        return len(self._extra_blocks)
+
+    def _get(self, header_hash: bytes32) -> Optional[BlockRecord]:
+        ret = self._extra_blocks.get(header_hash)
+        if ret is not None:
+            return ret
+        return self._cache.get(header_hash)
+
+    def get_peak(self) -> Optional[BlockRecord]:
+        return self._underlying.get_peak()
+
+    def get_peak_height(self) -> Optional[uint32]:
+        return self._underlying.get_peak_height()
+
+    def block_record(self, header_hash: bytes32) -> BlockRecord:
+        ret = self._get(header_hash)
+        if ret is not None:
+            return ret
+        return self._underlying.block_record(header_hash)
+
+    def height_to_block_record(self, height: uint32) -> BlockRecord:
+        header_hash = self.height_to_hash(height)
+        if header_hash is None:
+            raise ValueError(f"Height is not in blockchain: {height}")
+        return self.block_record(header_hash)
+
+    def get_ses_heights(self) -> List[uint32]:
+        return self._underlying.get_ses_heights()
+
+    def get_ses(self, height: uint32) -> SubEpochSummary:
+        return self._underlying.get_ses(height)
+
+    def height_to_hash(self, height: uint32) -> Optional[bytes32]:
+        ret = self._height_to_hash.get(height)
+        if ret is not None:
+            return ret
+        return self._underlying.height_to_hash(height)
+
+    def contains_block(self, header_hash: bytes32) -> bool:
+        return self._get(header_hash) is not None or self._underlying.contains_block(header_hash)
+
+    async def contains_block_from_db(self, header_hash: bytes32) -> bool:
+        return self._get(header_hash) is not None or await self._underlying.contains_block_from_db(header_hash)
+
+    def remove_block_record(self, header_hash: bytes32) -> None:
+        if header_hash in self._cache:
+            del self._cache[header_hash]
+        else:
+            self._underlying.remove_block_record(header_hash)
+
+    def add_block_record(self, block_record: BlockRecord) -> None:
+        if block_record.header_hash in self._extra_blocks:
+            return
+        peak_height = self._underlying.get_peak_height()
+        if peak_height is not None and block_record.height <= peak_height:
+            self._underlying.add_block_record(block_record)
+        else:
+            self._cache[block_record.header_hash] = block_record
+
+    def contains_height(self, height: uint32) -> bool:
+        return height in self._height_to_hash or self._underlying.contains_height(height)
+
+    async def warmup(self, fork_point: uint32) -> None:
+        await self._underlying.warmup(fork_point)
+
+    async def get_block_record_from_db(self, header_hash: bytes32) -> Optional[BlockRecord]:
+        ret = self._get(header_hash)
+        if ret is not None:
+            return ret
+        return await self._underlying.get_block_record_from_db(header_hash)
+
+    async def get_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
+        ret = await self._underlying.get_block_records_in_range(start, stop)
+        for header_hash, block_record in self._extra_blocks.items():
+            if start <= block_record.height <= stop:
+                ret[header_hash] = block_record
+        return ret
+
+    async def prev_block_hash(self, header_hashes: List[bytes32]) -> List[bytes32]:
+        ret: List[bytes32] = []
+        for h in header_hashes:
+            block_record = self._get(h)
+            if block_record is not None:
+                ret.append(block_record.prev_hash)
+            else:
+                ret.extend(await self._underlying.prev_block_hash([h]))
+        return ret
+
+    async def get_header_blocks_in_range(
+        self, start: int, stop: int, tx_filter: bool = True
+    ) -> Dict[bytes32, HeaderBlock]:
+        return await self._underlying.get_header_blocks_in_range(start, stop, tx_filter)
+
+    async def get_header_block_by_height(
+        self, height: int, header_hash: bytes32, tx_filter: bool = True
+    ) -> Optional[HeaderBlock]:
+        return await self._underlying.get_header_block_by_height(height, header_hash, tx_filter)
+
+    async def get_block_records_at(self, heights: List[uint32]) -> List[BlockRecord]:
+        underlying_heights = [h for h in heights if h not in self._height_to_hash]
+        underlying_records = iter(await self._underlying.get_block_records_at(underlying_heights))
+        ret: List[BlockRecord] = []
+        for h in heights:
+            header_hash = self._height_to_hash.get(h)
+            if header_hash is not None:
+                ret.append(self._extra_blocks[header_hash])
+            else:
+                ret.append(next(underlying_records))
+        return ret
+
+    async def persist_sub_epoch_challenge_segments(
+        self, sub_epoch_summary_hash: bytes32, segments: List[SubEpochChallengeSegment]
+    ) -> None:
+        await self._underlying.persist_sub_epoch_challenge_segments(sub_epoch_summary_hash, segments)
+
+    async def get_sub_epoch_challenge_segments(
+        self,
+        sub_epoch_summary_hash: bytes32,
+    ) -> Optional[List[SubEpochChallengeSegment]]:
+        return await self._underlying.get_sub_epoch_challenge_segments(sub_epoch_summary_hash)
+
+    def seen_compact_proofs(self, vdf_info: VDFInfo, height: uint32) -> bool:
+        return self._underlying.seen_compact_proofs(vdf_info, height)
@@ -183,6 +183,37 @@ class Blockchain(BlockchainInterface):
         assert self.__height_map.contains_height(self._peak_height)
         assert not self.__height_map.contains_height(uint32(self._peak_height + 1))
 
+        unflushed_height = await self.coin_store.get_unflushed_height()
+        if unflushed_height is not None:
+            await self._replay_coin_changes(unflushed_height)
+
+    async def _replay_coin_changes(self, start_height: uint32) -> None:
+        """
+        The node stopped before the coin changes buffered during long sync were
+        written to the coin store. They are re-applied from the blocks, which
+        have been committed.
+        """
+        assert self._peak_height is not None
+        log.warning(f"Re-applying the coin changes of blocks {start_height} to {self._peak_height} to the coin store")
+        async with self.block_store.db_wrapper.writer():
+            await self.coin_store.rollback_to_block(start_height - 1)
+            for height in range(start_height, self._peak_height + 1):
+                header_hash = self.height_to_hash(uint32(height))
+                assert header_hash is not None
+                block = await self.block_store.get_full_block(header_hash)
+                assert block is not None
+                if not block.is_transaction_block():
+                    continue
+                assert block.foliage_transaction_block is not None
+                tx_removals, tx_additions, _ = await self.get_tx_removals_and_additions(block, None)
+                await self.coin_store.new_block(
+                    block.height,
+                    block.foliage_transaction_block.timestamp,
+                    block.get_included_reward_coins(),
+                    tx_additions,
+                    tx_removals,
+                )
+
     def get_peak(self) -> Optional[BlockRecord]:
         """
         Return the peak of the blockchain
@@ -483,6 +514,9 @@ class Blockchain(BlockchainInterface):
 
         except BaseException as e:
             self.block_store.rollback_cache_block(header_hash)
+            # coin changes buffered by the coin store were not rolled back with
+            # the transaction
+            self.coin_store.rollback_pending(-1 if previous_peak_height is None else previous_peak_height)
             self._peak_height = previous_peak_height
             log.error(
                 f"Error while adding block {header_hash} height {block.height},"
@@ -829,10 +863,14 @@ class Blockchain(BlockchainInterface):
         wp_summaries: Optional[List[SubEpochSummary]] = None,
         *,
         validate_signatures: bool,
+        block_records: Optional[BlockchainInterface] = None,
+        new_block_records: Optional[Dict[bytes32, BlockRecord]] = None,
     ) -> List[PreValidationResult]:
+        # block_records may be passed in to validate blocks on top of ones
+        # that have not been added to the chain yet (see AugmentedBlockchain)
         return await pre_validate_blocks_multiprocessing(
             self.constants,
-            self,
+            self if block_records is None else block_records,
             blocks,
             self.pool,
             True,
@@ -841,6 +879,7 @@ class Blockchain(BlockchainInterface):
             batch_size,
             wp_summaries,
             validate_signatures=validate_signatures,
+            new_block_records=new_block_records,
         )
 
     async def run_generator(self, unfinished_block: bytes, generator: BlockGenerator, height: uint32) -> NPCResult:
@@ -175,6 +175,7 @@ async def pre_validate_blocks_multiprocessing(
     wp_summaries: Optional[List[SubEpochSummary]] = None,
     *,
     validate_signatures: bool = True,
+    new_block_records: Optional[Dict[bytes32, BlockRecord]] = None,
 ) -> List[PreValidationResult]:
     """
     This method must be called under the blockchain lock
@@ -190,6 +191,7 @@ async def pre_validate_blocks_multiprocessing(
         blocks: list of full blocks to validate (must be connected to current chain)
         npc_results
         get_block_generator
+        new_block_records: if passed, the block records computed for the blocks are stored in it
     """
     prev_b: Optional[BlockRecord] = None
     # Collects all the recent blocks (up to the previous sub-epoch)
@@ -311,6 +313,8 @@ async def pre_validate_blocks_multiprocessing(
         block_dict[block_hashes[i]] = block
         if not block_record_was_present[i]:
             block_records.remove_block_record(block_hashes[i])
+        if new_block_records is not None:
+            new_block_records[block_hashes[i]] = recent_blocks[block_hashes[i]]
 
     npc_results_pickled = {}
     for k, v in npc_results.items():
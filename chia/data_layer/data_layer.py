@@ -59,6 +59,7 @@ from chia.data_layer.download_data import (
     insert_from_delta_file,
     write_files_for_root,
 )
+from chia.data_layer.tree_file import TreeFileFormat
 from chia.rpc.rpc_server import StateChangedProtocol, default_get_connections
 from chia.rpc.wallet_rpc_client import WalletRpcClient
 from chia.server.outbound_message import NodeType
@@ -115,6 +116,7 @@ class DataLayer:
     periodically_manage_data_task: Optional[asyncio.Task[None]] = None
     _wallet_rpc: Optional[WalletRpcClient] = None
     subscription_lock: asyncio.Lock = dataclasses.field(default_factory=asyncio.Lock)
+    tree_file_format: TreeFileFormat = TreeFileFormat.legacy
 
     @property
     def server(self) -> ChiaServer:
@@ -174,6 +176,7 @@ class DataLayer:
             downloaders=downloaders,
             uploaders=uploaders,
             maximum_full_file_count=config.get("maximum_full_file_count", 1),
+            tree_file_format=TreeFileFormat(config.get("tree_file_format", TreeFileFormat.legacy.value)),
         )
 
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -343,6 +346,24 @@ class DataLayer:
         res = await self.data_store.get_keys(store_id, root_hash)
         return res
 
+    async def get_keys_values_paginated(
+        self, store_id: bytes32, root_hash: Optional[bytes32], after_key: Optional[bytes], max_page_size: int
+    ) -> List[TerminalNode]:
+        await self._update_confirmation_status(tree_id=store_id)
+
+        return await self.data_store.get_keys_values_paginated(
+            store_id, root_hash, after_key=after_key, max_page_size=max_page_size
+        )
+
+    async def get_keys_paginated(
+        self, store_id: bytes32, root_hash: Optional[bytes32], after_key: Optional[bytes], max_page_size: int
+    ) -> List[bytes]:
+        await self._update_confirmation_status(tree_id=store_id)
+
+        return await self.data_store.get_keys_paginated(
+            store_id, root_hash, after_key=after_key, max_page_size=max_page_size
+        )
+
     async def get_ancestors(self, node_hash: bytes32, store_id: bytes32) -> List[InternalNode]:
         await self._update_confirmation_status(tree_id=store_id)
 
@@ -491,6 +512,7 @@ class DataLayer:
                     self.log,
                     proxy_url,
                     await self.get_downloader(tree_id, url),
+                    self.tree_file_format,
                 )
                 if success:
                     self.log.info(
@@ -553,6 +575,7 @@ class DataLayer:
                 root,
                 self.server_files_location,
                 full_tree_first_publish_generation,
+                file_format=self.tree_file_format,
             )
             if not write_file_result.result:
                 # this particular return only happens if the files already exist, no need to log anything
@@ -618,6 +641,7 @@ class DataLayer:
                 server_files_location,
                 full_tree_first_publish_generation,
                 overwrite,
+                self.tree_file_format,
             )
             files.append(res.diff_tree.name)
             if res.full_tree is not None:
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import itertools
 import logging
 from collections import defaultdict
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import aiosqlite
 
@@ -20,7 +21,6 @@ from chia.data_layer.data_layer_util import (
     ProofOfInclusion,
     ProofOfInclusionLayer,
     Root,
-    SerializedNode,
     ServerInfo,
     Side,
     Status,
@@ -30,9 +30,11 @@ from chia.data_layer.data_layer_util import (
     leaf_hash,
     row_to_node,
 )
+from chia.data_layer.tree_file import TreeFileFormat, TreeFileWriter
 from chia.types.blockchain_format.program import Program
 from chia.types.blockchain_format.sized_bytes import bytes32
-from chia.util.db_wrapper import DBWrapper2
+from chia.util.db_wrapper import SQLITE_MAX_VARIABLE_NUMBER, DBWrapper2
+from chia.util.misc import to_batches
 
 log = logging.getLogger(__name__)
 
@@ -41,6 +43,182 @@ log = logging.getLogger(__name__)
 # TODO: pick exception types other than Exception
 
 
+@dataclass(eq=False)
+class _BatchNode:
+    # hash is None for internal nodes that were created or changed by the batch
+    hash: Optional[bytes32]
+    parent: Optional[_BatchNode] = None
+    left: Optional[_BatchNode] = None
+    right: Optional[_BatchNode] = None
+    key: Optional[bytes] = None
+    value: Optional[bytes] = None
+
+
+class _BatchTree:
+    """
+    A tree that a changelist is applied to in memory by insert_batch(). The
+    changes are made exactly the way autoinsert(), insert() and delete() make
+    them, so the resulting tree is the same, but only the hashes of the nodes
+    changed by the whole batch are computed, once, at the end.
+    """
+
+    root: Optional[_BatchNode]
+    terminals: Dict[bytes, _BatchNode]
+    terminals_by_hash: Dict[bytes32, _BatchNode]
+    old_internal_hashes: Set[bytes32]
+    new_terminals: List[_BatchNode]
+
+    def __init__(self, rows: List[aiosqlite.Row], root_hash: Optional[bytes32]) -> None:
+        nodes: Dict[bytes32, _BatchNode] = {}
+        children: List[Tuple[_BatchNode, bytes32, bytes32]] = []
+        self.terminals = {}
+        self.terminals_by_hash = {}
+        self.old_internal_hashes = set()
+        self.new_terminals = []
+        for row in rows:
+            node_hash = bytes32(row["hash"])
+            if row["node_type"] == NodeType.INTERNAL:
+                node = _BatchNode(node_hash)
+                children.append((node, bytes32(row["left"]), bytes32(row["right"])))
+                self.old_internal_hashes.add(node_hash)
+            else:
+                node = _BatchNode(node_hash, key=row["key"], value=row["value"])
+                self.terminals[row["key"]] = node
+                self.terminals_by_hash[node_hash] = node
+            nodes[node_hash] = node
+        for node, left_hash, right_hash in children:
+            node.left = nodes[left_hash]
+            node.right = nodes[right_hash]
+            node.left.parent = node
+            node.right.parent = node
+        self.root = None if root_hash is None else nodes[root_hash]
+
+    def _mark_changed(self, node: Optional[_BatchNode]) -> None:
+        while node is not None and node.hash is not None:
+            node.hash = None
+            node = node.parent
+
+    def _depth(self, node: _BatchNode) -> int:
+        depth = 0
+        while node.parent is not None:
+            node = node.parent
+            depth += 1
+        return depth
+
+    def autoinsert(self, key: bytes, value: bytes) -> None:
+        if self.root is None:
+            self.insert(key, value, None, None)
+            return
+        # the same walk as get_terminal_node_for_seed()
+        seed = leaf_hash(key=key, value=value)
+        path = "".join(reversed("".join(f"{b:08b}" for b in seed)))
+        node = self.root
+        depth = 0
+        while node.left is not None and node.right is not None:
+            node = node.left if path[depth] == "0" else node.right
+            depth += 1
+        assert node.hash is not None
+        self.insert(key, value, node.hash, Side.LEFT if seed[0] < 128 else Side.RIGHT)
+
+    def insert(self, key: bytes, value: bytes, reference_node_hash: Optional[bytes32], side: Optional[Side]) -> None:
+        if key in self.terminals:
+            raise Exception(f"Key already present: {key.hex()}")
+        new_node = _BatchNode(leaf_hash(key=key, value=value), key=key, value=value)
+        if self.root is None:
+            if reference_node_hash is not None or side is not None:
+                raise Exception(f"Tree was empty so side must be unspecified, got: {side!r}")
+            self.root = new_node
+        else:
+            if reference_node_hash is None or side is None:
+                raise Exception("Tree was not empty, side and reference node hash must be specified.")
+            reference = self.terminals_by_hash.get(reference_node_hash)
+            if reference is None:
+                raise Exception(f"Reference node is not a terminal node of the tree: {reference_node_hash.hex()}")
+            if self._depth(reference) >= 62:
+                raise RuntimeError("Tree exceeds max height of 62.")
+            parent = reference.parent
+            if side == Side.LEFT:
+                new_internal = _BatchNode(None, parent=parent, left=new_node, right=reference)
+            else:
+                new_internal = _BatchNode(None, parent=parent, left=reference, right=new_node)
+            if parent is None:
+                self.root = new_internal
+            elif parent.left is reference:
+                parent.left = new_internal
+            else:
+                parent.right = new_internal
+            reference.parent = new_internal
+            new_node.parent = new_internal
+            self._mark_changed(parent)
+        self.terminals[key] = new_node
+        assert new_node.hash is not None
+        self.terminals_by_hash[new_node.hash] = new_node
+        self.new_terminals.append(new_node)
+
+    def delete(self, key: bytes) -> None:
+        node = self.terminals.pop(key, None)
+        if node is None:
+            log.debug(f"Request to delete an unknown key ignored: {key.hex()}")
+            return
+        assert node.hash is not None
+        del self.terminals_by_hash[node.hash]
+        if self._depth(node) > 62:
+            raise RuntimeError("Tree exceeded max height of 62.")
+        parent = node.parent
+        if parent is None:
+            # the only node is being deleted
+            self.root = None
+            return
+        # the other child takes the place of the parent
+        other = parent.right if parent.left is node else parent.left
+        assert other is not None
+        grandparent = parent.parent
+        other.parent = grandparent
+        if grandparent is None:
+            self.root = other
+        elif grandparent.left is parent:
+            grandparent.left = other
+        else:
+            grandparent.right = other
+        self._mark_changed(grandparent)
+
+    def finish(self) -> Tuple[Optional[bytes32], List[Tuple[Any, ...]], List[Tuple[bytes32, bytes32]]]:
+        """
+        Computes the hashes of the changed internal nodes. Returns the new root
+        hash, the node rows to insert (children before their parents), and the
+        (child, parent) pairs of the internal nodes that aren't in the old tree
+        """
+        node_rows: List[Tuple[Any, ...]] = []
+        for node in self.new_terminals:
+            # terminals that were inserted and deleted again aren't written
+            assert node.key is not None
+            if self.terminals.get(node.key) is node:
+                node_rows.append((node.hash, NodeType.TERMINAL, None, None, node.key, node.value))
+        ancestor_pairs: List[Tuple[bytes32, bytes32]] = []
+        if self.root is None:
+            return None, node_rows, ancestor_pairs
+
+        # post-order traversal of the changed internal nodes
+        stack: List[Tuple[_BatchNode, bool]] = [(self.root, False)]
+        while len(stack) > 0:
+            node, children_done = stack.pop()
+            if node.hash is not None:
+                continue
+            assert node.left is not None and node.right is not None
+            if not children_done:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+                continue
+            assert node.left.hash is not None and node.right.hash is not None
+            node.hash = internal_hash(left_hash=node.left.hash, right_hash=node.right.hash)
+            if node.hash not in self.old_internal_hashes:
+                node_rows.append((node.hash, NodeType.INTERNAL, node.left.hash, node.right.hash, None, None))
+                ancestor_pairs.append((node.left.hash, node.hash))
+                ancestor_pairs.append((node.right.hash, node.hash))
+        return self.root.hash, node_rows, ancestor_pairs
+
+
 @dataclass
 class DataStore:
     """A key/value store with the pairs being terminal nodes in a CLVM object tree."""
@@ -147,6 +325,30 @@ class DataStore:
                 )
                 """
             )
+            # The key -> terminal node index of the committed roots.  A row is live for
+            # the generations from generation_added up to (excluding) generation_removed.
+            await writer.execute(
+                """
+                CREATE TABLE IF NOT EXISTS key_index(
+                    tree_id BLOB NOT NULL CHECK(length(tree_id) == 32),
+                    key BLOB NOT NULL,
+                    hash BLOB NOT NULL REFERENCES node,
+                    generation_added INTEGER NOT NULL,
+                    generation_removed INTEGER,
+                    PRIMARY KEY(tree_id, key, generation_added)
+                )
+                """
+            )
+            # The range of generations of each tree that key_index covers.
+            await writer.execute(
+                """
+                CREATE TABLE IF NOT EXISTS key_index_generations(
+                    tree_id BLOB PRIMARY KEY NOT NULL CHECK(length(tree_id) == 32),
+                    first_generation INTEGER NOT NULL,
+                    last_generation INTEGER NOT NULL
+                )
+                """
+            )
             await writer.execute(
                 """
                 CREATE INDEX IF NOT EXISTS node_hash ON root(node_hash)
@@ -215,6 +417,8 @@ class DataStore:
                     """,
                     values,
                 )
+            if status == Status.COMMITTED:
+                await self._update_key_index(tree_id=tree_id, generation=generation, node_hash=node_hash)
 
             return new_root
 
@@ -427,6 +631,158 @@ class DataStore:
                     """,
                     values,
                 )
+            if status == Status.COMMITTED:
+                await self._update_key_index(tree_id=root.tree_id, generation=root.generation, node_hash=root.node_hash)
+
+    async def _get_terminal_changes(
+        self, old_root_hash: Optional[bytes32], new_root_hash: Optional[bytes32]
+    ) -> Tuple[List[TerminalNode], List[TerminalNode]]:
+        """
+        Returns the terminal nodes only in the old tree and the ones only in the new
+        tree.  Both trees are walked top down together, one level per query, and
+        subtrees found in both trees aren't descended into.  The cost follows the
+        size of the change rather than the size of the trees.
+        """
+        # per tree, the parent of every node reached so far
+        parents: Tuple[Dict[bytes32, Optional[bytes32]], ...] = ({}, {})
+        frontiers: List[List[bytes32]] = [[], []]
+        terminals: Tuple[List[TerminalNode], ...] = ([], [])
+        for index, root_hash in enumerate((old_root_hash, new_root_hash)):
+            if root_hash is not None:
+                parents[index][root_hash] = None
+                frontiers[index].append(root_hash)
+        shared: Set[bytes32] = set()
+
+        def in_shared_subtree(index: int, node_hash: bytes32) -> bool:
+            current: Optional[bytes32] = node_hash
+            while current is not None:
+                if current in shared:
+                    return True
+                current = parents[index][current]
+            return False
+
+        async with self.db_wrapper.reader() as reader:
+            while len(frontiers[0]) + len(frontiers[1]) > 0:
+                shared.update(node_hash for node_hash in frontiers[0] if node_hash in parents[1])
+                shared.update(node_hash for node_hash in frontiers[1] if node_hash in parents[0])
+                to_expand = [
+                    [node_hash for node_hash in frontier if not in_shared_subtree(index, node_hash)]
+                    for index, frontier in enumerate(frontiers)
+                ]
+                nodes: Dict[bytes32, Node] = {}
+                for batch in to_batches({*to_expand[0], *to_expand[1]}, SQLITE_MAX_VARIABLE_NUMBER):
+                    cursor = await reader.execute(
+                        f"SELECT * FROM node WHERE hash IN ({','.join('?' * len(batch.entries))})",
+                        batch.entries,
+                    )
+                    async for row in cursor:
+                        node = row_to_node(row=row)
+                        nodes[node.hash] = node
+                for index in range(2):
+                    frontiers[index] = []
+                    for node_hash in to_expand[index]:
+                        node = nodes[node_hash]
+                        if isinstance(node, InternalNode):
+                            for child_hash in (node.left_hash, node.right_hash):
+                                parents[index][child_hash] = node_hash
+                                frontiers[index].append(child_hash)
+                        else:
+                            assert isinstance(node, TerminalNode)
+                            terminals[index].append(node)
+
+        # a subtree can be at different depths in the two trees, so a part of it may
+        # have been walked on one side before it was reached on the other
+        return (
+            [node for node in terminals[0] if not in_shared_subtree(0, node.hash)],
+            [node for node in terminals[1] if not in_shared_subtree(1, node.hash)],
+        )
+
+    async def _update_key_index(self, tree_id: bytes32, generation: int, node_hash: Optional[bytes32]) -> None:
+        async with self.db_wrapper.writer() as writer:
+            cursor = await writer.execute(
+                "SELECT * FROM key_index_generations WHERE tree_id == :tree_id",
+                {"tree_id": tree_id},
+            )
+            row = await cursor.fetchone()
+            previous_root: Optional[Root] = None
+            first_generation = generation
+            if row is not None and row["last_generation"] == generation - 1:
+                cursor = await writer.execute(
+                    "SELECT * FROM root WHERE tree_id == :tree_id AND generation == :generation AND status == :status",
+                    {"tree_id": tree_id, "generation": generation - 1, "status": Status.COMMITTED.value},
+                )
+                previous_row = await cursor.fetchone()
+                if previous_row is not None:
+                    previous_root = Root.from_row(row=previous_row)
+                    first_generation = row["first_generation"]
+
+            if previous_root is None:
+                # nothing to build on, index this generation from scratch
+                await writer.execute("DELETE FROM key_index WHERE tree_id == :tree_id", {"tree_id": tree_id})
+                removed, added = await self._get_terminal_changes(None, node_hash)
+            elif previous_root.node_hash == node_hash:
+                removed, added = [], []
+            else:
+                removed, added = await self._get_terminal_changes(previous_root.node_hash, node_hash)
+
+            await writer.executemany(
+                """
+                UPDATE key_index SET generation_removed = ?
+                WHERE tree_id == ? AND key == ? AND generation_removed IS NULL
+                """,
+                [(generation, tree_id, node.key) for node in removed],
+            )
+            await writer.executemany(
+                """
+                INSERT INTO key_index(tree_id, key, hash, generation_added, generation_removed)
+                VALUES(?, ?, ?, ?, NULL)
+                """,
+                [(tree_id, node.key, node.hash, generation) for node in added],
+            )
+            await writer.execute(
+                """
+                INSERT OR REPLACE INTO key_index_generations(tree_id, first_generation, last_generation)
+                VALUES(:tree_id, :first_generation, :last_generation)
+                """,
+                {"tree_id": tree_id, "first_generation": first_generation, "last_generation": generation},
+            )
+
+    async def _get_key_index_generation(self, tree_id: bytes32, root_hash: Optional[bytes32]) -> Optional[int]:
+        """
+        Returns the generation to look the root up by in key_index, None if the index
+        doesn't cover the root.  A root_hash of None is the latest committed root.
+        """
+        async with self.db_wrapper.reader() as reader:
+            cursor = await reader.execute(
+                "SELECT * FROM key_index_generations WHERE tree_id == :tree_id",
+                {"tree_id": tree_id},
+            )
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            if root_hash is None:
+                generation: Optional[int] = await self.get_tree_generation(tree_id=tree_id)
+            else:
+                cursor = await reader.execute(
+                    """
+                    SELECT MAX(generation) FROM root
+                    WHERE tree_id == :tree_id AND node_hash == :node_hash AND status == :status
+                    AND generation BETWEEN :first_generation AND :last_generation
+                    """,
+                    {
+                        "tree_id": tree_id,
+                        "node_hash": root_hash,
+                        "status": Status.COMMITTED.value,
+                        "first_generation": row["first_generation"],
+                        "last_generation": row["last_generation"],
+                    },
+                )
+                generation_row = await cursor.fetchone()
+                generation = None if generation_row is None else generation_row["MAX(generation)"]
+
+        if generation is None or not row["first_generation"] <= generation <= row["last_generation"]:
+            return None
+        return generation
 
     async def check(self) -> None:
         for check in self._checks:
@@ -828,6 +1184,10 @@ class DataStore:
             )
 
     async def get_keys_values_dict(self, tree_id: bytes32, root_hash: Optional[bytes32] = None) -> Dict[bytes, bytes]:
+        # a negative LIMIT is no limit
+        rows = await self._get_key_page(tree_id, root_hash, None, -1, keys_only=False)
+        if rows is not None:
+            return {row["key"]: row["value"] for row in rows}
         pairs = await self.get_keys_values(tree_id=tree_id, root_hash=root_hash)
         return {node.key: node.value for node in pairs}
 
@@ -877,8 +1237,11 @@ class DataStore:
             if not was_empty:
                 if hint_keys_values is None:
                     # TODO: is there any way the db can enforce this?
-                    pairs = await self.get_keys_values(tree_id=tree_id)
-                    if any(key == node.key for node in pairs):
+                    try:
+                        await self.get_node_by_key(key=key, tree_id=tree_id)
+                    except KeyNotFoundError:
+                        pass
+                    else:
                         raise Exception(f"Key already present: {key.hex()}")
                 else:
                     if bytes(key) in hint_keys_values:
@@ -1079,15 +1442,28 @@ class DataStore:
         changelist: List[Dict[str, Any]],
         status: Status = Status.PENDING,
     ) -> Optional[bytes32]:
-        async with self.db_wrapper.writer():
+        async with self.db_wrapper.writer() as writer:
             old_root = await self.get_tree_root(tree_id)
-            root_hash = old_root.node_hash
-            if old_root.node_hash is None:
-                hint_keys_values = {}
-            else:
-                hint_keys_values = await self.get_keys_values_dict(tree_id, root_hash=root_hash)
+            # the changelist is applied to the whole tree in memory, only the
+            # final nodes are written
+            rows: List[aiosqlite.Row] = []
+            if old_root.node_hash is not None:
+                cursor = await writer.execute(
+                    """
+                    WITH RECURSIVE
+                        tree_from_root_hash(hash, node_type, left, right, key, value) AS (
+                            SELECT node.* FROM node WHERE node.hash == :root_hash
+                            UNION ALL
+                            SELECT node.* FROM node, tree_from_root_hash
+                            WHERE node.hash == tree_from_root_hash.left OR node.hash == tree_from_root_hash.right
+                        )
+                    SELECT * FROM tree_from_root_hash
+                    """,
+                    {"root_hash": old_root.node_hash},
+                )
+                rows = list(await cursor.fetchall())
+            tree = _BatchTree(rows, old_root.node_hash)
 
-            intermediate_root: Optional[Root] = old_root
             for change in changelist:
                 if change["action"] == "insert":
                     key = change["key"]
@@ -1095,41 +1471,37 @@ class DataStore:
                     reference_node_hash = change.get("reference_node_hash", None)
                     side = change.get("side", None)
                     if reference_node_hash is None and side is None:
-                        insert_result = await self.autoinsert(
-                            key, value, tree_id, hint_keys_values, True, Status.COMMITTED, root=intermediate_root
-                        )
-                        intermediate_root = insert_result.root
+                        tree.autoinsert(key, value)
                     else:
                         if reference_node_hash is None or side is None:
                             raise Exception("Provide both reference_node_hash and side or neither.")
-                        insert_result = await self.insert(
-                            key,
-                            value,
-                            tree_id,
-                            reference_node_hash,
-                            side,
-                            hint_keys_values,
-                            True,
-                            Status.COMMITTED,
-                            root=intermediate_root,
-                        )
-                        intermediate_root = insert_result.root
+                        tree.insert(key, value, reference_node_hash, side)
                 elif change["action"] == "delete":
-                    key = change["key"]
-                    intermediate_root = await self.delete(
-                        key, tree_id, hint_keys_values, True, Status.COMMITTED, root=intermediate_root
-                    )
+                    tree.delete(change["key"])
                 else:
                     raise Exception(f"Operation in batch is not insert or delete: {change}")
 
-            root = await self.get_tree_root(tree_id=tree_id)
-            if root.node_hash == old_root.node_hash:
-                if len(changelist) != 0:
-                    await self.rollback_to_generation(tree_id, old_root.generation)
+            root_hash, node_rows, ancestor_pairs = tree.finish()
+            if root_hash == old_root.node_hash:
                 raise ValueError("Changelist resulted in no change to tree data")
-            # We delete all "temporary" records stored in root and ancestor tables and store only the final result.
-            await self.rollback_to_generation(tree_id, old_root.generation)
-            await self.insert_root_with_ancestor_table(tree_id=tree_id, node_hash=root.node_hash, status=status)
+
+            await writer.executemany(
+                """
+                INSERT OR IGNORE INTO node(hash, node_type, left, right, key, value)
+                VALUES(?, ?, ?, ?, ?, ?)
+                """,
+                node_rows,
+            )
+            await self._insert_root(tree_id=tree_id, node_hash=root_hash, status=status)
+            # the ancestor table isn't updated for roots that aren't committed
+            if status == Status.COMMITTED:
+                await writer.executemany(
+                    """
+                    INSERT INTO ancestors(hash, ancestor, tree_id, generation)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    [(child, parent, tree_id, old_root.generation + 1) for child, parent in ancestor_pairs],
+                )
             if status == Status.PENDING:
                 new_root = await self.get_pending_root(tree_id=tree_id)
                 assert new_root is not None
@@ -1137,16 +1509,16 @@ class DataStore:
                 new_root = await self.get_tree_root(tree_id=tree_id)
             else:
                 raise Exception(f"No known status: {status}")
-            if new_root.node_hash != root.node_hash:
+            if new_root.node_hash != root_hash:
                 raise RuntimeError(
-                    f"Tree root mismatches after batch update: Expected: {root.node_hash}. Got: {new_root.node_hash}"
+                    f"Tree root mismatches after batch update: Expected: {root_hash}. Got: {new_root.node_hash}"
                 )
             if new_root.generation != old_root.generation + 1:
                 raise RuntimeError(
                     "Didn't get the expected generation after batch update: "
                     f"Expected: {old_root.generation + 1}. Got: {new_root.generation}"
                 )
-            return root.node_hash
+            return root_hash
 
     async def _get_one_ancestor(
         self,
@@ -1218,6 +1590,25 @@ class DataStore:
         tree_id: bytes32,
         root_hash: Optional[bytes32] = None,
     ) -> TerminalNode:
+        async with self.db_wrapper.reader() as reader:
+            generation = await self._get_key_index_generation(tree_id=tree_id, root_hash=root_hash)
+            if generation is not None:
+                cursor = await reader.execute(
+                    """
+                    SELECT node.* FROM key_index INNER JOIN node ON node.hash == key_index.hash
+                    WHERE key_index.tree_id == :tree_id AND key_index.key == :key
+                    AND key_index.generation_added <= :generation
+                    AND (key_index.generation_removed IS NULL OR key_index.generation_removed > :generation)
+                    """,
+                    {"tree_id": tree_id, "key": bytes(key), "generation": generation},
+                )
+                row = await cursor.fetchone()
+                if row is None:
+                    raise KeyNotFoundError(key=key)
+                node = row_to_node(row=row)
+                assert isinstance(node, TerminalNode)
+                return node
+
         nodes = await self.get_keys_values(tree_id=tree_id, root_hash=root_hash)
 
         for node in nodes:
@@ -1226,6 +1617,83 @@ class DataStore:
 
         raise KeyNotFoundError(key=key)
 
+    async def _get_key_page(
+        self,
+        tree_id: bytes32,
+        root_hash: Optional[bytes32],
+        after_key: Optional[bytes],
+        max_page_size: int,
+        keys_only: bool,
+    ) -> Optional[List[aiosqlite.Row]]:
+        # returns None if key_index doesn't cover the root
+        async with self.db_wrapper.reader() as reader:
+            generation = await self._get_key_index_generation(tree_id=tree_id, root_hash=root_hash)
+            if generation is None:
+                return None
+            after_key_str = "AND key_index.key > :after_key " if after_key is not None else ""
+            if keys_only:
+                select_str = "SELECT key_index.key AS key FROM key_index "
+            else:
+                select_str = "SELECT node.* FROM key_index INNER JOIN node ON node.hash == key_index.hash "
+            cursor = await reader.execute(
+                f"{select_str}"
+                "WHERE key_index.tree_id == :tree_id "
+                "AND key_index.generation_added <= :generation "
+                "AND (key_index.generation_removed IS NULL OR key_index.generation_removed > :generation) "
+                f"{after_key_str}"
+                "ORDER BY key_index.key LIMIT :limit",
+                {"tree_id": tree_id, "generation": generation, "after_key": after_key, "limit": max_page_size},
+            )
+            return list(await cursor.fetchall())
+
+    async def _get_unindexed_page(
+        self,
+        tree_id: bytes32,
+        root_hash: Optional[bytes32],
+        after_key: Optional[bytes],
+        max_page_size: int,
+    ) -> List[TerminalNode]:
+        async with self.db_wrapper.reader():
+            if root_hash is None:
+                root = await self.get_tree_root(tree_id=tree_id)
+                root_hash = root.node_hash
+            _, nodes = await self._get_terminal_changes(None, root_hash)
+        nodes = sorted((node for node in nodes if after_key is None or node.key > after_key), key=lambda node: node.key)
+        return nodes[:max_page_size]
+
+    async def get_keys_paginated(
+        self,
+        tree_id: bytes32,
+        root_hash: Optional[bytes32] = None,
+        after_key: Optional[bytes] = None,
+        max_page_size: int = 1000,
+    ) -> List[bytes]:
+        """
+        Returns up to max_page_size keys, ordered by key, starting after after_key.
+        Pass the last key of a page as after_key to get the next page.
+        """
+        rows = await self._get_key_page(tree_id, root_hash, after_key, max_page_size, keys_only=True)
+        if rows is None:
+            return [node.key for node in await self._get_unindexed_page(tree_id, root_hash, after_key, max_page_size)]
+        return [row["key"] for row in rows]
+
+    async def get_keys_values_paginated(
+        self,
+        tree_id: bytes32,
+        root_hash: Optional[bytes32] = None,
+        after_key: Optional[bytes] = None,
+        max_page_size: int = 1000,
+    ) -> List[TerminalNode]:
+        """
+        Returns up to max_page_size terminal nodes, ordered by key, starting after
+        after_key.  Pass the key of the last node of a page as after_key to get the
+        next page.
+        """
+        rows = await self._get_key_page(tree_id, root_hash, after_key, max_page_size, keys_only=False)
+        if rows is None:
+            return await self._get_unindexed_page(tree_id, root_hash, after_key, max_page_size)
+        return [TerminalNode.from_row(row=row) for row in rows]
+
     async def get_node(self, node_hash: bytes32) -> Node:
         async with self.db_wrapper.reader() as reader:
             cursor = await reader.execute("SELECT * FROM node WHERE hash == :hash LIMIT 1", {"hash": node_hash})
@@ -1337,6 +1805,19 @@ class DataStore:
         tree_id: bytes32,
         deltas_only: bool,
         writer: BinaryIO,
+        file_format: TreeFileFormat = TreeFileFormat.legacy,
+    ) -> None:
+        tree_writer = TreeFileWriter(writer, file_format)
+        await self._write_tree_nodes(root, node_hash, tree_id, deltas_only, tree_writer)
+        tree_writer.finish()
+
+    async def _write_tree_nodes(
+        self,
+        root: Root,
+        node_hash: bytes32,
+        tree_id: bytes32,
+        deltas_only: bool,
+        writer: TreeFileWriter,
     ) -> None:
         if node_hash == bytes32([0] * 32):
             return
@@ -1347,18 +1828,72 @@ class DataStore:
             if root.generation != generation:
                 return
         node = await self.get_node(node_hash)
-        to_write = b""
         if isinstance(node, InternalNode):
-            await self.write_tree_to_file(root, node.left_hash, tree_id, deltas_only, writer)
-            await self.write_tree_to_file(root, node.right_hash, tree_id, deltas_only, writer)
-            to_write = bytes(SerializedNode(False, bytes(node.left_hash), bytes(node.right_hash)))
+            await self._write_tree_nodes(root, node.left_hash, tree_id, deltas_only, writer)
+            await self._write_tree_nodes(root, node.right_hash, tree_id, deltas_only, writer)
+            writer.write_internal(node.left_hash, node.right_hash)
         elif isinstance(node, TerminalNode):
-            to_write = bytes(SerializedNode(True, node.key, node.value))
+            writer.write_terminal(node.key, node.value)
         else:
             raise Exception(f"Node is neither InternalNode nor TerminalNode: {node}")
 
-        writer.write(len(to_write).to_bytes(4, byteorder="big"))
-        writer.write(to_write)
+    async def insert_nodes(
+        self, nodes: Iterable[Tuple[NodeType, bytes, bytes]], batch_size: int = 10000
+    ) -> Optional[bytes32]:
+        """
+        Inserts nodes given as (node type, left hash or key, right hash or value)
+        with children before their parents, as read from a tree file.  The hashes
+        are computed while reading and internal nodes must refer to nodes given
+        before them or already in the store.  Nodes already in the store are
+        skipped.  Returns the hash of the last node.
+        """
+        # the nodes of this import, which later nodes may refer to
+        seen: Set[bytes32] = set()
+        last_hash: Optional[bytes32] = None
+        async with self.db_wrapper.writer() as writer:
+            node_iterator = iter(nodes)
+            while True:
+                batch = list(itertools.islice(node_iterator, batch_size))
+                if len(batch) == 0:
+                    break
+                rows: Dict[bytes32, Tuple[Any, ...]] = {}
+                referenced: Set[bytes32] = set()
+                for node_type, value1, value2 in batch:
+                    if node_type == NodeType.INTERNAL:
+                        left_hash = bytes32(value1)
+                        right_hash = bytes32(value2)
+                        node_hash = internal_hash(left_hash, right_hash)
+                        for child_hash in (left_hash, right_hash):
+                            if child_hash not in seen:
+                                referenced.add(child_hash)
+                        rows[node_hash] = (node_hash, node_type, left_hash, right_hash, None, None)
+                    else:
+                        node_hash = leaf_hash(key=value1, value=value2)
+                        rows[node_hash] = (node_hash, node_type, None, None, value1, value2)
+                    seen.add(node_hash)
+                    last_hash = node_hash
+
+                known: Set[bytes32] = set()
+                to_check = list(rows.keys() | referenced)
+                for check_batch in to_batches(to_check, SQLITE_MAX_VARIABLE_NUMBER):
+                    cursor = await writer.execute(
+                        f"SELECT hash FROM node WHERE hash IN ({','.join('?' * len(check_batch.entries))})",
+                        check_batch.entries,
+                    )
+                    known.update([bytes32(row["hash"]) async for row in cursor])
+                missing = referenced - known - rows.keys()
+                if len(missing) > 0:
+                    raise Exception(f"Tree file refers to unknown nodes: {', '.join(h.hex() for h in missing)}")
+
+                await writer.executemany(
+                    """
+                    INSERT INTO node(hash, node_type, left, right, key, value)
+                    VALUES(?, ?, ?, ?, ?, ?)
+                    """,
+                    [row for node_hash, row in rows.items() if node_hash not in known],
+                )
+
+        return last_hash
 
     async def update_subscriptions_from_wallet(self, tree_id: bytes32, new_urls: List[str]) -> None:
         async with self.db_wrapper.writer() as writer:
@@ -1460,6 +1995,31 @@ class DataStore:
                 "DELETE FROM root WHERE tree_id == :tree_id AND generation > :target_generation",
                 {"tree_id": tree_id, "target_generation": target_generation},
             )
+            await writer.execute(
+                "DELETE FROM key_index WHERE tree_id == :tree_id AND generation_added > :target_generation",
+                {"tree_id": tree_id, "target_generation": target_generation},
+            )
+            await writer.execute(
+                """
+                UPDATE key_index SET generation_removed = NULL
+                WHERE tree_id == :tree_id AND generation_removed > :target_generation
+                """,
+                {"tree_id": tree_id, "target_generation": target_generation},
+            )
+            await writer.execute(
+                """
+                UPDATE key_index_generations SET last_generation = :target_generation
+                WHERE tree_id == :tree_id AND last_generation > :target_generation
+                """,
+                {"tree_id": tree_id, "target_generation": target_generation},
+            )
+            await writer.execute(
+                """
+                DELETE FROM key_index_generations
+                WHERE tree_id == :tree_id AND first_generation > :target_generation
+                """,
+                {"tree_id": tree_id, "target_generation": target_generation},
+            )
 
     async def update_server_info(self, tree_id: bytes32, server_info: ServerInfo) -> None:
         async with self.db_wrapper.writer() as writer:
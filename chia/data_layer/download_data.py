@@ -10,8 +10,9 @@ from typing import List, Optional
 import aiohttp
 from typing_extensions import Literal
 
-from chia.data_layer.data_layer_util import NodeType, PluginRemote, Root, SerializedNode, ServerInfo, Status
+from chia.data_layer.data_layer_util import PluginRemote, Root, ServerInfo, Status
 from chia.data_layer.data_store import DataStore
+from chia.data_layer.tree_file import TreeFileFormat, read_tree_file
 from chia.types.blockchain_format.sized_bytes import bytes32
 
 
@@ -56,34 +57,16 @@ async def insert_into_data_store_from_file(
     root_hash: Optional[bytes32],
     filename: Path,
 ) -> None:
-    with open(filename, "rb") as reader:
-        while True:
-            chunk = b""
-            while len(chunk) < 4:
-                size_to_read = 4 - len(chunk)
-                cur_chunk = reader.read(size_to_read)
-                if cur_chunk is None or cur_chunk == b"":
-                    if size_to_read < 4:
-                        raise Exception("Incomplete read of length.")
-                    break
-                chunk += cur_chunk
-            if chunk == b"":
-                break
-
-            size = int.from_bytes(chunk, byteorder="big")
-            serialize_nodes_bytes = b""
-            while len(serialize_nodes_bytes) < size:
-                size_to_read = size - len(serialize_nodes_bytes)
-                cur_chunk = reader.read(size_to_read)
-                if cur_chunk is None or cur_chunk == b"":
-                    raise Exception("Incomplete read of blob.")
-                serialize_nodes_bytes += cur_chunk
-            serialized_node = SerializedNode.from_bytes(serialize_nodes_bytes)
-
-            node_type = NodeType.TERMINAL if serialized_node.is_terminal else NodeType.INTERNAL
-            await data_store.insert_node(node_type, serialized_node.value1, serialized_node.value2)
+    # the nodes and the root go in together, a bad file leaves nothing behind
+    async with data_store.transaction():
+        with open(filename, "rb") as reader:
+            last_hash = await data_store.insert_nodes(read_tree_file(reader))
+        # the root is the last node of a file, unless the file is empty since the
+        # root was seen before
+        if last_hash is not None and last_hash != root_hash:
+            raise Exception(f"Tree file doesn't match the root hash: {root_hash}")
 
-    await data_store.insert_root_with_ancestor_table(tree_id=tree_id, node_hash=root_hash, status=Status.COMMITTED)
+        await data_store.insert_root_with_ancestor_table(tree_id=tree_id, node_hash=root_hash, status=Status.COMMITTED)
 
 
 @dataclass
@@ -100,6 +83,7 @@ async def write_files_for_root(
     foldername: Path,
     full_tree_first_publish_generation: int,
     overwrite: bool = False,
+    file_format: TreeFileFormat = TreeFileFormat.legacy,
 ) -> WriteFilesResult:
     if root.node_hash is not None:
         node_hash = root.node_hash
@@ -116,7 +100,7 @@ async def write_files_for_root(
     if root.generation >= full_tree_first_publish_generation:
         try:
             with open(filename_full_tree, mode) as writer:
-                await data_store.write_tree_to_file(root, node_hash, tree_id, False, writer)
+                await data_store.write_tree_to_file(root, node_hash, tree_id, False, writer, file_format)
             written = True
             written_full_file = True
         except FileExistsError:
@@ -128,7 +112,7 @@ async def write_files_for_root(
         )
         if last_seen_generation is None:
             with open(filename_diff_tree, mode) as writer:
-                await data_store.write_tree_to_file(root, node_hash, tree_id, True, writer)
+                await data_store.write_tree_to_file(root, node_hash, tree_id, True, writer, file_format)
         else:
             open(filename_diff_tree, mode).close()
         written = True
@@ -149,6 +133,7 @@ async def insert_from_delta_file(
     log: logging.Logger,
     proxy_url: str,
     downloader: Optional[PluginRemote],
+    file_format: TreeFileFormat = TreeFileFormat.legacy,
 ) -> bool:
     for root_hash in root_hashes:
         timestamp = int(time.time())
@@ -190,7 +175,7 @@ async def insert_from_delta_file(
             )
             root = await data_store.get_tree_root(tree_id=tree_id)
             with open(filename_full_tree, "wb") as writer:
-                await data_store.write_tree_to_file(root, root_hash, tree_id, False, writer)
+                await data_store.write_tree_to_file(root, root_hash, tree_id, False, writer, file_format)
             log.info(f"Successfully written full tree filename {filename_full_tree}.")
             await data_store.received_correct_file(tree_id, server_info)
         except Exception:
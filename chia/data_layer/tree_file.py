@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import zlib
+from enum import Enum, IntEnum
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from chia.data_layer.data_layer_util import NodeType, SerializedNode
+
+# Tree files (full and delta) are a sequence of nodes, children before their
+# parents.  The legacy format is a 4 byte length followed by a streamable
+# SerializedNode for every node.  The compact format starts with a header:
+#
+#   COMPACT_MAGIC, 1 byte version, 1 byte compression
+#
+# followed by the (possibly compressed) nodes:
+#
+#   internal: 1 byte NodeType.INTERNAL, 32 bytes left hash, 32 bytes right hash
+#   terminal: 1 byte NodeType.TERMINAL, 4 byte key length, key, 4 byte value length, value
+#
+# A legacy file never starts with 0xff, that would be the length of a node of
+# more than 4 GB, so the header tells the two formats apart.
+COMPACT_MAGIC = b"\xffDLT"
+COMPACT_VERSION = 1
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class TreeFileFormat(Enum):
+    legacy = "legacy"
+    compact = "compact"
+    compact_zlib = "compact_zlib"
+
+
+class Compression(IntEnum):
+    none = 0
+    zlib = 1
+
+
+class TreeFileWriter:
+    file: BinaryIO
+    compact: bool
+    _compressor: Optional[zlib._Compress]
+
+    def __init__(self, file: BinaryIO, file_format: TreeFileFormat) -> None:
+        self.file = file
+        self.compact = file_format != TreeFileFormat.legacy
+        self._compressor = None
+        if self.compact:
+            compression = Compression.zlib if file_format == TreeFileFormat.compact_zlib else Compression.none
+            file.write(COMPACT_MAGIC + bytes([COMPACT_VERSION, compression]))
+            if compression == Compression.zlib:
+                self._compressor = zlib.compressobj()
+
+    def _write(self, data: bytes) -> None:
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self.file.write(data)
+
+    def write_internal(self, left_hash: bytes, right_hash: bytes) -> None:
+        if self.compact:
+            self._write(bytes([NodeType.INTERNAL]) + left_hash + right_hash)
+        else:
+            self._write_serialized(SerializedNode(False, left_hash, right_hash))
+
+    def write_terminal(self, key: bytes, value: bytes) -> None:
+        if self.compact:
+            self._write(
+                bytes([NodeType.TERMINAL])
+                + len(key).to_bytes(4, byteorder="big")
+                + key
+                + len(value).to_bytes(4, byteorder="big")
+                + value
+            )
+        else:
+            self._write_serialized(SerializedNode(True, key, value))
+
+    def _write_serialized(self, node: SerializedNode) -> None:
+        to_write = bytes(node)
+        self._write(len(to_write).to_bytes(4, byteorder="big") + to_write)
+
+    def finish(self) -> None:
+        if self._compressor is not None:
+            self.file.write(self._compressor.flush())
+            self._compressor = None
+
+
+class _ChunkReader:
+    """Reads exact sizes from a file in large chunks, decompressing if needed"""
+
+    def __init__(self, file: BinaryIO, buffer: bytes, decompressor: Optional[zlib._Decompress]) -> None:
+        self.file = file
+        self.buffer = buffer
+        self.position = 0
+        self.decompressor = decompressor
+        self.eof = False
+
+    def _fill(self) -> None:
+        chunk = self.file.read(READ_CHUNK_SIZE)
+        if chunk == b"":
+            self.eof = True
+            if self.decompressor is not None:
+                chunk = self.decompressor.flush()
+                if not self.decompressor.eof:
+                    raise Exception("Incomplete compressed tree file.")
+        elif self.decompressor is not None:
+            chunk = self.decompressor.decompress(chunk)
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+
+    def at_end(self) -> bool:
+        while self.position == len(self.buffer):
+            if self.eof:
+                return True
+            self._fill()
+        return False
+
+    def read(self, size: int) -> bytes:
+        while len(self.buffer) - self.position < size:
+            if self.eof:
+                raise Exception("Incomplete read of tree file.")
+            self._fill()
+        data = self.buffer[self.position : self.position + size]
+        self.position += size
+        return data
+
+    def read_length(self) -> int:
+        return int.from_bytes(self.read(4), byteorder="big")
+
+
+def read_tree_file(file: BinaryIO) -> Iterator[Tuple[NodeType, bytes, bytes]]:
+    """
+    Yields (node type, left hash or key, right hash or value) for the nodes of
+    a tree file in either format, reading the file in chunks.
+    """
+    header = file.read(len(COMPACT_MAGIC))
+    if header != COMPACT_MAGIC:
+        reader = _ChunkReader(file, header, None)
+        while not reader.at_end():
+            serialized_node = SerializedNode.from_bytes(reader.read(reader.read_length()))
+            node_type = NodeType.TERMINAL if serialized_node.is_terminal else NodeType.INTERNAL
+            yield node_type, serialized_node.value1, serialized_node.value2
+        return
+
+    version_and_compression = file.read(2)
+    if len(version_and_compression) != 2:
+        raise Exception("Incomplete tree file header.")
+    version, compression = version_and_compression
+    if version != COMPACT_VERSION:
+        raise Exception(f"Unsupported tree file version: {version}")
+    if compression == Compression.none:
+        reader = _ChunkReader(file, b"", None)
+    elif compression == Compression.zlib:
+        reader = _ChunkReader(file, b"", zlib.decompressobj())
+    else:
+        raise Exception(f"Unsupported tree file compression: {compression}")
+
+    while not reader.at_end():
+        raw_node_type = reader.read(1)[0]
+        if raw_node_type == NodeType.INTERNAL:
+            yield NodeType.INTERNAL, reader.read(32), reader.read(32)
+        elif raw_node_type == NodeType.TERMINAL:
+            key = reader.read(reader.read_length())
+            yield NodeType.TERMINAL, key, reader.read(reader.read_length())
+        else:
+            raise Exception(f"Unknown node type in tree file: {raw_node_type}")
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from chia.full_node.full_node_api import FullNodeAPI
+from chia.protocols.full_node_protocol import RequestBlocks, RespondBlocks
+from chia.server.ws_connection import WSChiaConnection
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.full_block import FullBlock
+from chia.util.ints import uint32
+
+BlockBatch = Tuple[WSChiaConnection, List[FullBlock]]
+
+
+@dataclass
+class PeerDownloadStats:
+    """
+    Tracks how quickly a single peer has been serving block batches. The rate is
+    an exponential moving average of blocks per second, so that a peer that
+    slows down mid-sync is demoted quickly.
+    """
+
+    blocks_per_second: Optional[float] = None
+    in_flight: int = 0
+    batches: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+
+    def record_success(self, num_blocks: int, duration: float, alpha: float = 0.3) -> None:
+        rate = num_blocks / max(duration, 0.001)
+        if self.blocks_per_second is None:
+            self.blocks_per_second = rate
+        else:
+            self.blocks_per_second = alpha * rate + (1 - alpha) * self.blocks_per_second
+        self.batches += 1
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        # halve the estimated rate so the peer is only picked again once the
+        # faster peers are saturated. A peer that has never delivered a batch
+        # loses its "unmeasured" priority
+        if self.blocks_per_second is None:
+            self.blocks_per_second = 0.0
+        else:
+            self.blocks_per_second /= 2
+
+    def score(self) -> float:
+        # peers we haven't measured yet are tried first, to learn their speed
+        if self.blocks_per_second is None:
+            return float("inf")
+        return self.blocks_per_second
+
+
+@dataclass
+class _Request:
+    start: int
+    end: int
+    peer: WSChiaConnection
+    started: float
+
+
+@dataclass
+class BlockBatchDownloader:
+    """
+    Downloads the inclusive height range [start_height, end_height] in batches
+    of batch_size blocks, keeping up to max_in_flight requests outstanding
+    across all peers that have the peak. Peers are ranked by their measured
+    throughput, requests that take much longer than usual are re-issued to a
+    faster idle peer, and batches are handed to the output queue strictly in
+    height order.
+    """
+
+    start_height: int
+    end_height: int
+    batch_size: int
+    get_peers: Callable[[], List[WSChiaConnection]]
+    log: logging.Logger
+    max_in_flight: int = 8
+    max_per_peer: int = 2
+    # a request is considered a straggler once it's been outstanding for this
+    # many times the median batch duration
+    straggler_factor: float = 3.0
+    min_straggler_time: float = 2.0
+    request_timeout: int = 30
+    # peers that failed this many requests in a row are not asked again
+    max_consecutive_failures: int = 3
+    peer_stats: Dict[bytes32, PeerDownloadStats] = field(default_factory=dict)
+
+    # min-heap of batch start heights not currently requested from anyone
+    _pending: List[int] = field(init=False)
+    _requests: Dict[asyncio.Task[Optional[List[FullBlock]]], _Request] = field(init=False, default_factory=dict)
+    _failed_peers: Dict[int, Set[bytes32]] = field(init=False, default_factory=dict)
+    _done: Dict[int, BlockBatch] = field(init=False, default_factory=dict)
+    _durations: Deque[float] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self._pending = list(range(self.start_height, self.end_height + 1, self.batch_size))
+        self._durations = Deque(maxlen=50)
+
+    def _batch_end(self, start: int) -> int:
+        return min(self.end_height, start + self.batch_size - 1)
+
+    def _stats(self, peer: WSChiaConnection) -> PeerDownloadStats:
+        stats = self.peer_stats.get(peer.peer_node_id)
+        if stats is None:
+            stats = PeerDownloadStats()
+            self.peer_stats[peer.peer_node_id] = stats
+        return stats
+
+    def _in_flight_for(self, start: int) -> List[_Request]:
+        return [r for r in self._requests.values() if r.start == start]
+
+    def _pick_peer(self, peers: List[WSChiaConnection], exclude: Set[bytes32]) -> Optional[WSChiaConnection]:
+        best: Optional[WSChiaConnection] = None
+        best_score = -1.0
+        for peer in peers:
+            if peer.closed or peer.peer_node_id in exclude:
+                continue
+            stats = self._stats(peer)
+            if stats.in_flight >= self.max_per_peer or stats.consecutive_failures >= self.max_consecutive_failures:
+                continue
+            # prefer fast peers, but spread load over peers with similar speed
+            score = stats.score() / (stats.in_flight + 1)
+            if score > best_score:
+                best, best_score = peer, score
+        return best
+
+    def _issue(self, start: int, peer: WSChiaConnection) -> None:
+        end = self._batch_end(start)
+        request = RequestBlocks(uint32(start), uint32(end), True)
+        task = asyncio.create_task(self.fetch_batch(peer, request))
+        self._requests[task] = _Request(start, end, peer, time.monotonic())
+        self._stats(peer).in_flight += 1
+
+    async def fetch_batch(self, peer: WSChiaConnection, request: RequestBlocks) -> Optional[List[FullBlock]]:
+        response = await peer.call_api(FullNodeAPI.request_blocks, request, timeout=self.request_timeout)
+        if response is None:
+            await peer.close()
+            return None
+        if not isinstance(response, RespondBlocks):
+            return None
+        blocks: List[FullBlock] = response.blocks
+        if len(blocks) == 0 or blocks[0].height != request.start_height or blocks[-1].height != request.end_height:
+            self.log.warning(
+                f"peer {peer.get_peer_logging()} responded with wrong range for "
+                f"{request.start_height} to {request.end_height}"
+            )
+            return None
+        return blocks
+
+    def _straggler_time(self) -> float:
+        if len(self._durations) == 0:
+            return self.request_timeout / 2
+        return max(self.min_straggler_time, self.straggler_factor * statistics.median(self._durations))
+
+    def _schedule(self, next_start: int) -> bool:
+        """
+        Issue as many requests as the in-flight limits allow. Returns False if
+        there's work left but no peer is able to take it.
+        """
+        peers = self.get_peers()
+        # don't get too far ahead of the batch we're waiting for, the
+        # reordering buffer would otherwise grow without bound
+        window_end = next_start + 2 * self.max_in_flight * self.batch_size
+        while len(self._pending) > 0 and len(self._requests) < self.max_in_flight:
+            start = self._pending[0]
+            if start >= window_end:
+                break
+            peer = self._pick_peer(peers, self._failed_peers.get(start, set()))
+            if peer is None:
+                break
+            heapq.heappop(self._pending)
+            self._issue(start, peer)
+
+        # re-issue the oldest outstanding batch if it's holding everything else up
+        now = time.monotonic()
+        head = self._in_flight_for(next_start)
+        if len(head) == 1 and now - head[0].started > self._straggler_time():
+            exclude = set(self._failed_peers.get(next_start, set()))
+            exclude.add(head[0].peer.peer_node_id)
+            peer = self._pick_peer(peers, exclude)
+            # the rate the slow peer can still achieve for this batch, at best
+            slow = min(self._stats(head[0].peer).score(), (head[0].end - head[0].start + 1) / (now - head[0].started))
+            if peer is not None and self._stats(peer).score() > slow:
+                self.log.info(
+                    f"re-requesting blocks {next_start} to {self._batch_end(next_start)} "
+                    f"from {peer.get_peer_logging()}, {head[0].peer.get_peer_logging()} is slow"
+                )
+                self._issue(next_start, peer)
+
+        return len(self._requests) > 0 or len(self._pending) == 0
+
+    def _complete(self, task: asyncio.Task[Optional[List[FullBlock]]]) -> None:
+        req = self._requests.pop(task)
+        stats = self._stats(req.peer)
+        stats.in_flight -= 1
+        if task.cancelled():
+            # a duplicate request that lost the race
+            return
+        blocks: Optional[List[FullBlock]] = None
+        exc = task.exception()
+        if exc is not None:
+            self.log.warning(f"failed fetching {req.start} to {req.end} from {req.peer.get_peer_logging()}: {exc}")
+        else:
+            blocks = task.result()
+
+        if blocks is None:
+            stats.record_failure()
+            self._failed_peers.setdefault(req.start, set()).add(req.peer.peer_node_id)
+            if req.start not in self._done and len(self._in_flight_for(req.start)) == 0:
+                heapq.heappush(self._pending, req.start)
+            return
+
+        duration = time.monotonic() - req.started
+        stats.record_success(len(blocks), duration)
+        self._durations.append(duration)
+        if req.start in self._done:
+            return
+        self._done[req.start] = (req.peer, blocks)
+        self._failed_peers.pop(req.start, None)
+        # the batch is in, cancel any duplicate requests for it
+        for other_task, other in self._requests.items():
+            if other.start == req.start:
+                other_task.cancel()
+
+    async def run(self, batch_queue: asyncio.Queue[Optional[BlockBatch]]) -> None:
+        next_start = self.start_height
+        try:
+            while next_start <= self.end_height:
+                if not self._schedule(next_start):
+                    self.log.error(f"failed fetching {next_start} to {self._batch_end(next_start)} from peers")
+                    return
+                if len(self._requests) > 0:
+                    done, _ = await asyncio.wait(
+                        set(self._requests.keys()),
+                        timeout=self.min_straggler_time,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    for task in done:
+                        self._complete(task)
+
+                while next_start in self._done:
+                    await batch_queue.put(self._done.pop(next_start))
+                    next_start += self.batch_size
+        finally:
+            for task in self._requests.keys():
+                task.cancel()
+            await asyncio.gather(*self._requests.keys(), return_exceptions=True)
+            self._requests.clear()
+            for node_id, stats in self.peer_stats.items():
+                self.log.debug(
+                    f"sync peer {node_id}: {stats.batches} batches, {stats.failures} failures, "
+                    f"{stats.blocks_per_second} blocks/s"
+                )
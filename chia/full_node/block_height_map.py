@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import logging
+import mmap
+import os
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -23,6 +25,11 @@ class SesCache(Streamable):
     content: List[Tuple[uint32, bytes]]
 
 
+# when the height-to-hash file needs to grow while the node is running, it's
+# extended by this many heights at a time
+HEIGHT_TO_HASH_GROWTH = 10000
+
+
 class BlockHeightMap:
     db: DBWrapper2
 
@@ -30,10 +37,14 @@ class BlockHeightMap:
     # and back in time on startup.
 
     # Defines the path from genesis to the peak, no orphan blocks
-    # this buffer contains all block hashes that are part of the current peak
-    # ordered by height. i.e. __height_to_hash[0..32] is the genesis hash
-    # __height_to_hash[32..64] is the hash for height 1 and so on
-    __height_to_hash: bytearray
+    # this is a memory map of the height-to-hash file, which contains all block
+    # hashes that are part of the current peak ordered by height. i.e.
+    # __height_to_hash[0..32] is the genesis hash __height_to_hash[32..64] is
+    # the hash for height 1 and so on. It's updated in place, so it doesn't
+    # need to be read on startup. The file may be larger than the chain, only
+    # the first __num_heights entries are valid
+    __height_to_hash: Optional[mmap.mmap]
+    __num_heights: int
 
     # All sub-epoch summaries that have been included in the blockchain from the beginning until and including the peak
     # (height_included, SubEpochSummary). Note: ONLY for the blocks in the path to the peak
@@ -44,11 +55,6 @@ class BlockHeightMap:
     # disk
     __counter: int
 
-    # this is the lowest height whose hash has been updated since the last flush
-    # to disk. When it's time to write to disk, we can start flushing from this
-    # offset
-    __first_dirty: int
-
     # the file we're saving the height-to-hash cache to
     __height_to_hash_filename: Path
 
@@ -63,8 +69,8 @@ class BlockHeightMap:
         self.db = db
 
         self.__counter = 0
-        self.__first_dirty = 0
-        self.__height_to_hash = bytearray()
+        self.__height_to_hash = None
+        self.__num_heights = 0
         self.__sub_epoch_summaries = {}
         self.__height_to_hash_filename = blockchain_dir / "height-to-hash"
         self.__ses_filename = blockchain_dir / "sub-epoch-summaries"
@@ -84,8 +90,10 @@ class BlockHeightMap:
                     return self
 
         try:
-            async with aiofiles.open(self.__height_to_hash_filename, "rb") as f:
-                self.__height_to_hash = bytearray(await f.read())
+            with open(self.__height_to_hash_filename, "r+b") as f:
+                # an empty file can't be memory mapped, it's replaced below
+                if os.fstat(f.fileno()).st_size >= 32:
+                    self.__height_to_hash = mmap.mmap(f.fileno(), 0)
         except Exception:
             # it's OK if this file doesn't exist, we can rebuild it
             pass
@@ -101,16 +109,10 @@ class BlockHeightMap:
         prev_hash: bytes32 = row[1]
         height = row[2]
 
-        # allocate memory for height to hash map
-        # this may also truncate it, if thie file on disk had an invalid size
-        new_size = (height + 1) * 32
-        size = len(self.__height_to_hash)
-        if size > new_size:
-            del self.__height_to_hash[new_size:]
-        else:
-            self.__height_to_hash += bytearray([0] * (new_size - size))
-
-        self.__first_dirty = height + 1
+        # make room for the height to hash map. If the file on disk is larger,
+        # the heights past the peak are ignored
+        self.__reserve(height + 1, exact=True)
+        self.__num_heights = height + 1
 
         if self.get_hash(height) != peak:
             self.__set_hash(height, peak)
@@ -130,7 +132,10 @@ class BlockHeightMap:
     def update_height(self, height: uint32, header_hash: bytes32, ses: Optional[SubEpochSummary]) -> None:
         # we're only updating the last hash. If we've reorged, we already rolled
         # back, making this the new peak
-        assert height * 32 <= len(self.__height_to_hash)
+        assert height <= self.__num_heights
+        if height == self.__num_heights:
+            self.__reserve(height + 1)
+            self.__num_heights = height + 1
         self.__set_hash(height, header_hash)
         if ses is not None:
             self.__sub_epoch_summaries[height] = bytes(ses)
@@ -139,25 +144,13 @@ class BlockHeightMap:
         if self.__counter < 1000:
             return
 
-        assert (len(self.__height_to_hash) % 32) == 0
-        offset = self.__first_dirty * 32
-
         ses_buf = bytes(SesCache([(k, v) for (k, v) in self.__sub_epoch_summaries.items()]))
 
         self.__counter = 0
 
-        try:
-            async with aiofiles.open(self.__height_to_hash_filename, "r+b") as f:
-                map_buf = self.__height_to_hash[offset:].copy()
-                await f.seek(offset)
-                await f.write(map_buf)
-        except Exception:
-            # if the file doesn't exist, write the whole buffer
-            async with aiofiles.open(self.__height_to_hash_filename, "wb") as f:
-                map_buf = self.__height_to_hash.copy()
-                await f.write(map_buf)
-
-        self.__first_dirty = len(self.__height_to_hash) // 32
+        # the hashes are already in the file, make sure they're written to disk
+        if self.__height_to_hash is not None:
+            self.__height_to_hash.flush()
         await write_file_async(self.__ses_filename, ses_buf)
 
     # load height-to-hash map entries from the DB starting at height back in
@@ -216,19 +209,35 @@ class BlockHeightMap:
                 self.__set_hash(height, prev_hash)
                 prev_hash = entry[1]
 
+    def __reserve(self, num_heights: int, *, exact: bool = False) -> None:
+        """
+        Makes sure the height-to-hash file can hold num_heights hashes. Unless
+        exact is set, it's grown by HEIGHT_TO_HASH_GROWTH heights at a time
+        """
+        if self.__height_to_hash is not None and len(self.__height_to_hash) >= num_heights * 32:
+            return
+        size = num_heights * 32 if exact else (num_heights + HEIGHT_TO_HASH_GROWTH) * 32
+        if self.__height_to_hash is not None:
+            self.__height_to_hash.resize(size)
+            return
+        with open(self.__height_to_hash_filename, "w+b") as f:
+            f.truncate(size)
+            self.__height_to_hash = mmap.mmap(f.fileno(), 0)
+
     def __set_hash(self, height: int, block_hash: bytes32) -> None:
+        assert self.__height_to_hash is not None
         idx = height * 32
         self.__height_to_hash[idx : idx + 32] = block_hash
         self.__counter += 1
-        self.__first_dirty = min(self.__first_dirty, height)
 
     def get_hash(self, height: uint32) -> bytes32:
+        assert height < self.__num_heights
+        assert self.__height_to_hash is not None
         idx = height * 32
-        assert idx + 32 <= len(self.__height_to_hash)
         return bytes32(self.__height_to_hash[idx : idx + 32])
 
     def contains_height(self, height: uint32) -> bool:
-        return height * 32 < len(self.__height_to_hash)
+        return height < self.__num_heights
 
     def rollback(self, fork_height: int) -> None:
         # fork height may be -1, in which case all blocks are different and we
@@ -239,8 +248,7 @@ class BlockHeightMap:
                 heights_to_delete.append(ses_included_height)
         for height in heights_to_delete:
             del self.__sub_epoch_summaries[height]
-        del self.__height_to_hash[(fork_height + 1) * 32 :]
-        self.__first_dirty = min(self.__first_dirty, fork_height + 1)
+        self.__num_heights = min(self.__num_heights, fork_height + 1)
 
     def get_ses(self, height: uint32) -> SubEpochSummary:
         return SubEpochSummary.from_bytes(self.__sub_epoch_summaries[height])
@@ -26,10 +26,26 @@ log = logging.getLogger(__name__)
 class CoinStore:
     """
     This object handles CoinRecords in DB.
+
+    During long sync, the coin changes of new blocks can be buffered in memory
+    (see enable_write_behind()) and written out in large transactions by
+    flush(). A coin that's created and spent while buffered is written once,
+    already spent. get_coin_record() and get_coin_records() are served from the
+    buffer, all other queries flush it first.
+    The first buffered height is recorded in the DB along with the block, so
+    the blocks can be replayed if the node stops before the buffer is flushed.
     """
 
     db_wrapper: DBWrapper2
     coins_added_at_height_cache: LRUCache[uint32, List[CoinRecord]]
+    # the maximum number of blocks to buffer, 0 means writes go straight to the DB
+    write_behind_blocks: int = 0
+    # the heights of the buffered blocks, in order
+    _pending_heights: List[uint32] = dataclasses.field(default_factory=list)
+    # coins created in buffered blocks
+    _pending_coins: Dict[bytes32, CoinRecord] = dataclasses.field(default_factory=dict)
+    # coins in the DB that were spent in buffered blocks, and their spent height
+    _pending_spends: Dict[bytes32, uint32] = dataclasses.field(default_factory=dict)
 
     @classmethod
     async def create(cls, db_wrapper: DBWrapper2) -> CoinStore:
@@ -66,9 +82,97 @@ class CoinStore:
             log.info("DB: Creating index coin_parent_index")
             await conn.execute("CREATE INDEX IF NOT EXISTS coin_parent_index on coin_record(coin_parent)")
 
+            # the first height whose coin changes have not been written to
+            # coin_record yet
+            await conn.execute("CREATE TABLE IF NOT EXISTS coin_write_behind(key int PRIMARY KEY, height bigint)")
+
         return self
 
+    def enable_write_behind(self, max_blocks: int) -> None:
+        self.write_behind_blocks = max_blocks
+
+    async def disable_write_behind(self) -> None:
+        self.write_behind_blocks = 0
+        await self.flush()
+
+    async def get_unflushed_height(self) -> Optional[uint32]:
+        """
+        Returns the first height whose coin changes have not been written to the
+        DB, if the node stopped before flushing them
+        """
+        async with self.db_wrapper.reader_no_transaction() as conn:
+            async with conn.execute("SELECT height FROM coin_write_behind WHERE key = 0") as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return uint32(row[0])
+
+    async def maybe_flush(self) -> None:
+        if len(self._pending_heights) >= self.write_behind_blocks:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Writes the buffered coin changes to the DB. This is expected to be
+        called outside of a transaction, if the enclosing transaction was rolled
+        back the buffered changes would be lost
+        """
+        if len(self._pending_heights) == 0:
+            return
+        start = time.monotonic()
+        async with self.db_wrapper.writer_maybe_transaction() as conn:
+            await self._add_coin_records(list(self._pending_coins.values()))
+            if len(self._pending_spends) > 0:
+                ret: Cursor = await conn.executemany(
+                    "UPDATE coin_record INDEXED BY sqlite_autoindex_coin_record_1 "
+                    "SET spent_index=? WHERE spent_index=0 AND coin_name=?",
+                    [(height, name) for name, height in self._pending_spends.items()],
+                )
+                if ret.rowcount != len(self._pending_spends):
+                    raise ValueError(
+                        f"Invalid operation to set spent, total updates {ret.rowcount} "
+                        f"expected {len(self._pending_spends)}"
+                    )
+            await conn.execute("DELETE FROM coin_write_behind WHERE key = 0")
+        log.info(
+            f"Flushed coin changes of {len(self._pending_heights)} blocks ({self._pending_heights[0]} to "
+            f"{self._pending_heights[-1]}) to the coin store in {time.monotonic() - start:0.2f}s, "
+            f"{len(self._pending_coins)} new coins, {len(self._pending_spends)} spent coins"
+        )
+        self._pending_heights = []
+        self._pending_coins = {}
+        self._pending_spends = {}
+
+    def rollback_pending(self, block_index: int) -> Tuple[List[CoinRecord], List[bytes32]]:
+        """
+        Drops the buffered coin changes of blocks above block_index. This must
+        be called when a transaction that added blocks is rolled back.
+        Returns the changed buffered coin records and the names of the coins in
+        the DB that are no longer spent
+        """
+        changed: List[CoinRecord] = []
+        unspent: List[bytes32] = []
+        if len(self._pending_heights) == 0 or self._pending_heights[-1] <= block_index:
+            return changed, unspent
+        while len(self._pending_heights) > 0 and self._pending_heights[-1] > block_index:
+            self._pending_heights.pop()
+
+        for name, record in list(self._pending_coins.items()):
+            if record.confirmed_block_index > block_index:
+                del self._pending_coins[name]
+                changed.append(CoinRecord(record.coin, uint32(0), record.spent_block_index, record.coinbase, uint64(0)))
+            elif record.spent_block_index > block_index:
+                record = dataclasses.replace(record, spent_block_index=uint32(0))
+                self._pending_coins[name] = record
+                changed.append(record)
+        for name, height in list(self._pending_spends.items()):
+            if height > block_index:
+                del self._pending_spends[name]
+                unspent.append(name)
+        return changed, unspent
+
     async def num_unspent(self) -> int:
+        await self.flush()
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute("SELECT COUNT(*) FROM coin_record WHERE spent_index=0") as cursor:
                 row = await cursor.fetchone()
@@ -119,8 +223,11 @@ class CoinStore:
             )
             additions.append(reward_coin_r)
 
-        await self._add_coin_records(additions)
-        await self._set_spent(tx_removals, height)
+        if self.write_behind_blocks > 0:
+            await self._buffer_block(height, additions, tx_removals)
+        else:
+            await self._add_coin_records(additions)
+            await self._set_spent(tx_removals, height)
 
         end = time.monotonic()
         log.log(
@@ -132,8 +239,39 @@ class CoinStore:
 
         return additions
 
+    async def _buffer_block(self, height: uint32, additions: List[CoinRecord], removals: List[bytes32]) -> None:
+        assert len(self._pending_heights) == 0 or height > self._pending_heights[-1]
+        assert len(removals) == 0 or height > 0
+        # check everything before touching the buffer, to leave it unchanged if
+        # the block is rejected
+        for record in additions:
+            if record.name in self._pending_coins:
+                raise ValueError(f"Coin {record.name.hex()} was already added at height {height}")
+        for name in removals:
+            pending = self._pending_coins.get(name)
+            if (pending is not None and pending.spent) or name in self._pending_spends:
+                raise ValueError(f"Invalid operation to set spent, {name.hex()} is already spent")
+
+        if len(self._pending_heights) == 0:
+            async with self.db_wrapper.writer_maybe_transaction() as conn:
+                await conn.execute("INSERT OR REPLACE INTO coin_write_behind VALUES(0, ?)", (height,))
+
+        self._pending_heights.append(height)
+        for record in additions:
+            self._pending_coins[record.name] = record
+        for name in removals:
+            pending = self._pending_coins.get(name)
+            if pending is not None:
+                # this coin is written to the DB once, already spent
+                self._pending_coins[name] = dataclasses.replace(pending, spent_block_index=height)
+            else:
+                self._pending_spends[name] = height
+
     # Checks DB and DiffStores for CoinRecord with coin_name and returns it
     async def get_coin_record(self, coin_name: bytes32) -> Optional[CoinRecord]:
+        pending = self._pending_coins.get(coin_name)
+        if pending is not None:
+            return pending
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
@@ -143,7 +281,7 @@ class CoinStore:
                 row = await cursor.fetchone()
                 if row is not None:
                     coin = self.row_to_coin(row)
-                    return CoinRecord(coin, row[0], row[1], row[2], row[6])
+                    return CoinRecord(coin, row[0], self._pending_spends.get(coin_name, row[1]), row[2], row[6])
         return None
 
     async def get_coin_records(self, names: List[bytes32]) -> List[CoinRecord]:
@@ -151,6 +289,15 @@ class CoinStore:
             return []
 
         coins: List[CoinRecord] = []
+        if len(self._pending_coins) > 0:
+            db_names = []
+            for name in names:
+                pending = self._pending_coins.get(name)
+                if pending is not None:
+                    coins.append(pending)
+                else:
+                    db_names.append(name)
+            names = db_names
 
         async with self.db_wrapper.reader_no_transaction() as conn:
             cursors: List[Cursor] = []
@@ -169,11 +316,14 @@ class CoinStore:
                 for row in await cursor.fetchall():
                     coin = self.row_to_coin(row)
                     record = CoinRecord(coin, row[0], row[1], row[2], row[6])
+                    if len(self._pending_spends) > 0 and record.name in self._pending_spends:
+                        record = dataclasses.replace(record, spent_block_index=self._pending_spends[record.name])
                     coins.append(record)
 
         return coins
 
     async def get_coins_added_at_height(self, height: uint32) -> List[CoinRecord]:
+        await self.flush()
         coins_added: Optional[List[CoinRecord]] = self.coins_added_at_height_cache.get(height)
         if coins_added is not None:
             return coins_added
@@ -196,6 +346,7 @@ class CoinStore:
         # Special case to avoid querying all unspent coins (spent_index=0)
         if height == 0:
             return []
+        await self.flush()
         async with self.db_wrapper.reader_no_transaction() as conn:
             async with conn.execute(
                 "SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
@@ -211,6 +362,7 @@ class CoinStore:
                 return coins
 
     async def get_all_coins(self, include_spent_coins: bool) -> List[CoinRecord]:
+        await self.flush()
         # WARNING: this should only be used for testing or in a simulation,
         # running it on a synced testnet or mainnet node will most likely result in an OOM error.
         coins = set()
@@ -235,6 +387,7 @@ class CoinStore:
         start_height: uint32 = uint32(0),
         end_height: uint32 = uint32((2**32) - 1),
     ) -> List[CoinRecord]:
+        await self.flush()
         coins = set()
 
         async with self.db_wrapper.reader_no_transaction() as conn:
@@ -257,6 +410,7 @@ class CoinStore:
         start_height: uint32 = uint32(0),
         end_height: uint32 = uint32((2**32) - 1),
     ) -> List[CoinRecord]:
+        await self.flush()
         if len(puzzle_hashes) == 0:
             return []
 
@@ -285,6 +439,7 @@ class CoinStore:
         start_height: uint32 = uint32(0),
         end_height: uint32 = uint32((2**32) - 1),
     ) -> List[CoinRecord]:
+        await self.flush()
         if len(names) == 0:
             return []
 
@@ -323,6 +478,7 @@ class CoinStore:
         *,
         max_items: int = 50000,
     ) -> Set[CoinState]:
+        await self.flush()
         if len(puzzle_hashes) == 0:
             return set()
 
@@ -355,6 +511,7 @@ class CoinStore:
         start_height: uint32 = uint32(0),
         end_height: uint32 = uint32((2**32) - 1),
     ) -> List[CoinRecord]:
+        await self.flush()
         if len(parent_ids) == 0:
             return []
 
@@ -384,6 +541,7 @@ class CoinStore:
         max_height: uint32 = uint32.MAXIMUM,
         max_items: int = 50000,
     ) -> List[CoinState]:
+        await self.flush()
         if len(coin_ids) == 0:
             return []
 
@@ -427,7 +585,8 @@ class CoinStore:
             ) as cursor:
                 for row in await cursor.fetchall():
                     coin = self.row_to_coin(row)
-                    record = CoinRecord(coin, uint32(0), row[1], row[2], uint64(0))
+                    spent_index = self._pending_spends.get(coin.name(), row[1])
+                    record = CoinRecord(coin, uint32(0), spent_index, row[2], uint64(0))
                     coin_changes[record.name] = record
 
             # Delete reverted blocks from storage
@@ -446,6 +605,23 @@ class CoinStore:
                         coin_changes[record.name] = record
 
             await conn.execute("UPDATE coin_record SET spent_index=0 WHERE spent_index>?", (block_index,))
+
+            pending_changes, unspent = self.rollback_pending(block_index)
+            for record in pending_changes:
+                coin_changes[record.name] = record
+            for batch in to_batches(unspent, SQLITE_MAX_VARIABLE_NUMBER):
+                async with conn.execute(
+                    f"SELECT confirmed_index, spent_index, coinbase, puzzle_hash, "
+                    f"coin_parent, amount, timestamp FROM coin_record "
+                    f'WHERE coin_name in ({",".join(["?"] * len(batch.entries))})',
+                    batch.entries,
+                ) as cursor:
+                    for row in await cursor.fetchall():
+                        coin = self.row_to_coin(row)
+                        record = CoinRecord(coin, row[0], uint32(0), row[2], row[6])
+                        coin_changes[record.name] = record
+            if len(self._pending_heights) == 0:
+                await conn.execute("DELETE FROM coin_write_behind WHERE key = 0")
         self.coins_added_at_height_cache = LRUCache(self.coins_added_at_height_cache.capacity)
         return list(coin_changes.values())
 
@@ -30,6 +30,7 @@ from typing import (
 
 from chia_rs import AugSchemeMPL
 
+from chia.consensus.augmented_chain import AugmentedBlockchain
 from chia.consensus.block_body_validation import ForkInfo
 from chia.consensus.block_creation import unfinished_block_to_full_block
 from chia.consensus.block_record import BlockRecord
@@ -41,6 +42,7 @@ from chia.consensus.difficulty_adjustment import get_next_sub_slot_iters_and_dif
 from chia.consensus.make_sub_epoch_summary import next_sub_epoch_summary
 from chia.consensus.multiprocess_validation import PreValidationResult
 from chia.consensus.pot_iterations import calculate_sp_iters
+from chia.full_node.block_batch_downloader import BlockBatchDownloader
 from chia.full_node.block_store import BlockStore
 from chia.full_node.bundle_tools import detect_potential_template_generator
 from chia.full_node.coin_store import CoinStore
@@ -55,7 +57,7 @@ from chia.full_node.sync_store import Peak, SyncStore
 from chia.full_node.tx_processing_queue import TransactionQueue
 from chia.full_node.weight_proof import WeightProofHandler
 from chia.protocols import farmer_protocol, full_node_protocol, timelord_protocol, wallet_protocol
-from chia.protocols.full_node_protocol import RequestBlocks, RespondBlock, RespondBlocks, RespondSignagePoint
+from chia.protocols.full_node_protocol import RequestBlocks, RespondBlock, RespondSignagePoint
 from chia.protocols.protocol_message_types import ProtocolMessageTypes
 from chia.protocols.wallet_protocol import CoinState, CoinStateUpdate
 from chia.rpc.rpc_server import StateChangedProtocol
@@ -106,6 +108,16 @@ class PeakPostProcessingResult:
     lookup_coin_ids: List[bytes32]  # The coin IDs that we need to look up to notify wallets of changes
 
 
+# A batch of blocks downloaded during long sync, and the result of pre-validating it
+@dataclasses.dataclass(frozen=True)
+class PreValidatedBatch:
+    peer: WSChiaConnection
+    blocks: List[FullBlock]
+    blocks_to_validate: List[FullBlock]  # the blocks we didn't already have
+    pre_validation_results: Optional[List[PreValidationResult]]  # None if the batch wasn't pre-validated yet
+    pre_validation_time: float
+
+
 @dataclasses.dataclass(frozen=True)
 class WalletUpdate:
     fork_height: uint32
@@ -1066,83 +1078,161 @@ class FullNode:
         # block between the main chain and the fork. Here "fork_point_height"
         # seems to refer to the first diverging block
 
+        def get_peers() -> List[WSChiaConnection]:
+            nonlocal peers_with_peak
+            if self.sync_store.peers_changed.is_set():
+                peers_with_peak = self.get_peers_with_peak(peak_hash)
+                self.sync_store.peers_changed.clear()
+            return peers_with_peak
+
         async def fetch_block_batches(
             batch_queue: asyncio.Queue[Optional[Tuple[WSChiaConnection, List[FullBlock]]]]
         ) -> None:
-            start_height, end_height = 0, 0
-            new_peers_with_peak: List[WSChiaConnection] = peers_with_peak[:]
+            downloader = BlockBatchDownloader(
+                start_height=fork_point_height,
+                end_height=target_peak_sb_height,
+                batch_size=batch_size,
+                get_peers=get_peers,
+                log=self.log,
+                max_in_flight=self.config.get("sync_max_batches_in_flight", 8),
+                max_per_peer=self.config.get("sync_max_batches_per_peer", 2),
+            )
             try:
-                # block request ranges are *inclusive*, this requires some
-                # gymnastics of this range (+1 to make it exclusive, like normal
-                # ranges) and then -1 when forming the request message
-                for start_height in range(fork_point_height, target_peak_sb_height + 1, batch_size):
-                    end_height = min(target_peak_sb_height, start_height + batch_size - 1)
-                    request = RequestBlocks(uint32(start_height), uint32(end_height), True)
-                    fetched = False
-                    for peer in random.sample(new_peers_with_peak, len(new_peers_with_peak)):
-                        if peer.closed:
-                            continue
-                        response = await peer.call_api(FullNodeAPI.request_blocks, request, timeout=30)
-                        if response is None:
-                            await peer.close()
-                        elif isinstance(response, RespondBlocks):
-                            await batch_queue.put((peer, response.blocks))
-                            fetched = True
-                            break
-                    if fetched is False:
-                        self.log.error(f"failed fetching {start_height} to {end_height} from peers")
-                        return
-                    if self.sync_store.peers_changed.is_set():
-                        new_peers_with_peak = self.get_peers_with_peak(peak_hash)
-                        self.sync_store.peers_changed.clear()
+                await downloader.run(batch_queue)
             except Exception as e:
-                self.log.error(f"Exception fetching {start_height} to {end_height} from peer {e}")
+                self.log.error(f"Exception fetching blocks {fork_point_height} to {target_peak_sb_height}: {e}")
             finally:
                 # finished signal with None
                 await batch_queue.put(None)
 
-        async def validate_block_batches(
-            inner_batch_queue: asyncio.Queue[Optional[Tuple[WSChiaConnection, List[FullBlock]]]]
+        pipeline_depth: int = self.config.get("sync_pipeline_depth", 2)
+        write_behind_blocks: int = self.config.get("sync_coin_store_write_behind", 1000)
+        # blocks that have been pre-validated but not yet added to the chain.
+        # The next batch is pre-validated on top of these
+        pending_chain = AugmentedBlockchain(self.blockchain)
+        pending_applied = asyncio.Event()
+        fork_info: Optional[ForkInfo] = None
+
+        async def prevalidate_block_batches(
+            inner_batch_queue: asyncio.Queue[Optional[Tuple[WSChiaConnection, List[FullBlock]]]],
+            output_queue: asyncio.Queue[Optional[PreValidatedBatch]],
         ) -> None:
-            fork_info: Optional[ForkInfo] = None
+            nonlocal fork_info
+            first_batch = True
+            try:
+                while True:
+                    res: Optional[Tuple[WSChiaConnection, List[FullBlock]]] = await inner_batch_queue.get()
+                    if res is None:
+                        self.log.debug("done fetching blocks")
+                        return None
+                    peer, blocks = res
+
+                    # in case we're validating a reorg fork (i.e. not extending the
+                    # main chain), we need to record the coin set from that fork in
+                    # fork_info. Otherwise validation is very expensive, especially
+                    # for deep reorgs
+                    if first_batch:
+                        first_batch = False
+                        peak: Optional[BlockRecord] = self.blockchain.get_peak()
+                        extending_main_chain: bool = peak is None or (
+                            peak.header_hash == blocks[0].prev_header_hash or peak.header_hash == blocks[0].header_hash
+                        )
+                        # if we're simply extending the main chain, it's important
+                        # *not* to pass in a ForkInfo object, as it can potentially
+                        # accrue a large state (with no value, since we can validate
+                        # against the CoinStore)
+                        if not extending_main_chain:
+                            if fork_point_height == 0:
+                                fork_info = ForkInfo(-1, -1, bytes32([0] * 32))
+                            else:
+                                fork_hash = self.blockchain.height_to_hash(uint32(fork_point_height - 1))
+                                assert fork_hash is not None
+                                fork_info = ForkInfo(fork_point_height - 1, fork_point_height - 1, fork_hash)
+
+                    # blocks of a reorg are validated one batch at a time, as
+                    # they are added. The pipeline only applies when extending
+                    # the main chain
+                    if fork_info is not None or pipeline_depth == 0:
+                        await output_queue.put(PreValidatedBatch(peer, blocks, blocks, None, 0.0))
+                        continue
+
+                    blocks_to_validate = await self.skip_blocks_we_already_have(blocks, None)
+                    if len(blocks_to_validate) == 0:
+                        await output_queue.put(PreValidatedBatch(peer, blocks, [], [], 0.0))
+                        continue
+
+                    # generators referencing blocks that haven't been added yet
+                    # can't be loaded from the DB, wait for them to be added
+                    first_pending_height = blocks_to_validate[0].height - pending_chain.num_extra_blocks()
+                    while pending_chain.num_extra_blocks() > 0 and any(
+                        h >= first_pending_height for b in blocks_to_validate for h in b.transactions_generator_ref_list
+                    ):
+                        self.log.debug(
+                            f"waiting for blocks before {blocks_to_validate[0].height} to be added, "
+                            "they are referenced by a transactions generator"
+                        )
+                        pending_applied.clear()
+                        await pending_applied.wait()
+
+                    pre_validate_start = time.monotonic()
+                    # pre-validation computes the block records of the batch,
+                    # those are what the next batch is validated on top of
+                    new_block_records: Dict[bytes32, BlockRecord] = {}
+                    results, err = await self.prevalidate_blocks(
+                        blocks_to_validate,
+                        peer.get_peer_logging(),
+                        summaries,
+                        pending_chain if pending_chain.num_extra_blocks() > 0 else None,
+                        new_block_records,
+                    )
+                    pre_validate_time = time.monotonic() - pre_validate_start
+                    if err is None:
+                        for block in blocks_to_validate:
+                            pending_chain.add_extra_block(new_block_records[block.header_hash])
+                    await output_queue.put(
+                        PreValidatedBatch(peer, blocks, blocks_to_validate, results, pre_validate_time)
+                    )
+                    if err is not None:
+                        return None
+            finally:
+                await output_queue.put(None)
 
+        async def validate_block_batches(inner_batch_queue: asyncio.Queue[Optional[PreValidatedBatch]]) -> None:
             while True:
-                res: Optional[Tuple[WSChiaConnection, List[FullBlock]]] = await inner_batch_queue.get()
-                if res is None:
-                    self.log.debug("done fetching blocks")
+                batch: Optional[PreValidatedBatch] = await inner_batch_queue.get()
+                if batch is None:
                     return None
-                peer, blocks = res
-                start_height = blocks[0].height
-                end_height = blocks[-1].height
-
-                # in case we're validating a reorg fork (i.e. not extending the
-                # main chain), we need to record the coin set from that fork in
-                # fork_info. Otherwise validation is very expensive, especially
-                # for deep reorgs
-                peak: Optional[BlockRecord]
-                if fork_info is None:
-                    peak = self.blockchain.get_peak()
-                    extending_main_chain: bool = peak is None or (
-                        peak.header_hash == blocks[0].prev_header_hash or peak.header_hash == blocks[0].header_hash
+                peer = batch.peer
+                start_height = batch.blocks[0].height
+                end_height = batch.blocks[-1].height
+
+                add_start = time.monotonic()
+                err: Optional[Err] = None
+                if batch.pre_validation_results is None:
+                    success, state_change_summary, err = await self.add_block_batch(
+                        batch.blocks,
+                        peer.get_peer_logging(),
+                        fork_info,
+                        summaries,
                     )
-                    # if we're simply extending the main chain, it's important
-                    # *not* to pass in a ForkInfo object, as it can potentially
-                    # accrue a large state (with no value, since we can validate
-                    # against the CoinStore)
-                    if not extending_main_chain:
-                        if fork_point_height == 0:
-                            fork_info = ForkInfo(-1, -1, bytes32([0] * 32))
-                        else:
-                            fork_hash = self.blockchain.height_to_hash(uint32(fork_point_height - 1))
-                            assert fork_hash is not None
-                            fork_info = ForkInfo(fork_point_height - 1, fork_point_height - 1, fork_hash)
-
-                success, state_change_summary, err = await self.add_block_batch(
-                    blocks,
-                    peer.get_peer_logging(),
-                    fork_info,
-                    summaries,
-                )
+                elif len(batch.blocks_to_validate) == 0:
+                    success, state_change_summary = True, None
+                else:
+                    err = next((Err(r.error) for r in batch.pre_validation_results if r.error is not None), None)
+                    if err is not None:
+                        success, state_change_summary = False, None
+                    else:
+                        # the coin changes of blocks extending the main chain
+                        # are buffered and written out every
+                        # write_behind_blocks blocks
+                        self.coin_store.enable_write_behind(write_behind_blocks)
+                        success, state_change_summary, err = await self.add_prevalidated_blocks(
+                            batch.blocks_to_validate, batch.pre_validation_results, peer.get_peer_logging(), None
+                        )
+                        await self.coin_store.maybe_flush()
+                    for block in batch.blocks_to_validate:
+                        pending_chain.remove_extra_block(block.header_hash)
+                    pending_applied.set()
                 if success is False:
                     await peer.close(600)
                     # check CHIP-0013 exception
@@ -1150,7 +1240,11 @@ class FullNode:
                         self.add_to_bad_peak_cache(peak_hash, target_peak_sb_height)
                         raise ValidationError(err, f"Failed to validate block batch {start_height} to {end_height}")
                     raise ValueError(f"Failed to validate block batch {start_height} to {end_height}")
-                self.log.info(f"Added blocks {start_height} to {end_height}")
+                add_time = time.monotonic() - add_start
+                self.log.info(
+                    f"Added blocks {start_height} to {end_height} "
+                    f"(pre-validation: {batch.pre_validation_time:0.2f}s, add: {add_time:0.2f}s)"
+                )
                 peak = self.blockchain.get_peak()
                 if state_change_summary is not None:
                     assert peak is not None
@@ -1171,14 +1265,20 @@ class FullNode:
         batch_queue_input: asyncio.Queue[Optional[Tuple[WSChiaConnection, List[FullBlock]]]] = asyncio.Queue(
             maxsize=buffer_size
         )
+        prevalidated_queue: asyncio.Queue[Optional[PreValidatedBatch]] = asyncio.Queue(maxsize=max(1, pipeline_depth))
         fetch_task = asyncio.Task(fetch_block_batches(batch_queue_input))
-        validate_task = asyncio.Task(validate_block_batches(batch_queue_input))
+        prevalidate_task = asyncio.Task(prevalidate_block_batches(batch_queue_input, prevalidated_queue))
+        validate_task = asyncio.Task(validate_block_batches(prevalidated_queue))
         try:
             with log_exceptions(log=self.log, message="sync from fork point failed"):
-                await asyncio.gather(fetch_task, validate_task)
+                await asyncio.gather(fetch_task, prevalidate_task, validate_task)
         except Exception:
-            assert validate_task.done()
-            fetch_task.cancel()  # no need to cancel validate_task, if we end up here validate_task is already done
+            for task in (fetch_task, prevalidate_task, validate_task):
+                task.cancel()
+        finally:
+            # if this fails, the buffered coin changes are re-applied from the
+            # blocks the next time the node starts
+            await self.coin_store.disable_write_behind()
 
     def get_peers_with_peak(self, peak_hash: bytes32) -> List[WSChiaConnection]:
         peer_ids: Set[bytes32] = self.sync_store.get_peers_that_have_peak([peak_hash])
@@ -1244,16 +1344,30 @@ class FullNode:
         # Precondition: All blocks must be contiguous blocks, index i+1 must be the parent of index i
         # Returns a bool for success, as well as a StateChangeSummary if the peak was advanced
 
+        blocks_to_validate = await self.skip_blocks_we_already_have(all_blocks, fork_info)
+        if len(blocks_to_validate) == 0:
+            return True, None, None
+
+        pre_validation_results, err = await self.prevalidate_blocks(blocks_to_validate, peer_info, wp_summaries)
+        if err is not None:
+            return False, None, err
+        return await self.add_prevalidated_blocks(blocks_to_validate, pre_validation_results, peer_info, fork_info)
+
+    async def skip_blocks_we_already_have(
+        self, all_blocks: List[FullBlock], fork_info: Optional[ForkInfo]
+    ) -> List[FullBlock]:
+        """
+        Returns the blocks, starting with the first one we don't already have in
+        the DB. If there is a fork_info, it's updated with the blocks we skip.
+        """
         block_dict: Dict[bytes32, FullBlock] = {}
         for block in all_blocks:
             block_dict[block.header_hash] = block
 
-        blocks_to_validate: List[FullBlock] = []
         for i, block in enumerate(all_blocks):
             header_hash = block.header_hash
             if not await self.blockchain.contains_block_from_db(header_hash):
-                blocks_to_validate = all_blocks[i:]
-                break
+                return all_blocks[i:]
 
             if fork_info is None:
                 continue
@@ -1282,14 +1396,32 @@ class FullNode:
                 await self.blockchain.advance_fork_info(block, fork_info, block_dict)
                 await self.blockchain.run_single_block(block, fork_info, block_dict)
 
-        if len(blocks_to_validate) == 0:
-            return True, None, None
+        return []
 
+    async def prevalidate_blocks(
+        self,
+        blocks_to_validate: List[FullBlock],
+        peer_info: PeerInfo,
+        wp_summaries: Optional[List[SubEpochSummary]] = None,
+        block_records: Optional[BlockchainInterface] = None,
+        new_block_records: Optional[Dict[bytes32, BlockRecord]] = None,
+    ) -> Tuple[List[PreValidationResult], Optional[Err]]:
+        """
+        Runs the pre-validation of a batch of contiguous blocks in the process pool.
+        block_records may be an AugmentedBlockchain, to pre-validate blocks
+        building on ones that haven't been added to the chain yet. The block
+        records computed along the way are stored in new_block_records, if passed.
+        """
         # Validates signatures in multiprocessing since they take a while, and we don't have cached transactions
         # for these blocks (unlike during normal operation where we validate one at a time)
         pre_validate_start = time.monotonic()
         pre_validation_results: List[PreValidationResult] = await self.blockchain.pre_validate_blocks_multiprocessing(
-            blocks_to_validate, {}, wp_summaries=wp_summaries, validate_signatures=True
+            blocks_to_validate,
+            {},
+            wp_summaries=wp_summaries,
+            validate_signatures=True,
+            block_records=block_records,
+            new_block_records=new_block_records,
         )
         pre_validate_end = time.monotonic()
         pre_validate_time = pre_validate_end - pre_validate_start
@@ -1302,8 +1434,17 @@ class FullNode:
         for i, block in enumerate(blocks_to_validate):
             if pre_validation_results[i].error is not None:
                 self.log.error(f"Invalid block from peer: {peer_info} {Err(pre_validation_results[i].error)}")
-                return False, None, Err(pre_validation_results[i].error)
+                return pre_validation_results, Err(pre_validation_results[i].error)
+        return pre_validation_results, None
 
+    async def add_prevalidated_blocks(
+        self,
+        blocks_to_validate: List[FullBlock],
+        pre_validation_results: List[PreValidationResult],
+        peer_info: PeerInfo,
+        fork_info: Optional[ForkInfo],
+    ) -> Tuple[bool, Optional[StateChangeSummary], Optional[Err]]:
+        add_start = time.monotonic()
         agg_state_change_summary: Optional[StateChangeSummary] = None
 
         for i, block in enumerate(blocks_to_validate):
@@ -1340,7 +1481,7 @@ class FullNode:
         if agg_state_change_summary is not None:
             self._state_changed("new_peak")
             self.log.debug(
-                f"Total time for {len(blocks_to_validate)} blocks: {time.time() - pre_validate_start}, "
+                f"Total time for adding {len(blocks_to_validate)} blocks: {time.monotonic() - add_start:0.2f}, "
                 f"advanced: True"
             )
         return True, agg_state_change_summary, None
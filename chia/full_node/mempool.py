@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+import heapq
 import logging
-import sqlite3
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 from chia_rs import AugSchemeMPL, Coin, G2Element
+from sortedcontainers import SortedDict
 
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
 from chia.full_node.fee_estimation import FeeMempoolInfo, MempoolInfo, MempoolItemInfo
@@ -18,16 +20,14 @@ from chia.types.eligible_coin_spends import EligibleCoinSpends
 from chia.types.internal_mempool_item import InternalMempoolItem
 from chia.types.mempool_item import MempoolItem
 from chia.types.spend_bundle import SpendBundle
-from chia.util.db_wrapper import SQLITE_MAX_VARIABLE_NUMBER
 from chia.util.errors import Err
 from chia.util.ints import uint32, uint64
-from chia.util.misc import to_batches
 
 log = logging.getLogger(__name__)
 
 # We impose a limit on the fee a single transaction can pay in order to have the
-# sum of all fees in the mempool be less than 2^63. That's the limit of sqlite's
-# integers, which we rely on for computing fee per cost as well as the fee sum
+# sum of all fees in the mempool be less than 2^63. This keeps the fee sum
+# within a signed 64 bit integer, which fee estimation and RPC clients expect
 MEMPOOL_ITEM_FEE_LIMIT = 2**50
 
 
@@ -38,151 +38,191 @@ class MempoolRemoveReason(Enum):
     EXPIRED = 4
 
 
+@dataclass
+class _IndexedItem:
+    """
+    A mempool item along with the fields the mempool indexes it by
+    """
+
+    name: bytes32
+    item: InternalMempoolItem
+    fee: int
+    cost: int
+    assert_height: Optional[uint32]
+    assert_before_height: Optional[uint32]
+    assert_before_seconds: Optional[uint64]
+    fee_per_cost: float
+    # the order in which items were added to the mempool. It's used as a
+    # tie-breaker for items with the same fee rate
+    seq: int
+    spent_coin_ids: List[bytes32]
+
+    @property
+    def feerate_key(self) -> Tuple[float, int]:
+        # items are ordered by descending fee rate, then ascending seq
+        return (-self.fee_per_cost, self.seq)
+
+
+@dataclass
+class _BlockTemplate:
+    """
+    The spend bundle of the next block, built by walking the mempool items in
+    fee rate order. The mempool extends it as higher seq items are added, and
+    drops it when an item it has already considered is removed, or an item is
+    added ahead of those
+    """
+
+    max_cost: int
+    eligible_coin_spends: EligibleCoinSpends = field(default_factory=EligibleCoinSpends)
+    coin_spends: List[CoinSpend] = field(default_factory=list)
+    additions: List[Coin] = field(default_factory=list)
+    aggregated_signature: G2Element = field(default_factory=G2Element)
+    cost_sum: int = 0  # Checks that total cost does not exceed block maximum
+    fee_sum: int = 0  # Checks that total fees don't exceed 64 bits
+    processed_spend_bundles: int = 0
+    # the fee rate key of the last item considered for the block
+    last_key: Optional[Tuple[float, int]] = None
+    # set once an item didn't fit, no more items are considered after that
+    full: bool = False
+
+    def add(self, entry: _IndexedItem) -> None:
+        assert not self.full
+        self.last_key = entry.feerate_key
+        item = entry.item
+        try:
+            unique_coin_spends, cost_saving, unique_additions = self.eligible_coin_spends.get_deduplication_info(
+                bundle_coin_spends=item.bundle_coin_spends, max_cost=item.npc_result.cost
+            )
+            item_cost = item.npc_result.cost - cost_saving
+            log.debug("Cumulative cost: %d, fee per cost: %0.4f", self.cost_sum, entry.fee / item_cost)
+            if (
+                item_cost + self.cost_sum > self.max_cost
+                or entry.fee + self.fee_sum > DEFAULT_CONSTANTS.MAX_COIN_AMOUNT
+            ):
+                self.full = True
+                return
+            self.coin_spends.extend(unique_coin_spends)
+            self.additions.extend(unique_additions)
+            self.aggregated_signature = AugSchemeMPL.aggregate(
+                [self.aggregated_signature, item.spend_bundle.aggregated_signature]
+            )
+            self.cost_sum += item_cost
+            self.fee_sum += entry.fee
+            self.processed_spend_bundles += 1
+        except Exception as e:
+            log.debug(f"Exception while checking a mempool item for deduplication: {e}")
+
+    def is_affected_by(self, entry: _IndexedItem) -> bool:
+        return self.last_key is not None and entry.feerate_key <= self.last_key
+
+
+def _heap_entries_below(heap: List[Tuple[int, int, bytes32]], limit: int) -> Iterator[Tuple[int, int, bytes32]]:
+    """
+    Yields the entries of the min-heap whose value is below limit, in ascending
+    order, without modifying the heap. Only the entries below limit and their
+    immediate children are visited.
+    """
+    if len(heap) == 0:
+        return
+    frontier: List[Tuple[Tuple[int, int, bytes32], int]] = [(heap[0], 0)]
+    while len(frontier) > 0:
+        entry, idx = heapq.heappop(frontier)
+        # the children of this entry can't be smaller than it
+        if entry[0] >= limit:
+            continue
+        yield entry
+        for child in (2 * idx + 1, 2 * idx + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+
 class Mempool:
-    _db_conn: sqlite3.Connection
-    # it's expensive to serialize and deserialize G2Element, so we keep those in
-    # this separate dictionary
-    _items: Dict[bytes32, InternalMempoolItem]
+    # all items, in the order they were added
+    _items: Dict[bytes32, _IndexedItem]
+    # the fee rate index. Maps (-fee_per_cost, seq) to spend bundle name
+    _by_feerate: SortedDict[Tuple[float, int], bytes32]
+    # maps coin IDs to the names of the spend bundles spending them
+    _by_coin_id: Dict[bytes32, Set[bytes32]]
+    # min-heaps of (assert_before_*, seq, name) for items that expire. Removed
+    # items are left in the heaps and skipped once they reach the top
+    _expiry_by_height: List[Tuple[int, int, bytes32]]
+    _expiry_by_seconds: List[Tuple[int, int, bytes32]]
+    _next_seq: int
+    _total_fee: int
+    _total_cost: int
+    # the next block, built from the items in fee rate order. None if it needs
+    # to be rebuilt
+    _block_template: Optional[_BlockTemplate]
 
     # the most recent block height and timestamp that we know of
     _block_height: uint32
     _timestamp: uint64
 
     def __init__(self, mempool_info: MempoolInfo, fee_estimator: FeeEstimatorInterface):
-        self._db_conn = sqlite3.connect(":memory:")
         self._items = {}
+        self._by_feerate = SortedDict()
+        self._by_coin_id = {}
+        self._expiry_by_height = []
+        self._expiry_by_seconds = []
+        self._next_seq = 1
+        self._total_fee = 0
+        self._total_cost = 0
+        self._block_template = None
         self._block_height = uint32(0)
         self._timestamp = uint64(0)
 
-        with self._db_conn:
-            # name means SpendBundle hash
-            # assert_height may be NIL
-            # the seq field indicates the order of items being added to the
-            # mempool. It's used as a tie-breaker for items with the same fee
-            # rate
-            # TODO: In the future, for the "fee_per_cost" field, opt for
-            # "GENERATED ALWAYS AS (CAST(fee AS REAL) / cost) VIRTUAL"
-            self._db_conn.execute(
-                """CREATE TABLE tx(
-                name BLOB,
-                cost INT NOT NULL,
-                fee INT NOT NULL,
-                assert_height INT,
-                assert_before_height INT,
-                assert_before_seconds INT,
-                fee_per_cost REAL,
-                seq INTEGER PRIMARY KEY AUTOINCREMENT)
-                """
-            )
-            self._db_conn.execute("CREATE INDEX name_idx ON tx(name)")
-            self._db_conn.execute("CREATE INDEX fee_sum ON tx(fee)")
-            self._db_conn.execute("CREATE INDEX cost_sum ON tx(cost)")
-            self._db_conn.execute("CREATE INDEX feerate ON tx(fee_per_cost)")
-            self._db_conn.execute(
-                "CREATE INDEX assert_before ON tx(assert_before_height, assert_before_seconds) "
-                "WHERE assert_before_height IS NOT NULL OR assert_before_seconds IS NOT NULL"
-            )
-
-            # This table maps coin IDs to spend bundles hashes
-            self._db_conn.execute(
-                """CREATE TABLE spends(
-                coin_id BLOB NOT NULL,
-                tx BLOB NOT NULL,
-                UNIQUE(coin_id, tx))
-                """
-            )
-            self._db_conn.execute("CREATE INDEX spend_by_coin ON spends(coin_id)")
-            self._db_conn.execute("CREATE INDEX spend_by_bundle ON spends(tx)")
-
         self.mempool_info: MempoolInfo = mempool_info
         self.fee_estimator: FeeEstimatorInterface = fee_estimator
 
-    def __del__(self) -> None:
-        self._db_conn.close()
-
-    def _row_to_item(self, row: sqlite3.Row) -> MempoolItem:
-        name = bytes32(row[0])
-        fee = int(row[2])
-        assert_height = row[3]
-        assert_before_height = row[4]
-        assert_before_seconds = row[5]
-        item = self._items[name]
-
+    def _to_mempool_item(self, entry: _IndexedItem) -> MempoolItem:
+        item = entry.item
         return MempoolItem(
             item.spend_bundle,
-            uint64(fee),
+            uint64(entry.fee),
             item.npc_result,
-            name,
+            entry.name,
             uint32(item.height_added_to_mempool),
-            assert_height,
-            assert_before_height,
-            assert_before_seconds,
+            entry.assert_height,
+            entry.assert_before_height,
+            entry.assert_before_seconds,
             bundle_coin_spends=item.bundle_coin_spends,
         )
 
     def total_mempool_fees(self) -> int:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT SUM(fee) FROM tx")
-            val = cursor.fetchone()[0]
-            return uint64(0) if val is None else uint64(val)
+        return uint64(self._total_fee)
 
     def total_mempool_cost(self) -> CLVMCost:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT SUM(cost) FROM tx")
-            val = cursor.fetchone()[0]
-            return CLVMCost(uint64(0) if val is None else uint64(val))
+        return CLVMCost(uint64(self._total_cost))
 
     def all_items(self) -> Iterator[MempoolItem]:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT * FROM tx")
-            for row in cursor:
-                yield self._row_to_item(row)
+        for entry in list(self._items.values()):
+            yield self._to_mempool_item(entry)
 
     def all_item_ids(self) -> List[bytes32]:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT name FROM tx")
-            return [bytes32(row[0]) for row in cursor]
+        return list(self._items.keys())
 
     # TODO: move "process_mempool_items()" into this class in order to do this a
     # bit more efficiently
     def items_by_feerate(self) -> Iterator[MempoolItem]:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT * FROM tx ORDER BY fee_per_cost DESC, seq ASC")
-            for row in cursor:
-                yield self._row_to_item(row)
+        for name in self._by_feerate.values():
+            yield self._to_mempool_item(self._items[name])
 
     def size(self) -> int:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT Count(name) FROM tx")
-            val = cursor.fetchone()
-            return 0 if val is None else int(val[0])
+        return len(self._items)
 
     def get_item_by_id(self, item_id: bytes32) -> Optional[MempoolItem]:
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT * FROM tx WHERE name=?", (item_id,))
-            row = cursor.fetchone()
-            return None if row is None else self._row_to_item(row)
+        entry = self._items.get(item_id)
+        return None if entry is None else self._to_mempool_item(entry)
 
-    # TODO: we need a bulk lookup function like this too
     def get_items_by_coin_id(self, spent_coin_id: bytes32) -> List[MempoolItem]:
-        with self._db_conn:
-            cursor = self._db_conn.execute(
-                "SELECT * FROM tx WHERE name in (SELECT tx FROM spends WHERE coin_id=?)",
-                (spent_coin_id,),
-            )
-            return [self._row_to_item(row) for row in cursor]
+        return self.get_items_by_coin_ids([spent_coin_id])
 
     def get_items_by_coin_ids(self, spent_coin_ids: List[bytes32]) -> List[MempoolItem]:
-        items: List[MempoolItem] = []
-        for batch in to_batches(spent_coin_ids, SQLITE_MAX_VARIABLE_NUMBER):
-            args = ",".join(["?"] * len(batch.entries))
-            with self._db_conn:
-                cursor = self._db_conn.execute(
-                    f"SELECT * FROM tx WHERE name IN (SELECT tx FROM spends WHERE coin_id IN ({args}))",
-                    tuple(batch.entries),
-                )
-                items.extend(self._row_to_item(row) for row in cursor)
-        return items
+        names: Dict[bytes32, None] = {}
+        for coin_id in spent_coin_ids:
+            for name in self._by_coin_id.get(coin_id, ()):
+                names[name] = None
+        return [self._to_mempool_item(self._items[name]) for name in names]
 
     def get_min_fee_rate(self, cost: int) -> float:
         """
@@ -190,20 +230,15 @@ class Mempool:
         """
 
         if self.at_full_capacity(cost):
-            # TODO: make MempoolItem.cost be CLVMCost
-            current_cost = int(self.total_mempool_cost())
+            current_cost = self._total_cost
 
             # Iterates through all spends in increasing fee per cost
-            with self._db_conn:
-                cursor = self._db_conn.execute("SELECT cost,fee_per_cost FROM tx ORDER BY fee_per_cost ASC, seq DESC")
-
-                item_cost: int
-                fee_per_cost: float
-                for item_cost, fee_per_cost in cursor:
-                    current_cost -= item_cost
-                    # Removing one at a time, until our transaction of size cost fits
-                    if current_cost + cost <= self.mempool_info.max_size_in_cost:
-                        return fee_per_cost
+            for name in reversed(self._by_feerate.values()):
+                entry = self._items[name]
+                current_cost -= entry.cost
+                # Removing one at a time, until our transaction of size cost fits
+                if current_cost + cost <= self.mempool_info.max_size_in_cost:
+                    return entry.fee_per_cost
 
             raise ValueError(
                 f"Transaction with cost {cost} does not fit in mempool of max cost {self.mempool_info.max_size_in_cost}"
@@ -211,20 +246,43 @@ class Mempool:
         else:
             return 0
 
+    def _expiring_items(self, block_height: int, timestamp: int) -> List[_IndexedItem]:
+        """
+        Returns the items with assert_before_height below block_height, or
+        assert_before_seconds below timestamp
+        """
+        found: Dict[bytes32, _IndexedItem] = {}
+        for heap, limit in ((self._expiry_by_height, block_height), (self._expiry_by_seconds, timestamp)):
+            for value, seq, name in _heap_entries_below(heap, limit):
+                entry = self._items.get(name)
+                if entry is not None and entry.seq == seq:
+                    found[name] = entry
+        return list(found.values())
+
+    def _compact_expiry_heaps(self) -> None:
+        # drop the entries of items that have been removed, once they make up
+        # most of the heap
+        for heap in (self._expiry_by_height, self._expiry_by_seconds):
+            if len(heap) > 2 * len(self._items) + 100:
+                heap[:] = [e for e in heap if e[2] in self._items and self._items[e[2]].seq == e[1]]
+                heapq.heapify(heap)
+
     def new_tx_block(self, block_height: uint32, timestamp: uint64) -> None:
         """
         Remove all items that became invalid because of this new height and
         timestamp. (we don't know about which coins were spent in this new block
         here, so those are handled separately)
         """
-        with self._db_conn:
-            cursor = self._db_conn.execute(
-                "SELECT name FROM tx WHERE assert_before_seconds <= ? OR assert_before_height <= ?",
-                (timestamp, block_height),
-            )
-            to_remove = [bytes32(row[0]) for row in cursor]
-
-        self.remove_from_pool(to_remove, MempoolRemoveReason.EXPIRED)
+        to_remove: Dict[bytes32, int] = {}
+        for heap, limit in ((self._expiry_by_height, block_height), (self._expiry_by_seconds, timestamp)):
+            while len(heap) > 0 and heap[0][0] <= limit:
+                _, seq, name = heapq.heappop(heap)
+                entry = self._items.get(name)
+                if entry is not None and entry.seq == seq:
+                    to_remove[name] = seq
+
+        self.remove_from_pool(sorted(to_remove.keys(), key=to_remove.__getitem__), MempoolRemoveReason.EXPIRED)
+        self._compact_expiry_heaps()
         self._block_height = block_height
         self._timestamp = timestamp
 
@@ -236,27 +294,20 @@ class Mempool:
             return
 
         removed_items: List[MempoolItemInfo] = []
-        if reason != MempoolRemoveReason.BLOCK_INCLUSION:
-            for batch in to_batches(items, SQLITE_MAX_VARIABLE_NUMBER):
-                args = ",".join(["?"] * len(batch.entries))
-                with self._db_conn:
-                    cursor = self._db_conn.execute(
-                        f"SELECT name, cost, fee FROM tx WHERE name in ({args})", batch.entries
-                    )
-                    for row in cursor:
-                        name = bytes32(row[0])
-                        internal_item = self._items[name]
-                        item = MempoolItemInfo(int(row[1]), int(row[2]), internal_item.height_added_to_mempool)
-                        removed_items.append(item)
-
         for name in items:
-            self._items.pop(name)
-
-        for batch in to_batches(items, SQLITE_MAX_VARIABLE_NUMBER):
-            args = ",".join(["?"] * len(batch.entries))
-            with self._db_conn:
-                self._db_conn.execute(f"DELETE FROM tx WHERE name in ({args})", batch.entries)
-                self._db_conn.execute(f"DELETE FROM spends WHERE tx in ({args})", batch.entries)
+            entry = self._items.pop(name)
+            del self._by_feerate[entry.feerate_key]
+            for coin_id in entry.spent_coin_ids:
+                spends = self._by_coin_id[coin_id]
+                spends.discard(name)
+                if len(spends) == 0:
+                    del self._by_coin_id[coin_id]
+            self._total_fee -= entry.fee
+            self._total_cost -= entry.cost
+            if self._block_template is not None and self._block_template.is_affected_by(entry):
+                self._block_template = None
+            if reason != MempoolRemoveReason.BLOCK_INCLUSION:
+                removed_items.append(MempoolItemInfo(entry.cost, entry.fee, entry.item.height_added_to_mempool))
 
         if reason != MempoolRemoveReason.BLOCK_INCLUSION:
             info = FeeMempoolInfo(
@@ -274,85 +325,76 @@ class Mempool:
         assert item.npc_result.conds is not None
         assert item.cost <= self.mempool_info.max_block_clvm_cost
 
-        with self._db_conn:
-            # we have certain limits on transactions that will expire soon
-            # (in the next 15 minutes)
-            block_cutoff = self._block_height + 48
-            time_cutoff = self._timestamp + 900
-            if (item.assert_before_height is not None and item.assert_before_height < block_cutoff) or (
-                item.assert_before_seconds is not None and item.assert_before_seconds < time_cutoff
-            ):
-                # this lists only transactions that expire soon, in order of
-                # lowest fee rate along with the cumulative cost of such
-                # transactions counting from highest to lowest fee rate
-                cursor = self._db_conn.execute(
-                    """
-                    SELECT name,
-                        fee_per_cost,
-                        SUM(cost) OVER (ORDER BY fee_per_cost DESC, seq ASC) AS cumulative_cost
-                    FROM tx
-                    WHERE assert_before_seconds IS NOT NULL AND assert_before_seconds < ?
-                        OR assert_before_height IS NOT NULL AND assert_before_height < ?
-                    ORDER BY cumulative_cost DESC
-                    """,
-                    (time_cutoff, block_cutoff),
-                )
-                to_remove: List[bytes32] = []
-                for row in cursor:
-                    name, fee_per_cost, cumulative_cost = row
-
-                    # there's space for us, stop pruning
-                    if cumulative_cost + item.cost <= self.mempool_info.max_block_clvm_cost:
-                        break
-
-                    # we can't evict any more transactions, abort (and don't
-                    # evict what we put aside in "to_remove" list)
-                    if fee_per_cost > item.fee_per_cost:
-                        return Err.INVALID_FEE_LOW_FEE
-                    to_remove.append(name)
-                self.remove_from_pool(to_remove, MempoolRemoveReason.EXPIRED)
-                # if we don't find any entries, it's OK to add this entry
-
-            total_cost = int(self.total_mempool_cost())
-            if total_cost + item.cost > self.mempool_info.max_size_in_cost:
-                # pick the items with the lowest fee per cost to remove
-                cursor = self._db_conn.execute(
-                    """SELECT name FROM tx
-                    WHERE name NOT IN (
-                        SELECT name FROM (
-                            SELECT name,
-                            SUM(cost) OVER (ORDER BY fee_per_cost DESC, seq ASC) AS total_cost
-                            FROM tx) AS tx_with_cost
-                        WHERE total_cost <= ?)
-                    """,
-                    (self.mempool_info.max_size_in_cost - item.cost,),
-                )
-                to_remove = [bytes32(row[0]) for row in cursor]
-                self.remove_from_pool(to_remove, MempoolRemoveReason.POOL_FULL)
-
-            # TODO: In the future, for the "fee_per_cost" field, opt for
-            # "GENERATED ALWAYS AS (CAST(fee AS REAL) / cost) VIRTUAL"
-            self._db_conn.execute(
-                "INSERT INTO "
-                "tx(name,cost,fee,assert_height,assert_before_height,assert_before_seconds,fee_per_cost) "
-                "VALUES(?, ?, ?, ?, ?, ?, ?)",
-                (
-                    item.name,
-                    item.cost,
-                    item.fee,
-                    item.assert_height,
-                    item.assert_before_height,
-                    item.assert_before_seconds,
-                    item.fee / item.cost,
-                ),
-            )
-
-            all_coin_spends = [(s.coin_id, item.name) for s in item.npc_result.conds.spends]
-            self._db_conn.executemany("INSERT INTO spends VALUES(?, ?)", all_coin_spends)
+        # we have certain limits on transactions that will expire soon
+        # (in the next 15 minutes)
+        block_cutoff = self._block_height + 48
+        time_cutoff = self._timestamp + 900
+        if (item.assert_before_height is not None and item.assert_before_height < block_cutoff) or (
+            item.assert_before_seconds is not None and item.assert_before_seconds < time_cutoff
+        ):
+            # this lists only transactions that expire soon, in order of
+            # highest fee rate, along with the cumulative cost of such
+            # transactions counting from highest to lowest fee rate
+            expiring = self._expiring_items(block_cutoff, time_cutoff)
+            expiring.sort(key=lambda e: e.feerate_key)
+            cumulative_cost = sum(e.cost for e in expiring)
+            to_remove: List[bytes32] = []
+            for entry in reversed(expiring):
+                # there's space for us, stop pruning
+                if cumulative_cost + item.cost <= self.mempool_info.max_block_clvm_cost:
+                    break
 
-            self._items[item.name] = InternalMempoolItem(
+                # we can't evict any more transactions, abort (and don't
+                # evict what we put aside in "to_remove" list)
+                if entry.fee_per_cost > item.fee_per_cost:
+                    return Err.INVALID_FEE_LOW_FEE
+                to_remove.append(entry.name)
+                cumulative_cost -= entry.cost
+            self.remove_from_pool(to_remove, MempoolRemoveReason.EXPIRED)
+            # if we don't find any entries, it's OK to add this entry
+
+        if self._total_cost + item.cost > self.mempool_info.max_size_in_cost:
+            # pick the items with the lowest fee per cost to remove
+            remaining_cost = self._total_cost
+            to_remove = []
+            for name in reversed(self._by_feerate.values()):
+                if remaining_cost <= self.mempool_info.max_size_in_cost - item.cost:
+                    break
+                to_remove.append(name)
+                remaining_cost -= self._items[name].cost
+            self.remove_from_pool(to_remove, MempoolRemoveReason.POOL_FULL)
+
+        seq = self._next_seq
+        self._next_seq += 1
+        entry = _IndexedItem(
+            item.name,
+            InternalMempoolItem(
                 item.spend_bundle, item.npc_result, item.height_added_to_mempool, item.bundle_coin_spends
-            )
+            ),
+            item.fee,
+            item.cost,
+            item.assert_height,
+            item.assert_before_height,
+            item.assert_before_seconds,
+            item.fee / item.cost,
+            seq,
+            [bytes32(s.coin_id) for s in item.npc_result.conds.spends],
+        )
+        self._items[item.name] = entry
+        self._by_feerate[entry.feerate_key] = item.name
+        for coin_id in entry.spent_coin_ids:
+            self._by_coin_id.setdefault(coin_id, set()).add(item.name)
+        if item.assert_before_height is not None:
+            heapq.heappush(self._expiry_by_height, (item.assert_before_height, seq, item.name))
+        if item.assert_before_seconds is not None:
+            heapq.heappush(self._expiry_by_seconds, (item.assert_before_seconds, seq, item.name))
+        self._total_fee += item.fee
+        self._total_cost += item.cost
+        if self._block_template is not None:
+            if self._block_template.is_affected_by(entry):
+                self._block_template = None
+            elif not self._block_template.full:
+                self._block_template.add(entry)
 
         info = FeeMempoolInfo(self.mempool_info, self.total_mempool_cost(), self.total_mempool_fees(), datetime.now())
         self.fee_estimator.add_mempool_item(info, MempoolItemInfo(item.cost, item.fee, item.height_added_to_mempool))
@@ -363,57 +405,41 @@ class Mempool:
         Checks whether the mempool is at full capacity and cannot accept a transaction with size cost.
         """
 
-        return self.total_mempool_cost() + cost > self.mempool_info.max_size_in_cost
+        return self._total_cost + cost > self.mempool_info.max_size_in_cost
 
-    def create_bundle_from_mempool_items(
-        self, item_inclusion_filter: Callable[[bytes32], bool]
-    ) -> Optional[Tuple[SpendBundle, List[Coin]]]:
-        cost_sum = 0  # Checks that total cost does not exceed block maximum
-        fee_sum = 0  # Checks that total fees don't exceed 64 bits
-        processed_spend_bundles = 0
-        additions: List[Coin] = []
+    def _make_block_template(self, item_inclusion_filter: Callable[[bytes32], bool]) -> _BlockTemplate:
         # This contains a map of coin ID to a coin spend solution and its isolated cost
-        # We reconstruct it for every bundle we create from mempool items because we
+        # We reconstruct it for every template we create from mempool items because we
         # deduplicate on the first coin spend solution that comes with the highest
         # fee rate item, and that can change across calls
-        eligible_coin_spends = EligibleCoinSpends()
-        coin_spends: List[CoinSpend] = []
-        sigs: List[G2Element] = []
-        log.info(f"Starting to make block, max cost: {self.mempool_info.max_block_clvm_cost}")
-        with self._db_conn:
-            cursor = self._db_conn.execute("SELECT name, fee FROM tx ORDER BY fee_per_cost DESC, seq ASC")
-        for row in cursor:
-            name = bytes32(row[0])
-            fee = int(row[1])
-            item = self._items[name]
+        template = _BlockTemplate(self.mempool_info.max_block_clvm_cost)
+        for name in self._by_feerate.values():
             if not item_inclusion_filter(name):
                 continue
-            try:
-                unique_coin_spends, cost_saving, unique_additions = eligible_coin_spends.get_deduplication_info(
-                    bundle_coin_spends=item.bundle_coin_spends, max_cost=item.npc_result.cost
-                )
-                item_cost = item.npc_result.cost - cost_saving
-                log.info("Cumulative cost: %d, fee per cost: %0.4f", cost_sum, fee / item_cost)
-                if (
-                    item_cost + cost_sum > self.mempool_info.max_block_clvm_cost
-                    or fee + fee_sum > DEFAULT_CONSTANTS.MAX_COIN_AMOUNT
-                ):
-                    break
-                coin_spends.extend(unique_coin_spends)
-                additions.extend(unique_additions)
-                sigs.append(item.spend_bundle.aggregated_signature)
-                cost_sum += item_cost
-                fee_sum += fee
-                processed_spend_bundles += 1
-            except Exception as e:
-                log.debug(f"Exception while checking a mempool item for deduplication: {e}")
-                continue
-        if processed_spend_bundles == 0:
+            template.add(self._items[name])
+            if template.full:
+                break
+        return template
+
+    def create_bundle_from_mempool_items(
+        self, item_inclusion_filter: Optional[Callable[[bytes32], bool]] = None
+    ) -> Optional[Tuple[SpendBundle, List[Coin]]]:
+        """
+        Without an item_inclusion_filter, the block is made from the template
+        that's maintained as items are added, which is cheap
+        """
+        log.info(f"Starting to make block, max cost: {self.mempool_info.max_block_clvm_cost}")
+        if item_inclusion_filter is not None:
+            template = self._make_block_template(item_inclusion_filter)
+        else:
+            if self._block_template is None:
+                self._block_template = self._make_block_template(lambda name: True)
+            template = self._block_template
+        if template.processed_spend_bundles == 0:
             return None
         log.info(
-            f"Cumulative cost of block (real cost should be less) {cost_sum}. Proportion "
-            f"full: {cost_sum / self.mempool_info.max_block_clvm_cost}"
+            f"Cumulative cost of block (real cost should be less) {template.cost_sum}. Proportion "
+            f"full: {template.cost_sum / self.mempool_info.max_block_clvm_cost}"
         )
-        aggregated_signature = AugSchemeMPL.aggregate(sigs)
-        agg = SpendBundle(coin_spends, aggregated_signature)
-        return agg, additions
+        agg = SpendBundle(list(template.coin_spends), template.aggregated_signature)
+        return agg, list(template.additions)
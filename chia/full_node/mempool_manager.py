@@ -48,17 +48,13 @@ log = logging.getLogger(__name__)
 MEMPOOL_MIN_FEE_INCREASE = uint64(10000000)
 
 
-# TODO: once the 1.8.0 soft-fork has activated, we don't really need to pass
-# the constants through here
-def validate_clvm_and_signature(
-    spend_bundle_bytes: bytes, max_cost: int, constants: ConsensusConstants, height: uint32
-) -> Tuple[Optional[Err], bytes, Dict[bytes32, bytes]]:
-    """
-    Validates CLVM and aggregate signature for a spendbundle. This is meant to be called under a ProcessPoolExecutor
-    in order to validate the heavy parts of a transaction in a different thread. Returns an optional error,
-    the NPCResult and a cache of the new pairings validated (if not error)
-    """
-
+def _validate_clvm_and_signature(
+    spend_bundle_bytes: bytes,
+    max_cost: int,
+    constants: ConsensusConstants,
+    height: uint32,
+    cache: LRUCache[bytes32, GTElement],
+) -> Tuple[Optional[Err], bytes]:
     additional_data = constants.AGG_SIG_ME_ADDITIONAL_DATA
 
     try:
@@ -70,7 +66,7 @@ def validate_clvm_and_signature(
         )
 
         if result.error is not None:
-            return Err(result.error), b"", {}
+            return Err(result.error), b""
 
         pks: List[bytes48] = []
         msgs: List[bytes] = []
@@ -78,18 +74,55 @@ def validate_clvm_and_signature(
         pks, msgs = pkm_pairs(result.conds, additional_data)
 
         # Verify aggregated signature
-        cache: LRUCache[bytes32, GTElement] = LRUCache(10000)
         if not cached_bls.aggregate_verify(pks, msgs, bundle.aggregated_signature, True, cache):
-            return Err.BAD_AGGREGATE_SIGNATURE, b"", {}
-        new_cache_entries: Dict[bytes32, bytes] = {}
-        for k, v in cache.cache.items():
-            new_cache_entries[k] = bytes(v)
+            return Err.BAD_AGGREGATE_SIGNATURE, b""
     except ValidationError as e:
-        return e.code, b"", {}
+        return e.code, b""
     except Exception:
-        return Err.UNKNOWN, b"", {}
+        return Err.UNKNOWN, b""
+
+    return None, bytes(result)
+
 
-    return None, bytes(result), new_cache_entries
+# TODO: once the 1.8.0 soft-fork has activated, we don't really need to pass
+# the constants through here
+def validate_clvm_and_signature(
+    spend_bundle_bytes: bytes, max_cost: int, constants: ConsensusConstants, height: uint32
+) -> Tuple[Optional[Err], bytes, Dict[bytes32, bytes]]:
+    """
+    Validates CLVM and aggregate signature for a spendbundle. This is meant to be called under a ProcessPoolExecutor
+    in order to validate the heavy parts of a transaction in a different thread. Returns an optional error,
+    the NPCResult and a cache of the new pairings validated (if not error)
+    """
+    cache: LRUCache[bytes32, GTElement] = LRUCache(10000)
+    err, result_bytes = _validate_clvm_and_signature(spend_bundle_bytes, max_cost, constants, height, cache)
+    if err is not None:
+        return err, b"", {}
+    return None, result_bytes, {k: bytes(v) for k, v in cache.cache.items()}
+
+
+def validate_clvm_and_signature_batch(
+    spend_bundles_bytes: List[bytes], max_cost: int, constants: ConsensusConstants, height: uint32
+) -> Tuple[List[Tuple[Optional[Err], bytes]], Dict[bytes32, bytes]]:
+    """
+    Validates a batch of spendbundles in a single round-trip to the ProcessPoolExecutor. Returns an optional error
+    and the NPCResult for each spendbundle, and a cache of the pairings computed for the valid ones. Pairings are
+    shared across the batch, so public key and message pairs appearing in several spendbundles are only paired once.
+    """
+    cache: LRUCache[bytes32, GTElement] = LRUCache(10000)
+    known_pairings: Set[bytes32] = set()
+    new_cache_entries: Dict[bytes32, bytes] = {}
+    results: List[Tuple[Optional[Err], bytes]] = []
+    for spend_bundle_bytes in spend_bundles_bytes:
+        err, result_bytes = _validate_clvm_and_signature(spend_bundle_bytes, max_cost, constants, height, cache)
+        results.append((err, result_bytes))
+        new_pairings = [k for k in cache.cache.keys() if k not in known_pairings]
+        known_pairings.update(new_pairings)
+        # like for a single spendbundle, only the pairings of valid ones are returned
+        if err is None:
+            for k in new_pairings:
+                new_cache_entries[k] = bytes(cache.cache[k])
+    return results, new_cache_entries
 
 
 @dataclass
@@ -142,6 +175,38 @@ def compute_assert_height(
     return ret
 
 
+@dataclass
+class ValidationStats:
+    """
+    Throughput and latency of spend bundle pre-validation. The rates are
+    exponential moving averages, updated as each batch completes
+    """
+
+    validated: int = 0
+    batches: int = 0
+    # spend bundles validated per second, across all workers
+    tx_per_second: float = 0.0
+    # seconds a spend bundle waits to be sent to a worker
+    queue_latency: float = 0.0
+    last_completed: Optional[float] = None
+
+    def record_batch(self, num_items: int, latency: float, now: float, alpha: float = 0.3) -> None:
+        if self.last_completed is not None:
+            rate = num_items / max(now - self.last_completed, 0.001)
+            self.tx_per_second = alpha * rate + (1 - alpha) * self.tx_per_second
+        self.queue_latency = alpha * latency + (1 - alpha) * self.queue_latency
+        self.last_completed = now
+        self.validated += num_items
+        self.batches += 1
+
+
+@dataclass
+class _PendingValidation:
+    spend_bundle_bytes: bytes
+    queued: float
+    result: asyncio.Future[Tuple[Optional[Err], bytes]]
+
+
 class MempoolManager:
     pool: Executor
     constants: ConsensusConstants
@@ -156,6 +221,13 @@ class MempoolManager:
     seen_cache_size: int
     peak: Optional[BlockRecordProtocol]
     mempool: Mempool
+    # spend bundles waiting to be pre-validated. They are sent to the process
+    # pool in batches, as workers become available
+    _pending_validations: List[_PendingValidation]
+    _validation_tasks: Set[asyncio.Task[None]]
+    _max_validation_batches: int
+    max_validation_batch_size: int
+    validation_stats: ValidationStats
 
     def __init__(
         self,
@@ -164,6 +236,7 @@ class MempoolManager:
         multiprocessing_context: Optional[BaseContext] = None,
         *,
         single_threaded: bool = False,
+        max_validation_batch_size: int = 32,
     ):
         self.constants: ConsensusConstants = consensus_constants
 
@@ -185,11 +258,17 @@ class MempoolManager:
         self._conflict_cache = ConflictTxCache(self.constants.MAX_BLOCK_COST_CLVM * 1, 1000)
         self._pending_cache = PendingTxCache(self.constants.MAX_BLOCK_COST_CLVM * 1, 1000)
         self.seen_cache_size = 10000
+        self._pending_validations = []
+        self._validation_tasks = set()
+        self.max_validation_batch_size = max_validation_batch_size
+        self.validation_stats = ValidationStats()
         if single_threaded:
             self.pool = InlineExecutor()
+            self._max_validation_batches = 1
         else:
+            self._max_validation_batches = 2
             self.pool = ProcessPoolExecutor(
-                max_workers=2,
+                max_workers=self._max_validation_batches,
                 mp_context=multiprocessing_context,
                 initializer=setproctitle,
                 initargs=(f"{getproctitle()}_worker",),
@@ -206,6 +285,8 @@ class MempoolManager:
         self.mempool: Mempool = Mempool(mempool_info, self.fee_estimator)
 
     def shut_down(self) -> None:
+        for task in self._validation_tasks:
+            task.cancel()
         self.pool.shutdown(wait=True)
 
     def create_bundle_from_mempool(
@@ -217,12 +298,6 @@ class MempoolManager:
         """
         if self.peak is None or self.peak.header_hash != last_tb_header_hash:
             return None
-        if item_inclusion_filter is None:
-
-            def always(bundle_name: bytes32) -> bool:
-                return True
-
-            item_inclusion_filter = always
         return self.mempool.create_bundle_from_mempool_items(item_inclusion_filter)
 
     def get_filter(self) -> bytes:
@@ -280,19 +355,13 @@ class MempoolManager:
 
         assert self.peak is not None
 
-        err, cached_result_bytes, new_cache_entries = await asyncio.get_running_loop().run_in_executor(
-            self.pool,
-            validate_clvm_and_signature,
-            new_spend_bytes,
-            self.max_block_clvm_cost,
-            self.constants,
-            self.peak.height,
-        )
+        pending = _PendingValidation(new_spend_bytes, time.monotonic(), asyncio.get_running_loop().create_future())
+        self._pending_validations.append(pending)
+        self._start_validation_batches()
+        err, cached_result_bytes = await pending.result
 
         if err is not None:
             raise ValidationError(err)
-        for cache_entry_key, cached_entry_value in new_cache_entries.items():
-            LOCAL_CACHE.put(cache_entry_key, GTElement.from_bytes_unchecked(cached_entry_value))
         ret: NPCResult = NPCResult.from_bytes(cached_result_bytes)
         end_time = time.time()
         duration = end_time - start_time
@@ -302,6 +371,51 @@ class MempoolManager:
         )
         return ret
 
+    def _start_validation_batches(self) -> None:
+        # while all workers are busy, spend bundles queue up and are sent as
+        # one batch once a worker becomes available
+        while len(self._pending_validations) > 0 and len(self._validation_tasks) < self._max_validation_batches:
+            batch = self._pending_validations[: self.max_validation_batch_size]
+            del self._pending_validations[: self.max_validation_batch_size]
+            task = asyncio.create_task(self._validate_batch(batch))
+            self._validation_tasks.add(task)
+            task.add_done_callback(self._validation_batch_done)
+
+    def _validation_batch_done(self, task: asyncio.Task[None]) -> None:
+        self._validation_tasks.discard(task)
+        self._start_validation_batches()
+
+    async def _validate_batch(self, batch: List[_PendingValidation]) -> None:
+        assert self.peak is not None
+        start = time.monotonic()
+        try:
+            results, new_cache_entries = await asyncio.get_running_loop().run_in_executor(
+                self.pool,
+                validate_clvm_and_signature_batch,
+                [p.spend_bundle_bytes for p in batch],
+                self.max_block_clvm_cost,
+                self.constants,
+                self.peak.height,
+            )
+        except asyncio.CancelledError:
+            for p in batch:
+                p.result.cancel()
+            raise
+        except Exception as e:
+            for p in batch:
+                if not p.result.done():
+                    p.result.set_exception(e)
+            return
+
+        for cache_entry_key, cached_entry_value in new_cache_entries.items():
+            LOCAL_CACHE.put(cache_entry_key, GTElement.from_bytes_unchecked(cached_entry_value))
+        for p, result in zip(batch, results):
+            if not p.result.done():
+                p.result.set_result(result)
+        self.validation_stats.record_batch(
+            len(batch), sum(start - p.queued for p in batch) / len(batch), time.monotonic()
+        )
+
     async def add_spend_bundle(
         self, new_spend: SpendBundle, npc_result: NPCResult, spend_name: bytes32, first_added_height: uint32
     ) -> Tuple[Optional[uint64], MempoolInclusionStatus, Optional[Err]]:
@@ -643,7 +757,9 @@ class MempoolManager:
         log.info(
             f"Size of mempool: {self.mempool.size()} spends, "
             f"cost: {self.mempool.total_mempool_cost()} "
-            f"minimum fee rate (in FPC) to get in for 5M cost tx: {self.mempool.get_min_fee_rate(5000000)}"
+            f"minimum fee rate (in FPC) to get in for 5M cost tx: {self.mempool.get_min_fee_rate(5000000)} "
+            f"validation: {self.validation_stats.tx_per_second:0.1f} tx/s, "
+            f"queue latency: {self.validation_stats.queue_latency:0.3f}s"
         )
         self.mempool.fee_estimator.new_block(FeeBlockInfo(new_peak.height, included_items))
         return txs_added
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import dataclasses
+import heapq
+import time
+from concurrent.futures import Executor
+from enum import IntEnum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# upper bounds (in seconds) of the latency histogram buckets. The last bucket
+# counts everything slower than the last bound
+LATENCY_BUCKETS: List[float] = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+
+
+class LookupPriority(IntEnum):
+    # lower values are scheduled first
+    full_proof = 0
+    qualities = 1
+
+
+@dataclasses.dataclass
+class LatencyHistogram:
+    counts: List[int] = dataclasses.field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    total: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        return {"buckets": LATENCY_BUCKETS, "counts": list(self.counts), "total": self.total}
+
+
+@dataclasses.dataclass
+class DiskQueue:
+    # a plot directory on this disk, to make the device ID recognizable
+    example_path: str
+    running: int = 0
+    waiting: List[Tuple[int, int, asyncio.Future[None]]] = dataclasses.field(default_factory=list)
+    latencies: Dict[LookupPriority, LatencyHistogram] = dataclasses.field(
+        default_factory=lambda: {priority: LatencyHistogram() for priority in LookupPriority}
+    )
+
+
+class DiskScheduler:
+    """
+    Runs the blocking plot lookups in the harvester's thread pool, with a
+    separate queue for every disk (identified by st_dev). At most
+    max_concurrent_lookups lookups per disk are in the thread pool at a time,
+    so a slow disk can't take all the threads and delay the lookups on the
+    other disks. Waiting full proof fetches are started before waiting quality
+    lookups.
+    """
+
+    executor: Executor
+    max_concurrent_lookups: int
+    _disks: Dict[int, DiskQueue]
+    _counter: int
+
+    def __init__(self, executor: Executor, max_concurrent_lookups: int) -> None:
+        assert max_concurrent_lookups > 0
+        self.executor = executor
+        self.max_concurrent_lookups = max_concurrent_lookups
+        self._disks = {}
+        self._counter = 0
+
+    async def run(
+        self, device: int, filename: Path, priority: LookupPriority, function: Callable[..., T], *args: Any
+    ) -> T:
+        disk = self._disks.get(device)
+        if disk is None:
+            disk = DiskQueue(str(filename.parent))
+            self._disks[device] = disk
+
+        if disk.running >= self.max_concurrent_lookups:
+            # the counter keeps lookups of the same priority in FIFO order
+            self._counter += 1
+            waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            entry = (int(priority), self._counter, waiter)
+            heapq.heappush(disk.waiting, entry)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # we were handed a slot already, pass it on
+                    self._release(disk)
+                else:
+                    disk.waiting.remove(entry)
+                    heapq.heapify(disk.waiting)
+                raise
+        else:
+            disk.running += 1
+
+        start = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            disk.latencies[priority].add(time.monotonic() - start)
+            self._release(disk)
+
+    def _release(self, disk: DiskQueue) -> None:
+        # hand the slot to the next waiting lookup, if there is one
+        while len(disk.waiting) > 0:
+            _, _, waiter = heapq.heappop(disk.waiting)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        disk.running -= 1
+
+    def disk_stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "device": dev,
+                "example_path": disk.example_path,
+                "running": disk.running,
+                "waiting": len(disk.waiting),
+                "latencies": {
+                    priority.name: histogram.to_json_dict() for priority, histogram in disk.latencies.items()
+                },
+            }
+            for dev, disk in self._disks.items()
+        ]
@@ -13,6 +13,7 @@ from typing import TYPE_CHECKING, Any, AsyncIterator, ClassVar, Dict, List, Opti
 from typing_extensions import Literal
 
 from chia.consensus.constants import ConsensusConstants
+from chia.harvester.disk_scheduler import DiskScheduler
 from chia.plot_sync.sender import Sender
 from chia.plotting.manager import PlotManager
 from chia.plotting.util import (
@@ -55,6 +56,7 @@ class Harvester:
     root_path: Path
     _shut_down: bool
     executor: ThreadPoolExecutor
+    disk_scheduler: DiskScheduler
     state_changed_callback: Optional[StateChangedProtocol] = None
     constants: ConsensusConstants
     _refresh_lock: asyncio.Lock
@@ -94,6 +96,7 @@ class Harvester:
         )
         self._shut_down = False
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=config["num_threads"])
+        self.disk_scheduler = DiskScheduler(self.executor, config.get("max_concurrent_lookups_per_disk", 10))
         self._server = None
         self.constants = constants
         self.state_changed_callback: Optional[StateChangedProtocol] = None
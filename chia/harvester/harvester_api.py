@@ -9,6 +9,7 @@ from typing import List, Optional, Tuple
 from chia_rs import AugSchemeMPL, G1Element, G2Element
 
 from chia.consensus.pot_iterations import calculate_iterations_quality, calculate_sp_interval_iters
+from chia.harvester.disk_scheduler import LookupPriority
 from chia.harvester.harvester import Harvester
 from chia.plotting.util import PlotInfo, parse_plot_info
 from chia.protocols import harvester_protocol
@@ -21,7 +22,7 @@ from chia.types.blockchain_format.proof_of_space import (
     ProofOfSpace,
     calculate_pos_challenge,
     generate_plot_public_key,
-    passes_plot_filter,
+    plots_passing_filter,
 )
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.util.api_decorators import api_request
@@ -85,11 +86,10 @@ class HarvesterAPI:
         start = time.time()
         assert len(new_challenge.challenge_hash) == 32
 
-        loop = asyncio.get_running_loop()
-
-        def blocking_lookup(filename: Path, plot_info: PlotInfo) -> List[Tuple[bytes32, ProofOfSpace]]:
+        def blocking_lookup_qualities(filename: Path, plot_info: PlotInfo) -> List[Tuple[int, bytes32]]:
             # Uses the DiskProver object to lookup qualities. This is a blocking call,
-            # so it should be run in a thread pool.
+            # so it should be run in a thread pool. Returns the qualities that are good
+            # enough to fetch the full proof for, with their index
             try:
                 plot_id = plot_info.prover.get_id()
                 sp_challenge_hash = calculate_pos_challenge(
@@ -123,7 +123,7 @@ class HarvesterAPI:
                     )
                     return []
 
-                responses: List[Tuple[bytes32, ProofOfSpace]] = []
+                good_qualities: List[Tuple[int, bytes32]] = []
                 if quality_strings is not None:
                     difficulty = new_challenge.difficulty
                     sub_slot_iters = new_challenge.sub_slot_iters
@@ -149,71 +149,89 @@ class HarvesterAPI:
                         if required_iters < sp_interval_iters:
                             # Found a very good proof of space! will fetch the whole proof from disk,
                             # then send to farmer
-                            try:
-                                proof_xs = plot_info.prover.get_full_proof(
-                                    sp_challenge_hash, index, self.harvester.parallel_read
-                                )
-                            except RuntimeError as e:
-                                if str(e) == "GRResult_NoProof received":
-                                    self.harvester.log.info(
-                                        f"Proof dropped due to line point compression for {filename}"
-                                    )
-                                    self.harvester.log.info(
-                                        f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
-                                        f"plot_info: {plot_info}"
-                                    )
-                                elif str(e) == "Timeout waiting for context queue.":
-                                    self.harvester.log.warning(
-                                        f"No decompressor available. Cancelling full proof retrieving for {filename}"
-                                    )
-                                    self.harvester.log.warning(
-                                        f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
-                                        f"plot_info: {plot_info}"
-                                    )
-                                else:
-                                    self.harvester.log.error(f"Exception fetching full proof for {filename}. {e}")
-                                    self.harvester.log.error(
-                                        f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
-                                        f"plot_info: {plot_info}"
-                                    )
-                                continue
-                            except Exception as e:
-                                self.harvester.log.error(f"Exception fetching full proof for {filename}. {e}")
-                                self.harvester.log.error(
-                                    f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
-                                    f"plot_info: {plot_info}"
-                                )
-                                continue
-
-                            responses.append(
-                                (
-                                    quality_str,
-                                    ProofOfSpace(
-                                        sp_challenge_hash,
-                                        plot_info.pool_public_key,
-                                        plot_info.pool_contract_puzzle_hash,
-                                        plot_info.plot_public_key,
-                                        uint8(plot_info.prover.get_size()),
-                                        proof_xs,
-                                    ),
-                                )
-                            )
-                return responses
+                            good_qualities.append((index, quality_str))
+                return good_qualities
             except Exception as e:
                 self.harvester.log.error(f"Unknown error: {e}")
                 return []
 
+        def blocking_lookup_full_proof(filename: Path, plot_info: PlotInfo, index: int) -> Optional[ProofOfSpace]:
+            # Looks up the full proof for the quality at index, approximately 64 reads.
+            # This is a blocking call, so it should be run in a thread pool
+            try:
+                plot_id = plot_info.prover.get_id()
+                sp_challenge_hash = calculate_pos_challenge(
+                    plot_id,
+                    new_challenge.challenge_hash,
+                    new_challenge.sp_hash,
+                )
+                try:
+                    proof_xs = plot_info.prover.get_full_proof(sp_challenge_hash, index, self.harvester.parallel_read)
+                except RuntimeError as e:
+                    if str(e) == "GRResult_NoProof received":
+                        self.harvester.log.info(f"Proof dropped due to line point compression for {filename}")
+                        self.harvester.log.info(
+                            f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
+                            f"plot_info: {plot_info}"
+                        )
+                    elif str(e) == "Timeout waiting for context queue.":
+                        self.harvester.log.warning(
+                            f"No decompressor available. Cancelling full proof retrieving for {filename}"
+                        )
+                        self.harvester.log.warning(
+                            f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
+                            f"plot_info: {plot_info}"
+                        )
+                    else:
+                        self.harvester.log.error(f"Exception fetching full proof for {filename}. {e}")
+                        self.harvester.log.error(
+                            f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
+                            f"plot_info: {plot_info}"
+                        )
+                    return None
+                except Exception as e:
+                    self.harvester.log.error(f"Exception fetching full proof for {filename}. {e}")
+                    self.harvester.log.error(
+                        f"File: {filename} Plot ID: {plot_id.hex()}, challenge: {sp_challenge_hash}, "
+                        f"plot_info: {plot_info}"
+                    )
+                    return None
+
+                return ProofOfSpace(
+                    sp_challenge_hash,
+                    plot_info.pool_public_key,
+                    plot_info.pool_contract_puzzle_hash,
+                    plot_info.plot_public_key,
+                    uint8(plot_info.prover.get_size()),
+                    proof_xs,
+                )
+            except Exception as e:
+                self.harvester.log.error(f"Unknown error: {e}")
+                return None
+
         async def lookup_challenge(
             filename: Path, plot_info: PlotInfo
         ) -> Tuple[Path, List[harvester_protocol.NewProofOfSpace]]:
-            # Executes a DiskProverLookup in a thread pool, and returns responses
+            # Executes the DiskProver lookups in the thread pool, queued per disk, and returns responses.
+            # Full proofs are fetched ahead of the qualities of other plots on the same disk
             all_responses: List[harvester_protocol.NewProofOfSpace] = []
             if self.harvester._shut_down:
                 return filename, []
-            proofs_of_space_and_q: List[Tuple[bytes32, ProofOfSpace]] = await loop.run_in_executor(
-                self.harvester.executor, blocking_lookup, filename, plot_info
+            good_qualities = await self.harvester.disk_scheduler.run(
+                plot_info.device, filename, LookupPriority.qualities, blocking_lookup_qualities, filename, plot_info
             )
-            for quality_str, proof_of_space in proofs_of_space_and_q:
+            for index, quality_str in good_qualities:
+                proof_of_space = await self.harvester.disk_scheduler.run(
+                    plot_info.device,
+                    filename,
+                    LookupPriority.full_proof,
+                    blocking_lookup_full_proof,
+                    filename,
+                    plot_info,
+                    index,
+                )
+                if proof_of_space is None:
+                    continue
                 all_responses.append(
                     harvester_protocol.NewProofOfSpace(
                         new_challenge.challenge_hash,
@@ -226,23 +244,25 @@ class HarvesterAPI:
             return filename, all_responses
 
         awaitables = []
-        passed = 0
-        total = 0
-        with self.harvester.plot_manager:
-            self.harvester.log.debug("new_signage_point_harvester lock acquired")
-            for try_plot_filename, try_plot_info in self.harvester.plot_manager.plots.items():
-                # Passes the plot filter (does not check sp filter yet though, since we have not reached sp)
-                # This is being executed at the beginning of the slot
-                total += 1
-                if passes_plot_filter(
-                    new_challenge.filter_prefix_bits,
-                    try_plot_info.prover.get_id(),
-                    new_challenge.challenge_hash,
-                    new_challenge.sp_hash,
-                ):
-                    passed += 1
-                    awaitables.append(lookup_challenge(try_plot_filename, try_plot_info))
-            self.harvester.log.debug(f"new_signage_point_harvester {passed} plots passed the plot filter")
+        # the plot filter is evaluated for all plots in one pass, over a snapshot
+        # of the plot IDs. The plot manager is only locked to get the snapshot
+        filter_start = time.monotonic()
+        plot_ids, plots = self.harvester.plot_manager.plot_filter_snapshot()
+        total = len(plots)
+        # Passes the plot filter (does not check sp filter yet though, since we have not reached sp)
+        # This is being executed at the beginning of the slot
+        for index in plots_passing_filter(
+            new_challenge.filter_prefix_bits,
+            plot_ids,
+            new_challenge.challenge_hash,
+            new_challenge.sp_hash,
+        ):
+            awaitables.append(lookup_challenge(*plots[index]))
+        passed = len(awaitables)
+        filter_time = time.monotonic() - filter_start
+        self.harvester.log.debug(
+            f"new_signage_point_harvester {passed} plots passed the plot filter in {filter_time:0.5f} s"
+        )
 
         # Concurrently executes all lookups on disk, to take advantage of multiple disk parallelism
         time_taken = time.time() - start
@@ -279,7 +299,7 @@ class HarvesterAPI:
 
         self.harvester.log.info(
             f"{len(awaitables)} plots were eligible for farming {new_challenge.challenge_hash.hex()[:10]}..."
-            f" Found {total_proofs_found} proofs. Time: {time_taken:.5f} s. "
+            f" Found {total_proofs_found} proofs. Time: {time_taken:.5f} s (plot filter: {filter_time:.5f} s). "
             f"Total {self.harvester.plot_manager.plot_count()} plots"
         )
         self.harvester.state_changed(
@@ -290,6 +310,7 @@ class HarvesterAPI:
                 "found_proofs": total_proofs_found,
                 "eligible_plots": len(awaitables),
                 "time": time_taken,
+                "filter_time": filter_time,
             },
         )
 
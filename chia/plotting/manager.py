@@ -47,6 +47,9 @@ class PlotManager:
     _initial: bool
     max_compression_level_allowed: int
     context_count: int
+    # the plot IDs of all plots concatenated, with the matching plots, for
+    # evaluating the plot filter. Built on demand after the plots change
+    _plot_filter_snapshot: Optional[Tuple[bytes, List[Tuple[Path, PlotInfo]]]]
 
     def __init__(
         self,
@@ -81,6 +84,7 @@ class PlotManager:
         self._initial = True
         self.max_compression_level_allowed = 0
         self.context_count = 0
+        self._plot_filter_snapshot = None
 
     def __enter__(self):
         self._lock.acquire()
@@ -129,6 +133,7 @@ class PlotManager:
         with self:
             self.last_refresh_time = time.time()
             self.plots.clear()
+            self._plot_filter_snapshot = None
             self.plot_filename_paths.clear()
             self.failed_to_open_filenames.clear()
             self.no_key_filenames.clear()
@@ -151,6 +156,20 @@ class PlotManager:
         with self:
             return len(self.plots)
 
+    def plot_filter_snapshot(self) -> Tuple[bytes, List[Tuple[Path, PlotInfo]]]:
+        """
+        Returns the concatenated IDs of all plots and the plots in the same
+        order, to evaluate the plot filter with plots_passing_filter() without
+        holding the lock. The snapshot isn't changed when plots are refreshed,
+        a new one is made instead
+        """
+        with self:
+            if self._plot_filter_snapshot is None:
+                plots = list(self.plots.items())
+                plot_ids = b"".join(plot_info.prover.get_id() for _, plot_info in plots)
+                self._plot_filter_snapshot = (plot_ids, plots)
+            return self._plot_filter_snapshot
+
     def get_duplicates(self) -> List[Path]:
         result = []
         for plot_filename, paths_entry in self.plot_filename_paths.items():
@@ -217,6 +236,7 @@ class PlotManager:
                         with self:
                             if loaded_plot in self.plots:
                                 del self.plots[loaded_plot]
+                                self._plot_filter_snapshot = None
                         total_result.removed.append(loaded_plot)
                         # No need to check the duplicates here since we drop the whole entry
                         continue
@@ -399,6 +419,7 @@ class PlotManager:
                     cache_entry.plot_public_key,
                     stat_info.st_size,
                     stat_info.st_mtime,
+                    stat_info.st_dev,
                 )
 
                 cache_entry.bump_last_use()
@@ -424,6 +445,8 @@ class PlotManager:
                 if new_plot is not None:
                     plots_refreshed[Path(new_plot.prover.get_filename())] = new_plot
             self.plots.update(plots_refreshed)
+            if len(plots_refreshed) > 0:
+                self._plot_filter_snapshot = None
 
         result.duration = time.time() - start_time
 
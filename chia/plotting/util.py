@@ -45,6 +45,8 @@ class PlotInfo:
     plot_public_key: G1Element
     file_size: int
     time_modified: float
+    # the st_dev of the plot file, lookups are scheduled per device
+    device: int = 0
 
 
 class PlotRefreshEvents(Enum):
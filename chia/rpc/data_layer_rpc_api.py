@@ -154,6 +154,22 @@ class DataLayerRpcApi:
             root_hash = bytes32.from_hexstr(root_hash)
         if self.service is None:
             raise Exception("Data layer not created")
+        if "max_page_size" in request:
+            # a page of the keys, ordered by key
+            after_key = request.get("after_key")
+            max_page_size = int(request["max_page_size"])
+            keys = await self.service.get_keys_paginated(
+                store_id,
+                root_hash,
+                after_key=None if after_key is None else hexstr_to_bytes(after_key),
+                max_page_size=max_page_size,
+            )
+            if keys == [] and after_key is None and root_hash is not None and root_hash != bytes32([0] * 32):
+                raise Exception(f"Can't find keys for {root_hash}")
+            return {
+                "keys": [f"0x{key.hex()}" for key in keys],
+                "next_after_key": f"0x{keys[-1].hex()}" if len(keys) == max_page_size else None,
+            }
         keys = await self.service.get_keys(store_id, root_hash)
         if keys == [] and root_hash is not None and root_hash != bytes32([0] * 32):
             raise Exception(f"Can't find keys for {root_hash}")
@@ -166,14 +182,31 @@ class DataLayerRpcApi:
             root_hash = bytes32.from_hexstr(root_hash)
         if self.service is None:
             raise Exception("Data layer not created")
-        res = await self.service.get_keys_values(store_id, root_hash)
+        after_key = request.get("after_key")
+        max_page_size: Optional[int] = None
+        if "max_page_size" in request:
+            # a page of the keys and values, ordered by key
+            max_page_size = int(request["max_page_size"])
+            res = await self.service.get_keys_values_paginated(
+                store_id,
+                root_hash,
+                after_key=None if after_key is None else hexstr_to_bytes(after_key),
+                max_page_size=max_page_size,
+            )
+        else:
+            res = await self.service.get_keys_values(store_id, root_hash)
         json_nodes = []
         for node in res:
             json = recurse_jsonify(dataclasses.asdict(node))
             json_nodes.append(json)
-        if json_nodes == [] and root_hash is not None and root_hash != bytes32([0] * 32):
+        if json_nodes == [] and after_key is None and root_hash is not None and root_hash != bytes32([0] * 32):
             raise Exception(f"Can't find keys and values for {root_hash}")
-        return {"keys_values": json_nodes}
+        if max_page_size is None:
+            return {"keys_values": json_nodes}
+        return {
+            "keys_values": json_nodes,
+            "next_after_key": f"0x{res[-1].key.hex()}" if len(res) == max_page_size else None,
+        }
 
     async def get_ancestors(self, request: Dict[str, Any]) -> EndpointResult:
         store_id = bytes32(hexstr_to_bytes(request["id"]))
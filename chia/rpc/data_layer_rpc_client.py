@@ -32,17 +32,37 @@ class DataLayerRpcClient(RpcClient):
         response = await self.fetch("batch_update", {"id": store_id.hex(), "changelist": changelist, "fee": fee})
         return response
 
-    async def get_keys_values(self, store_id: bytes32, root_hash: Optional[bytes32]) -> Dict[str, Any]:
+    async def get_keys_values(
+        self,
+        store_id: bytes32,
+        root_hash: Optional[bytes32],
+        max_page_size: Optional[int] = None,
+        after_key: Optional[bytes] = None,
+    ) -> Dict[str, Any]:
         request: Dict[str, Any] = {"id": store_id.hex()}
         if root_hash is not None:
             request["root_hash"] = root_hash.hex()
+        if max_page_size is not None:
+            request["max_page_size"] = max_page_size
+        if after_key is not None:
+            request["after_key"] = after_key.hex()
         response = await self.fetch("get_keys_values", request)
         return response
 
-    async def get_keys(self, store_id: bytes32, root_hash: Optional[bytes32]) -> Dict[str, Any]:
+    async def get_keys(
+        self,
+        store_id: bytes32,
+        root_hash: Optional[bytes32],
+        max_page_size: Optional[int] = None,
+        after_key: Optional[bytes] = None,
+    ) -> Dict[str, Any]:
         request: Dict[str, Any] = {"id": store_id.hex()}
         if root_hash is not None:
             request["root_hash"] = root_hash.hex()
+        if max_page_size is not None:
+            request["max_page_size"] = max_page_size
+        if after_key is not None:
+            request["after_key"] = after_key.hex()
         response = await self.fetch("get_keys", request)
         return response
 
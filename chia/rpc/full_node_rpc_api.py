@@ -239,12 +239,19 @@ class FullNodeRpcApi:
             mempool_fees = self.service.mempool_manager.mempool.total_mempool_fees()
             mempool_min_fee_5m = self.service.mempool_manager.mempool.get_min_fee_rate(5000000)
             mempool_max_total_cost = self.service.mempool_manager.mempool_max_total_cost
+            validation_stats = self.service.mempool_manager.validation_stats
+            mempool_validation = {
+                "validated": validation_stats.validated,
+                "tx_per_second": validation_stats.tx_per_second,
+                "queue_latency": validation_stats.queue_latency,
+            }
         else:
             mempool_size = 0
             mempool_cost = 0
             mempool_fees = 0
             mempool_min_fee_5m = 0
             mempool_max_total_cost = 0
+            mempool_validation = {"validated": 0, "tx_per_second": 0.0, "queue_latency": 0.0}
         if self.service.server is not None:
             is_connected = len(self.service.server.get_connections(NodeType.FULL_NODE)) > 0 or "simulator" in str(
                 self.service.config.get("selected_network")
@@ -277,6 +284,7 @@ class FullNodeRpcApi:
                     "cost_5000000": mempool_min_fee_5m,
                 },
                 "mempool_max_total_cost": mempool_max_total_cost,
+                "mempool_validation": mempool_validation,
                 "block_max_cost": self.service.constants.MAX_BLOCK_COST_CLVM,
                 "node_id": node_id,
             },
@@ -23,6 +23,7 @@ class HarvesterRpcApi:
             "/remove_plot_directory": self.remove_plot_directory,
             "/get_harvester_config": self.get_harvester_config,
             "/update_harvester_config": self.update_harvester_config,
+            "/get_disk_stats": self.get_disk_stats,
         }
 
     async def _state_changed(self, change: str, change_data: Optional[Dict[str, Any]] = None) -> List[WsRpcMessage]:
@@ -82,6 +83,9 @@ class HarvesterRpcApi:
             return {}
         raise ValueError(f"Did not remove plot directory {directory_name}")
 
+    async def get_disk_stats(self, _: Dict[str, Any]) -> EndpointResult:
+        return {"disks": self.service.disk_scheduler.disk_stats()}
+
     async def get_harvester_config(self, _: Dict[str, Any]) -> EndpointResult:
         harvester_config = await self.service.get_harvester_config()
         return {
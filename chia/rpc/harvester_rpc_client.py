@@ -44,6 +44,12 @@ class HarvesterRpcClient(RpcClient):
         result = cast(bool, response["success"])
         return result
 
+    async def get_disk_stats(self) -> List[Dict[str, Any]]:
+        response = await self.fetch("get_disk_stats", {})
+        # TODO: casting due to lack of type checked deserialization
+        result = cast(List[Dict[str, Any]], response["disks"])
+        return result
+
     async def get_harvester_config(self) -> Dict[str, Any]:
         return await self.fetch("get_harvester_config", {})
 
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import hashlib
 import logging
 from dataclasses import dataclass
-from typing import Optional, cast
+from typing import List, Optional, cast
 
 from bitstring import BitArray
 from chia_rs import AugSchemeMPL, G1Element, PrivateKey
@@ -95,6 +96,33 @@ def passes_plot_filter(
     return cast(bool, plot_filter[:prefix_bits].uint == 0)
 
 
+def plots_passing_filter(
+    prefix_bits: int,
+    plot_ids: bytes,
+    challenge_hash: bytes32,
+    signage_point: bytes32,
+) -> List[int]:
+    """
+    Evaluates the plot filter for many plots in one pass. plot_ids is the
+    concatenation of the 32 byte plot IDs. Returns the indices of the plots that
+    pass the filter, the same ones passes_plot_filter() accepts
+    """
+    assert len(plot_ids) % 32 == 0
+    if prefix_bits == 0:
+        return list(range(len(plot_ids) // 32))
+
+    suffix = challenge_hash + signage_point
+    zero_bytes, rest_bits = divmod(prefix_bits, 8)
+    zeros = bytes(zero_bytes)
+    sha256 = hashlib.sha256
+    passed: List[int] = []
+    for index, offset in enumerate(range(0, len(plot_ids), 32)):
+        digest = sha256(plot_ids[offset : offset + 32] + suffix).digest()
+        if digest[:zero_bytes] == zeros and (rest_bits == 0 or (digest[zero_bytes] >> (8 - rest_bits)) == 0):
+            passed.append(index)
+    return passed
+
+
 def calculate_prefix_bits(constants: ConsensusConstants, height: uint32) -> int:
     prefix_bits = constants.NUMBER_ZERO_BITS_PLOT_FILTER
     if height >= constants.PLOT_FILTER_32_HEIGHT:
@@ -102,6 +102,7 @@ class Field:
     parse_function: ParseFunctionType
     convert_function: ConvertFunctionType
     post_init_function: ConvertFunctionType
+    jsonify_function: ConvertFunctionType
 
 
 StreamableFields = Tuple[Field, ...]
@@ -122,6 +123,7 @@ def create_fields(cls: Type[DataclassInstance]) -> StreamableFields:
                 parse_function=function_to_parse_one_item(hint),
                 convert_function=function_to_convert_one_item(hint),
                 post_init_function=function_to_post_init_process_one_item(hint),
+                jsonify_function=function_to_jsonify_one_item(hint),
             )
         )
 
@@ -295,7 +297,9 @@ def recurse_jsonify(d: Any) -> Any:
     Makes bytes objects and unhashable types into strings with 0x, and makes large ints into
     strings.
     """
-    if dataclasses.is_dataclass(d):
+    if isinstance(d, Streamable):
+        return streamable_to_json_dict(d)
+    elif dataclasses.is_dataclass(d):
         new_dict = {}
         for field in dataclasses.fields(d):
             new_dict[field.name] = recurse_jsonify(getattr(d, field.name))
@@ -329,6 +333,55 @@ def recurse_jsonify(d: Any) -> Any:
     raise UnsupportedType(f"failed to jsonify {d} (type: {type(d)})")
 
 
+def jsonify_hex(item: Any) -> str:
+    return f"0x{bytes(item).hex()}"
+
+
+def jsonify_int(item: Any) -> int:
+    return int(item)
+
+
+def jsonify_list(jsonify_func: ConvertFunctionType, items: Collection[Any]) -> List[Any]:
+    return [jsonify_func(item) for item in items]
+
+
+def jsonify_tuple(jsonify_funcs: List[ConvertFunctionType], items: Collection[Any]) -> List[Any]:
+    return [jsonify_func(item) for jsonify_func, item in zip(jsonify_funcs, items)]
+
+
+def function_to_jsonify_one_item(f_type: Type[Any]) -> ConvertFunctionType:
+    """
+    Returns a function which gives the same result as recurse_jsonify() for items of
+    f_type, without looking up the type of every item at runtime.
+    """
+    if is_type_SpecificOptional(f_type):
+        jsonify_inner_func = function_to_jsonify_one_item(get_args(f_type)[0])
+        return lambda item: convert_optional(jsonify_inner_func, item)
+    elif is_type_Tuple(f_type):
+        jsonify_inner_tuple_funcs = [function_to_jsonify_one_item(arg) for arg in get_args(f_type)]
+        return lambda items: jsonify_tuple(jsonify_inner_tuple_funcs, items)  # type: ignore[arg-type]
+    elif is_type_List(f_type):
+        jsonify_inner_func = function_to_jsonify_one_item(get_args(f_type)[0])
+        return lambda items: jsonify_list(jsonify_inner_func, items)  # type: ignore[arg-type]
+    elif not isinstance(f_type, type):
+        return recurse_jsonify
+    elif issubclass(f_type, Streamable):
+        return streamable_to_json_dict  # type: ignore[return-value]
+    elif f_type.__name__ in unhashable_types or issubclass(f_type, bytes):
+        return jsonify_hex
+    elif issubclass(f_type, Enum):
+        return recurse_jsonify
+    elif f_type is bool or f_type is str:
+        return lambda item: item
+    elif issubclass(f_type, int):
+        return jsonify_int
+    return recurse_jsonify
+
+
+def streamable_to_json_dict(item: Streamable) -> Dict[str, Any]:
+    return {field.name: field.jsonify_function(getattr(item, field.name)) for field in item._streamable_fields}
+
+
 def parse_bool(f: BinaryIO) -> bool:
     bool_byte = f.read(1)
     assert bool_byte is not None and len(bool_byte) == 1  # Checks for EOF
@@ -640,8 +693,7 @@ class Streamable:
         return pp.pformat(recurse_jsonify(self))
 
     def to_json_dict(self) -> Dict[str, Any]:
-        ret: Dict[str, Any] = recurse_jsonify(self)
-        return ret
+        return streamable_to_json_dict(self)
 
     @classmethod
     def from_json_dict(cls: Type[_T_Streamable], json_dict: Dict[str, Any]) -> _T_Streamable:
@@ -56,6 +56,30 @@ def master_sk_to_wallet_sk_unhardened(master: PrivateKey, index: uint32) -> Priv
     return _derive_path_unhardened(intermediate, [index])
 
 
+def derive_wallet_puzzle_hashes(
+    intermediate_sk: PrivateKey, intermediate_pk_unhardened: G1Element, start: int, end: int
+) -> List[Tuple[G1Element, bytes32, G1Element, bytes32]]:
+    """
+    Derives the hardened and unhardened wallet public keys, and their standard
+    puzzle hashes, for the indexes from start up to (excluding) end. The
+    unhardened keys are derived from the intermediate public key. This is CPU
+    bound, large ranges should be derived in a thread
+    """
+    result: List[Tuple[G1Element, bytes32, G1Element, bytes32]] = []
+    for index in range(start, end):
+        pubkey = AugSchemeMPL.derive_child_sk(intermediate_sk, index).get_g1()
+        pubkey_unhardened = AugSchemeMPL.derive_child_pk_unhardened(intermediate_pk_unhardened, index)
+        result.append(
+            (
+                pubkey,
+                create_puzzlehash_for_pk(pubkey),
+                pubkey_unhardened,
+                create_puzzlehash_for_pk(pubkey_unhardened),
+            )
+        )
+    return result
+
+
 def master_sk_to_local_sk(master: PrivateKey) -> PrivateKey:
     return _derive_path(master, [12381, 8444, 3, 0])
 
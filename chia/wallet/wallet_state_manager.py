@@ -78,8 +78,7 @@ from chia.wallet.dao_wallet.dao_wallet import DAOWallet
 from chia.wallet.db_wallet.db_wallet_puzzles import MIRROR_PUZZLE_HASH
 from chia.wallet.derivation_record import DerivationRecord
 from chia.wallet.derive_keys import (
-    _derive_path,
-    _derive_path_unhardened,
+    derive_wallet_puzzle_hashes,
     master_sk_to_wallet_sk,
     master_sk_to_wallet_sk_intermediate,
     master_sk_to_wallet_sk_unhardened,
@@ -196,6 +195,8 @@ class WalletStateManager:
     default_cats: Dict[str, Any]
     asset_to_wallet_map: Dict[AssetType, Any]
     initial_num_public_keys: int
+    # how many derivation indexes are derived and stored at a time
+    puzzle_hash_batch_size: int = 1000
     decorator_manager: PuzzleDecoratorManager
 
     @staticmethod
@@ -405,6 +406,23 @@ class WalletStateManager:
         to_generate = num_additional_phs if num_additional_phs is not None else self.initial_num_public_keys
         new_paths: bool = False
 
+        # the keys and standard puzzle hashes are derived once for all wallets,
+        # in batches, in a thread. The derivation is CPU bound and would block
+        # the event loop otherwise
+        intermediate_sk = master_sk_to_wallet_sk_intermediate(self.private_key)
+        intermediate_pk_un = master_sk_to_wallet_sk_unhardened_intermediate(self.private_key).get_g1()
+        derived_keys: Dict[int, Tuple[G1Element, bytes32, G1Element, bytes32]] = {}
+
+        async def derive_batch(batch_start: int, batch_end: int) -> None:
+            missing = [index for index in range(batch_start, batch_end) if index not in derived_keys]
+            if len(missing) == 0:
+                return
+            batch = await asyncio.get_running_loop().run_in_executor(
+                None, derive_wallet_puzzle_hashes, intermediate_sk, intermediate_pk_un, missing[0], missing[-1] + 1
+            )
+            for index, keys in enumerate(batch, start=missing[0]):
+                derived_keys[index] = keys
+
         for wallet_id in targets:
             target_wallet = self.wallets[wallet_id]
             if not target_wallet.require_derivation_paths():
@@ -415,7 +433,6 @@ class WalletStateManager:
                 "Fetched last record for wallet %r:  %s (from_zero=%r, unused=%r)", wallet_id, last, from_zero, unused
             )
             start_index = 0
-            derivation_paths: List[DerivationRecord] = []
 
             if last is not None:
                 start_index = last + 1
@@ -426,25 +443,28 @@ class WalletStateManager:
             last_index = unused + to_generate
             if start_index >= last_index:
                 self.log.debug(f"Nothing to create for for wallet_id: {wallet_id}, index: {start_index}")
-            else:
-                creating_msg = (
-                    f"Creating puzzle hashes from {start_index} to {last_index - 1} for wallet_id: {wallet_id}"
-                )
-                self.log.info(f"Start: {creating_msg}")
-                intermediate_sk = master_sk_to_wallet_sk_intermediate(self.private_key)
-                intermediate_sk_un = master_sk_to_wallet_sk_unhardened_intermediate(self.private_key)
-                for index in range(start_index, last_index):
-                    if target_wallet.type() == WalletType.POOLING_WALLET:
-                        continue
+                continue
+            if target_wallet.type() == WalletType.POOLING_WALLET:
+                continue
 
-                    # Hardened
-                    pubkey: G1Element = _derive_path(intermediate_sk, [index]).get_g1()
-                    puzzlehash: Optional[bytes32] = target_wallet.puzzle_hash_for_pk(pubkey)
-                    if puzzlehash is None:
-                        self.log.error(f"Unable to create puzzles with wallet {target_wallet}")
-                        break
-                    self.log.debug(f"Puzzle at index {index} wallet ID {wallet_id} puzzle hash {puzzlehash.hex()}")
-                    new_paths = True
+            creating_msg = f"Creating puzzle hashes from {start_index} to {last_index - 1} for wallet_id: {wallet_id}"
+            self.log.info(f"Start: {creating_msg}")
+            # the standard wallet's puzzle hashes are the derived ones, other wallets wrap them
+            is_standard_wallet = target_wallet.type() == WalletType.STANDARD_WALLET
+            failed = False
+            for batch_start in range(start_index, last_index, self.puzzle_hash_batch_size):
+                batch_end = min(batch_start + self.puzzle_hash_batch_size, last_index)
+                await derive_batch(batch_start, batch_end)
+                derivation_paths: List[DerivationRecord] = []
+                for index in range(batch_start, batch_end):
+                    pubkey, puzzlehash, pubkey_unhardened, puzzlehash_unhardened = derived_keys[index]
+                    if not is_standard_wallet:
+                        puzzlehash = target_wallet.puzzle_hash_for_pk(pubkey)
+                        puzzlehash_unhardened = target_wallet.puzzle_hash_for_pk(pubkey_unhardened)
+                        if puzzlehash is None or puzzlehash_unhardened is None:
+                            self.log.error(f"Unable to create puzzles with wallet {target_wallet}")
+                            failed = True
+                            break
                     derivation_paths.append(
                         DerivationRecord(
                             uint32(index),
@@ -455,18 +475,6 @@ class WalletStateManager:
                             True,
                         )
                     )
-                    # Unhardened
-                    pubkey_unhardened: G1Element = _derive_path_unhardened(intermediate_sk_un, [index]).get_g1()
-                    puzzlehash_unhardened: Optional[bytes32] = target_wallet.puzzle_hash_for_pk(pubkey_unhardened)
-                    if puzzlehash_unhardened is None:
-                        self.log.error(f"Unable to create puzzles with wallet {target_wallet}")
-                        break
-                    self.log.debug(
-                        f"Puzzle at index {index} wallet ID {wallet_id} puzzle hash {puzzlehash_unhardened.hex()}"
-                    )
-                    # We await sleep here to allow an asyncio context switch (since the other parts of this loop do
-                    # not have await and therefore block). This can prevent networking layer from responding to ping.
-                    await asyncio.sleep(0)
                     derivation_paths.append(
                         DerivationRecord(
                             uint32(index),
@@ -477,14 +485,18 @@ class WalletStateManager:
                             False,
                         )
                     )
-                self.log.info(f"Done: {creating_msg} Time: {time.time() - start_t} seconds")
-            await self.puzzle_store.add_derivation_paths(derivation_paths)
-            if len(derivation_paths) > 0:
-                if wallet_id == self.main_wallet.id():
-                    await self.wallet_node.new_peak_queue.subscribe_to_puzzle_hashes(
-                        [record.puzzle_hash for record in derivation_paths]
-                    )
-                self.state_changed("new_derivation_index", data_object={"index": derivation_paths[-1].index})
+                # each batch is stored as soon as it's derived
+                if len(derivation_paths) > 0:
+                    new_paths = True
+                    await self.puzzle_store.add_derivation_paths(derivation_paths)
+                    if wallet_id == self.main_wallet.id():
+                        await self.wallet_node.new_peak_queue.subscribe_to_puzzle_hashes(
+                            [record.puzzle_hash for record in derivation_paths]
+                        )
+                    self.state_changed("new_derivation_index", data_object={"index": derivation_paths[-1].index})
+                if failed:
+                    break
+            self.log.info(f"Done: {creating_msg} Time: {time.time() - start_t} seconds")
         # By default, we'll mark previously generated unused puzzle hashes as used if we have new paths
         if mark_existing_as_used and unused > 0 and new_paths:
             self.log.info(f"Updating last used derivation index: {unused - 1}")
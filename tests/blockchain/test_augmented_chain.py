@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional, cast
+
+import pytest
+
+from chia.consensus.augmented_chain import AugmentedBlockchain
+from chia.consensus.block_record import BlockRecord
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.util.block_cache import BlockCache
+from chia.util.ints import uint32
+
+
+@dataclass(frozen=True)
+class FakeBlockRecord:
+    height: uint32
+    header_hash: bytes32
+    prev_hash: bytes32
+
+
+class FakeChain(BlockCache):
+    def __init__(self, records: List[BlockRecord]) -> None:
+        super().__init__(
+            {br.header_hash: br for br in records},
+            height_to_hash={br.height: br.header_hash for br in records},
+        )
+
+    def get_peak_height(self) -> Optional[uint32]:
+        return max(self._height_to_hash.keys(), default=None)
+
+
+def make_chain(start: int, end: int, prev: bytes32) -> List[BlockRecord]:
+    ret: List[BlockRecord] = []
+    for height in range(start, end):
+        header_hash = bytes32(height.to_bytes(32, "big"))
+        ret.append(cast(BlockRecord, FakeBlockRecord(uint32(height), header_hash, prev)))
+        prev = header_hash
+    return ret
+
+
+@pytest.mark.anyio
+async def test_extra_blocks() -> None:
+    main_chain = make_chain(0, 10, bytes32([0] * 32))
+    extra = make_chain(10, 15, main_chain[-1].header_hash)
+    underlying = FakeChain(main_chain)
+    chain = AugmentedBlockchain(underlying)
+
+    for br in extra:
+        assert not chain.contains_block(br.header_hash)
+        chain.add_extra_block(br)
+    assert chain.num_extra_blocks() == 5
+
+    for br in main_chain + extra:
+        assert chain.contains_block(br.header_hash)
+        assert await chain.contains_block_from_db(br.header_hash)
+        assert chain.block_record(br.header_hash) == br
+        assert await chain.get_block_record_from_db(br.header_hash) == br
+        assert chain.contains_height(br.height)
+        assert chain.height_to_hash(br.height) == br.header_hash
+        assert chain.height_to_block_record(br.height) == br
+    assert await chain.prev_block_hash([extra[2].header_hash, main_chain[2].header_hash]) == [
+        extra[1].header_hash,
+        main_chain[1].header_hash,
+    ]
+    assert await chain.get_block_records_at([uint32(9), uint32(10), uint32(11)]) == [
+        main_chain[9],
+        extra[0],
+        extra[1],
+    ]
+
+    # the underlying chain is not affected
+    assert not underlying.contains_block(extra[0].header_hash)
+    assert not underlying.contains_height(uint32(10))
+
+    for br in extra:
+        chain.remove_extra_block(br.header_hash)
+    assert chain.num_extra_blocks() == 0
+    assert not chain.contains_block(extra[0].header_hash)
+    assert not chain.contains_height(uint32(10))
+
+
+def test_add_block_record() -> None:
+    main_chain = make_chain(0, 10, bytes32([0] * 32))
+    underlying = FakeChain(main_chain[:5])
+    chain = AugmentedBlockchain(underlying)
+    new_blocks = make_chain(10, 12, main_chain[-1].header_hash)
+
+    # records at or below the underlying peak are added to the underlying
+    # cache, records above it only to ours
+    for br in [main_chain[0]] + new_blocks:
+        chain.add_block_record(br)
+    assert underlying.contains_block(main_chain[0].header_hash)
+    for br in new_blocks:
+        assert chain.contains_block(br.header_hash)
+        assert not underlying.contains_block(br.header_hash)
+        chain.remove_block_record(br.header_hash)
+        assert not chain.contains_block(br.header_hash)
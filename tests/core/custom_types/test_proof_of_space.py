@@ -8,7 +8,12 @@ import pytest
 from chia_rs import G1Element
 
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
-from chia.types.blockchain_format.proof_of_space import ProofOfSpace, passes_plot_filter, verify_and_get_quality_string
+from chia.types.blockchain_format.proof_of_space import (
+    ProofOfSpace,
+    passes_plot_filter,
+    plots_passing_filter,
+    verify_and_get_quality_string,
+)
 from chia.types.blockchain_format.sized_bytes import bytes32, bytes48
 from chia.util.ints import uint8, uint32
 from tests.util.misc import Marks, datacases
@@ -142,3 +147,16 @@ class TestProofOfSpace:
                 success_count += 1
 
         assert abs((success_count * target_filter / num_trials) - 1) < 0.35
+
+    @pytest.mark.parametrize("prefix_bits", [DEFAULT_CONSTANTS.NUMBER_ZERO_BITS_PLOT_FILTER, 8, 5, 1, 0, 13])
+    def test_plots_passing_filter(self, prefix_bits: int, seeded_random: random.Random) -> None:
+        challenge_hash = bytes32.random(seeded_random)
+        sp_output = bytes32.random(seeded_random)
+        plot_ids = [bytes32.random(seeded_random) for _ in range(20000)]
+        expected = [
+            index
+            for index, plot_id in enumerate(plot_ids)
+            if passes_plot_filter(prefix_bits, plot_id, challenge_hash, sp_output)
+        ]
+        assert plots_passing_filter(prefix_bits, b"".join(plot_ids), challenge_hash, sp_output) == expected
+        assert plots_passing_filter(prefix_bits, b"", challenge_hash, sp_output) == []
@@ -373,6 +373,14 @@ async def test_keys_values_ancestors(
         assert len(keys["keys"]) == len(dic)
         for key in keys["keys"]:
             assert key in dic
+        page = await data_rpc_api.get_keys({"id": store_id.hex(), "max_page_size": 3})
+        assert page["keys"] == ["0x" + key.hex() for key in (key1, key2, key3)]
+        assert page["next_after_key"] == "0x" + key3.hex()
+        page = await data_rpc_api.get_keys_values(
+            {"id": store_id.hex(), "max_page_size": 3, "after_key": page["next_after_key"]}
+        )
+        assert [item["key"] for item in page["keys_values"]] == ["0x" + key.hex() for key in (key4, key5)]
+        assert page["next_after_key"] is None
         val = await data_rpc_api.get_ancestors({"id": store_id.hex(), "hash": val["keys_values"][4]["hash"]})
         # todo better assertions for get_ancestors result
         assert len(val["ancestors"]) == 3
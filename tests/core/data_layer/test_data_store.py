@@ -38,6 +38,7 @@ from chia.data_layer.download_data import (
     is_filename_valid,
     write_files_for_root,
 )
+from chia.data_layer.tree_file import TreeFileFormat, TreeFileWriter, read_tree_file
 from chia.types.blockchain_format.program import Program
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.util.byte_types import hexstr_to_bytes
@@ -54,6 +55,8 @@ pytestmark = pytest.mark.data_layer
 table_columns: Dict[str, List[str]] = {
     "node": ["hash", "node_type", "left", "right", "key", "value"],
     "root": ["tree_id", "generation", "node_hash", "status"],
+    "key_index": ["tree_id", "key", "hash", "generation_added", "generation_removed"],
+    "key_index_generations": ["tree_id", "first_generation", "last_generation"],
 }
 
 
@@ -1149,6 +1152,80 @@ async def test_rollback_to_generation(data_store: DataStore, tree_id: bytes32) -
         assert root.node_hash == expected_hash
 
 
+@pytest.mark.anyio
+async def test_key_index_follows_generations(data_store: DataStore, tree_id: bytes32) -> None:
+    random = Random()
+    random.seed(100, version=2)
+    keys: List[bytes] = []
+    for i in range(60):
+        if len(keys) > 0 and random.random() < 0.3:
+            key = keys.pop(random.randrange(len(keys)))
+            await data_store.delete(key=key, tree_id=tree_id, status=Status.COMMITTED)
+        else:
+            key = i.to_bytes(4, byteorder="big")
+            keys.append(key)
+            await data_store.autoinsert(key=key, value=bytes([i]), tree_id=tree_id, status=Status.COMMITTED)
+        if i % 20 == 0:
+            await data_store.insert_batch(
+                tree_id=tree_id,
+                changelist=[{"action": "insert", "key": b"batch" + key, "value": b"\x01"}],
+                status=Status.COMMITTED,
+            )
+            keys.append(b"batch" + key)
+
+    async def check_all_roots() -> None:
+        root = await data_store.get_tree_root(tree_id=tree_id)
+        for generation in range(root.generation + 1):
+            node_hash = (await data_store.get_tree_root(tree_id=tree_id, generation=generation)).node_hash
+            if node_hash is None:
+                continue
+            expected = await data_store.get_keys_values(tree_id=tree_id, root_hash=node_hash)
+            expected.sort(key=lambda node: node.key)
+            assert await data_store._get_key_index_generation(tree_id=tree_id, root_hash=node_hash) is not None
+            pages: List[TerminalNode] = []
+            after_key = None
+            while True:
+                page = await data_store.get_keys_values_paginated(
+                    tree_id=tree_id, root_hash=node_hash, after_key=after_key, max_page_size=7
+                )
+                pages.extend(page)
+                if len(page) < 7:
+                    break
+                after_key = page[-1].key
+            assert pages == expected
+            node = expected[-1]
+            assert await data_store.get_node_by_key(key=node.key, tree_id=tree_id, root_hash=node_hash) == node
+
+    await check_all_roots()
+    assert sorted(await data_store.get_keys_paginated(tree_id=tree_id, max_page_size=1000)) == sorted(keys)
+
+    await data_store.rollback_to_generation(tree_id, 30)
+    await data_store.autoinsert(key=b"after rollback", value=b"\x02", tree_id=tree_id, status=Status.COMMITTED)
+    await check_all_roots()
+
+    pending = await data_store.autoinsert(key=b"pending", value=b"\x03", tree_id=tree_id)
+    assert await data_store._get_key_index_generation(tree_id=tree_id, root_hash=pending.root.node_hash) is None
+    await data_store.change_root_status(pending.root, Status.COMMITTED)
+    node = await data_store.get_node_by_key(key=b"pending", tree_id=tree_id)
+    assert node.value == b"\x03"
+    await check_all_roots()
+
+
+@pytest.mark.anyio
+async def test_get_keys_values_paginated_without_key_index(data_store: DataStore, tree_id: bytes32) -> None:
+    await add_01234567_example(data_store=data_store, tree_id=tree_id)
+    async with data_store.db_wrapper.writer() as writer:
+        await writer.execute("DELETE FROM key_index")
+        await writer.execute("DELETE FROM key_index_generations")
+
+    expected = sorted(await data_store.get_keys_values(tree_id=tree_id), key=lambda node: node.key)
+    assert await data_store._get_key_index_generation(tree_id=tree_id, root_hash=None) is None
+    first_page = await data_store.get_keys_values_paginated(tree_id=tree_id, max_page_size=3)
+    rest = await data_store.get_keys_values_paginated(tree_id=tree_id, after_key=first_page[-1].key)
+    assert first_page + rest == expected
+    assert await data_store.get_keys_paginated(tree_id=tree_id, max_page_size=2) == [node.key for node in expected[:2]]
+
+
 @pytest.mark.anyio
 async def test_subscribe_unsubscribe(data_store: DataStore, tree_id: bytes32) -> None:
     await data_store.subscribe(Subscription(tree_id, [ServerInfo("http://127:0:0:1/8000", 1, 1)]))
@@ -1261,8 +1338,11 @@ async def test_server_selection(data_store: DataStore, tree_id: bytes32) -> None
     "test_delta",
     [True, False],
 )
+@pytest.mark.parametrize("file_format", TreeFileFormat)
 @pytest.mark.anyio
-async def test_data_server_files(data_store: DataStore, tree_id: bytes32, test_delta: bool, tmp_path: Path) -> None:
+async def test_data_server_files(
+    data_store: DataStore, tree_id: bytes32, test_delta: bool, file_format: TreeFileFormat, tmp_path: Path
+) -> None:
     roots: List[Root] = []
     num_batches = 10
     num_ops_per_batch = 100
@@ -1292,7 +1372,7 @@ async def test_data_server_files(data_store: DataStore, tree_id: bytes32, test_d
                 counter += 1
             await data_store_server.insert_batch(tree_id, changelist, status=Status.COMMITTED)
             root = await data_store_server.get_tree_root(tree_id)
-            await write_files_for_root(data_store_server, tree_id, root, tmp_path, 0)
+            await write_files_for_root(data_store_server, tree_id, root, tmp_path, 0, file_format=file_format)
             roots.append(root)
     finally:
         await data_store_server.close()
@@ -1312,6 +1392,49 @@ async def test_data_server_files(data_store: DataStore, tree_id: bytes32, test_d
         generation += 1
 
 
+@pytest.mark.parametrize("file_format", TreeFileFormat)
+@pytest.mark.anyio
+async def test_tree_file_checks(
+    data_store: DataStore, tree_id: bytes32, file_format: TreeFileFormat, tmp_path: Path
+) -> None:
+    await add_01234567_example(data_store=data_store, tree_id=tree_id)
+    root = await data_store.get_tree_root(tree_id=tree_id)
+    assert root.node_hash is not None
+    root_node = await data_store.get_node(root.node_hash)
+    assert isinstance(root_node, InternalNode)
+    filename = tmp_path.joinpath("full.dat")
+    with open(filename, "wb") as writer:
+        await data_store.write_tree_to_file(root, root.node_hash, tree_id, False, writer, file_format)
+    with open(filename, "rb") as reader:
+        nodes = list(read_tree_file(reader))
+    assert len(nodes) == 15
+    assert nodes[0] == (NodeType.TERMINAL, b"\x00", b"\x10\x00")
+    assert nodes[-1] == (NodeType.INTERNAL, root_node.left_hash, root_node.right_hash)
+
+    other_tree_id = bytes32(b"\x01" * 32)
+    await data_store.create_tree(tree_id=other_tree_id, status=Status.COMMITTED)
+    with pytest.raises(Exception, match="doesn't match the root hash"):
+        await insert_into_data_store_from_file(data_store, other_tree_id, bytes32([1] * 32), filename)
+    assert (await data_store.get_tree_root(tree_id=other_tree_id)).generation == 0
+
+    # a delta file whose parent refers to a node the store doesn't have
+    with open(filename, "wb") as file:
+        writer = TreeFileWriter(file, file_format)
+        writer.write_internal(bytes32([2] * 32), bytes32([3] * 32))
+        writer.finish()
+    with pytest.raises(Exception, match="refers to unknown nodes"):
+        await insert_into_data_store_from_file(data_store, other_tree_id, None, filename)
+
+    # truncated
+    with open(filename, "wb") as writer:
+        await data_store.write_tree_to_file(root, root.node_hash, tree_id, False, writer, file_format)
+    with open(filename, "r+b") as file:
+        file.truncate(filename.stat().st_size - 10)
+    with pytest.raises(Exception, match="Incomplete"):
+        await insert_into_data_store_from_file(data_store, other_tree_id, root.node_hash, filename)
+    assert (await data_store.get_tree_root(tree_id=other_tree_id)).generation == 0
+
+
 @pytest.mark.anyio
 async def test_pending_roots(data_store: DataStore, tree_id: bytes32) -> None:
     key = b"\x01\x02"
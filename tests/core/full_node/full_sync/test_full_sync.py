@@ -5,20 +5,23 @@ import asyncio
 import dataclasses
 import logging
 import time
-from typing import List
+from typing import List, Optional
 
 import pytest
 
+from chia.consensus.augmented_chain import AugmentedBlockchain
+from chia.consensus.blockchain_interface import BlockchainInterface
 from chia.full_node.full_node import FullNode
 from chia.full_node.full_node_api import FullNodeAPI
 from chia.protocols import full_node_protocol
 from chia.protocols.shared_protocol import Capability
+from chia.simulator.wallet_tools import WalletTool
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
 from chia.types.full_block import FullBlock
 from chia.types.peer_info import PeerInfo
 from chia.util.hash import std_hash
-from chia.util.ints import uint16
+from chia.util.ints import uint16, uint32, uint64
 from tests.conftest import ConsensusMode
 from tests.core.node_height import node_height_between, node_height_exactly
 from tests.util.time_out_assert import time_out_assert
@@ -372,6 +375,87 @@ class TestFullSync:
             # assert we failed somewhere between sub epoch 0 to sub epoch 1
             assert node_height_between(full_node_2, summary_heights[0], summary_heights[1])
 
+    @pytest.mark.anyio
+    @pytest.mark.limit_consensus_modes(
+        allowed=[ConsensusMode.PLAIN, ConsensusMode.SOFT_FORK3], reason="no generator refs after the hard fork"
+    )
+    @pytest.mark.parametrize("pipeline_depth", [0, 2])
+    async def test_sync_pipeline_generator_refs(
+        self, two_nodes, self_hostname, monkeypatch, pipeline_depth, consensus_mode
+    ):
+        full_node_1, full_node_2, server_1, server_2, bt = two_nodes
+        wallet = WalletTool(bt.constants)
+        ph = wallet.get_new_puzzlehash()
+        blocks = bt.get_consecutive_blocks(
+            20, farmer_reward_puzzle_hash=ph, pool_reward_puzzle_hash=ph, guarantee_transaction_block=True
+        )
+        coins = [c for b in blocks for c in b.get_included_reward_coins() if c.puzzle_hash == ph]
+
+        # a transaction block in the first batch, referenced by blocks in the
+        # next two batches. The batch size is 32
+        blocks = bt.get_consecutive_blocks(
+            1,
+            blocks,
+            transaction_data=wallet.generate_signed_transaction(uint64(1000), ph, coins[0]),
+            guarantee_transaction_block=True,
+        )
+        ref_height = blocks[-1].height
+        assert ref_height < 32
+        for target in (34, 66):
+            blocks = bt.get_consecutive_blocks(target - len(blocks), blocks)
+            blocks = bt.get_consecutive_blocks(
+                1,
+                blocks,
+                previous_generator=[ref_height],
+                transaction_data=wallet.generate_signed_transaction(uint64(1000), ph, coins.pop()),
+                guarantee_transaction_block=True,
+            )
+            assert blocks[-1].transactions_generator_ref_list == [ref_height]
+        blocks = bt.get_consecutive_blocks(5, blocks)
+
+        for block in blocks:
+            await full_node_1.full_node.add_block(block)
+        peak1 = full_node_1.full_node.blockchain.get_peak()
+        assert peak1 is not None
+
+        node = full_node_2.full_node
+        node.config["sync_pipeline_depth"] = pipeline_depth
+        prevalidate_blocks = node.prevalidate_blocks
+        pipelined_batches = 0
+
+        async def check_prevalidate_blocks(
+            blocks_to_validate: List[FullBlock], *args: object, **kwargs: object
+        ) -> object:
+            nonlocal pipelined_batches
+            block_records: Optional[BlockchainInterface] = args[2] if len(args) > 2 else kwargs.get("block_records")
+            if isinstance(block_records, AugmentedBlockchain) and block_records.num_extra_blocks() > 0:
+                pipelined_batches += 1
+            # the generators referenced by a batch must have been added to the
+            # chain before the batch is pre-validated
+            for block in blocks_to_validate:
+                for height in block.transactions_generator_ref_list:
+                    assert node.blockchain.height_to_hash(uint32(height)) == blocks[height].header_hash
+            return await prevalidate_blocks(blocks_to_validate, *args, **kwargs)
+
+        async def new_peak_mock(*args: object) -> None:
+            log.info("do nothing")
+
+        # the chain is short enough for node 2 to batch sync when it hears of
+        # the peak, it must only be synced by the call below
+        monkeypatch.setattr(node, "new_peak", new_peak_mock)
+        monkeypatch.setattr(node, "prevalidate_blocks", check_prevalidate_blocks)
+        await server_2.start_client(PeerInfo(self_hostname, server_1.get_port()), None)
+        node.sync_store.peer_has_block(
+            peak1.header_hash, full_node_1.full_node.server.node_id, peak1.weight, peak1.height, True
+        )
+        await node.sync_from_fork_point(uint32(0), peak1.height, peak1.header_hash, [])
+        assert node_height_exactly(full_node_2, peak1.height)
+        assert node.blockchain.get_peak().header_hash == peak1.header_hash
+        if pipeline_depth == 0:
+            assert pipelined_batches == 0
+        else:
+            assert pipelined_batches > 0
+
     @pytest.mark.anyio
     @pytest.mark.skip("skipping until we re-enable the capability in chia.protocols.shared_protocol")
     async def test_sync_none_wp_response_backward_comp(self, three_nodes, default_1000_blocks, self_hostname):
@@ -493,6 +493,129 @@ async def test_get_coin_states(db_version: int) -> None:
         assert len(await coin_store.get_coin_states_by_ids(True, coins, uint32(0), max_items=10000)) == 600
 
 
+def make_coin(i: int) -> Coin:
+    return Coin(std_hash(i.to_bytes(4, byteorder="big")), std_hash(b"ph"), uint64(i))
+
+
+def coin_changes(height: int) -> Tuple[Set[Coin], List[Coin], List[bytes32]]:
+    rewards = {make_coin(2 * height), make_coin(2 * height + 1)}
+    additions = [make_coin(1000 + height)]
+    removals: List[bytes32] = []
+    if height >= 3:
+        # a reward coin and a transaction coin of earlier blocks
+        removals += [make_coin(2 * (height - 2)).name(), make_coin(1000 + height - 1).name()]
+    if height % 4 == 0:
+        # an ephemeral coin
+        additions.append(make_coin(5000 + height))
+        removals.append(make_coin(5000 + height).name())
+    return rewards, additions, removals
+
+
+@pytest.mark.anyio
+async def test_write_behind(db_version: int) -> None:
+    async with DBConnection(db_version) as db_wrapper, DBConnection(db_version) as buffered_db_wrapper:
+        coin_store = await CoinStore.create(db_wrapper)
+        buffered = await CoinStore.create(buffered_db_wrapper)
+        buffered.enable_write_behind(10)
+        names: List[bytes32] = []
+
+        async def add_block(height: int) -> None:
+            rewards, additions, removals = coin_changes(height)
+            names.extend(c.name() for c in list(rewards) + additions)
+            for store in (coin_store, buffered):
+                await store.new_block(uint32(height), uint64(height), rewards, additions, removals)
+            await buffered.maybe_flush()
+            assert set(await coin_store.get_coin_records(names)) == set(await buffered.get_coin_records(names))
+            for name in removals:
+                assert await coin_store.get_coin_record(name) == await buffered.get_coin_record(name)
+
+        for height in range(1, 46):
+            await add_block(height)
+        # blocks 41 to 45 are buffered
+        assert await buffered.get_unflushed_height() == 41
+        assert await coin_store.get_unflushed_height() is None
+
+        # double spends of buffered and flushed coins are rejected without
+        # changing the buffer
+        for spent_coin in (make_coin(2 * 43), make_coin(1000 + 40)):
+            with pytest.raises(ValueError, match="Invalid operation to set spent"):
+                await buffered.new_block(
+                    uint32(46), uint64(46), {make_coin(92), make_coin(93)}, [], [spent_coin.name()]
+                )
+        assert set(await coin_store.get_coin_records(names)) == set(await buffered.get_coin_records(names))
+
+        # roll back part of the buffer, and beyond it
+        for rollback_height in (43, 38):
+            expected = await coin_store.rollback_to_block(rollback_height)
+            assert set(await buffered.rollback_to_block(rollback_height)) == set(expected)
+            assert set(await coin_store.get_coin_records(names)) == set(await buffered.get_coin_records(names))
+        assert await buffered.get_unflushed_height() is None
+
+        for height in range(39, 66):
+            await add_block(height)
+        assert await buffered.get_unflushed_height() == 59
+
+        # the other queries see the buffered blocks
+        assert await buffered.num_unspent() == await coin_store.num_unspent()
+        assert await buffered.get_unflushed_height() is None
+        await add_block(66)
+        await buffered.disable_write_behind()
+        assert await buffered.get_unflushed_height() is None
+        assert set(await buffered.get_all_coins(True)) == set(await coin_store.get_all_coins(True))
+
+
+@pytest.mark.limit_consensus_modes(reason="save time")
+@pytest.mark.anyio
+async def test_write_behind_replay(tmp_dir: Path, db_version: int, bt: BlockTools) -> None:
+    reward_ph = WALLET_A.get_new_puzzlehash()
+    blocks = bt.get_consecutive_blocks(
+        10,
+        farmer_reward_puzzle_hash=reward_ph,
+        pool_reward_puzzle_hash=reward_ph,
+        guarantee_transaction_block=True,
+    )
+    coin = next(c for c in blocks[-1].get_included_reward_coins() if c.puzzle_hash == reward_ph)
+    spend_bundle = WALLET_A.generate_signed_transaction(uint64(1000), WALLET_A.get_new_puzzlehash(), coin)
+    blocks = bt.get_consecutive_blocks(
+        10,
+        blocks,
+        farmer_reward_puzzle_hash=reward_ph,
+        pool_reward_puzzle_hash=reward_ph,
+        guarantee_transaction_block=True,
+        transaction_data=spend_bundle,
+    )
+    names = [c.name() for b in blocks for c in b.get_included_reward_coins()]
+    names += [c.name() for c in spend_bundle.additions()]
+
+    async with DBConnection(db_version) as db_wrapper:
+        coin_store = await CoinStore.create(db_wrapper)
+        store = await BlockStore.create(db_wrapper)
+        b: Blockchain = await Blockchain.create(coin_store, store, bt.constants, tmp_dir, 2)
+        try:
+            for block in blocks[:10]:
+                await _validate_and_add_block(b, block)
+            coin_store.enable_write_behind(1000)
+            for block in blocks[10:]:
+                await _validate_and_add_block(b, block)
+            assert await coin_store.get_unflushed_height() == 10
+            expected = await coin_store.get_coin_records(names)
+            assert len(expected) == len(names)
+            assert any(r.spent for r in expected)
+        finally:
+            b.shut_down()
+
+        # the node stops without flushing the coin store, the coin changes
+        # are re-applied on start
+        coin_store = await CoinStore.create(db_wrapper)
+        store = await BlockStore.create(db_wrapper)
+        b = await Blockchain.create(coin_store, store, bt.constants, tmp_dir, 2)
+        try:
+            assert await coin_store.get_unflushed_height() is None
+            assert set(await coin_store.get_all_coins(True)) == set(expected)
+        finally:
+            b.shut_down()
+
+
 @pytest.mark.anyio
 async def test_unsupported_version() -> None:
     with pytest.raises(RuntimeError, match="CoinStore does not support database schema v1"):
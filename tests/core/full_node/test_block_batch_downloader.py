@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple, cast
+
+import pytest
+
+from chia.full_node.block_batch_downloader import BlockBatchDownloader, PeerDownloadStats
+from chia.protocols.full_node_protocol import RequestBlocks
+from chia.server.ws_connection import WSChiaConnection
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.full_block import FullBlock
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FakeBlock:
+    height: int
+
+
+@dataclass
+class FakePeer:
+    peer_node_id: bytes32
+    delay: float
+    fail: bool = False
+    closed: bool = False
+    requests: List[Tuple[int, int]] = field(default_factory=list)
+
+    def get_peer_logging(self) -> str:
+        return self.peer_node_id.hex()[:8]
+
+
+class FakeDownloader(BlockBatchDownloader):
+    async def fetch_batch(self, peer: WSChiaConnection, request: RequestBlocks) -> Optional[List[FullBlock]]:
+        fake = cast(FakePeer, peer)
+        fake.requests.append((request.start_height, request.end_height))
+        await asyncio.sleep(fake.delay)
+        if fake.fail:
+            return None
+        return cast(List[FullBlock], [FakeBlock(h) for h in range(request.start_height, request.end_height + 1)])
+
+
+def make_peers(seeded_random: random.Random, delays: List[float]) -> List[FakePeer]:
+    return [FakePeer(bytes32.random(seeded_random), d) for d in delays]
+
+
+async def run_downloader(
+    peers: List[FakePeer], start: int, end: int, batch_size: int, **kwargs: Any
+) -> Tuple[List[Tuple[int, int]], BlockBatchDownloader]:
+    queue: asyncio.Queue[Optional[Tuple[WSChiaConnection, List[FullBlock]]]] = asyncio.Queue()
+    downloader = FakeDownloader(
+        start_height=start,
+        end_height=end,
+        batch_size=batch_size,
+        get_peers=lambda: cast(List[WSChiaConnection], peers),
+        log=log,
+        **kwargs,
+    )
+    await downloader.run(queue)
+    ranges: List[Tuple[int, int]] = []
+    while not queue.empty():
+        res = queue.get_nowait()
+        assert res is not None
+        ranges.append((res[1][0].height, res[1][-1].height))
+    return ranges, downloader
+
+
+@pytest.mark.anyio
+async def test_batches_delivered_in_order(seeded_random: random.Random) -> None:
+    peers = make_peers(seeded_random, [0.001 * seeded_random.randint(1, 10) for _ in range(5)])
+    ranges, _ = await run_downloader(peers, 10, 1000, 32)
+    expected = [(s, min(1000, s + 31)) for s in range(10, 1001, 32)]
+    assert ranges == expected
+    # the work was spread across the peers
+    assert sum(1 for p in peers if len(p.requests) > 0) > 1
+
+
+@pytest.mark.anyio
+async def test_failing_peer_is_retried_elsewhere(seeded_random: random.Random) -> None:
+    peers = make_peers(seeded_random, [0.001, 0.001])
+    peers[0].fail = True
+    ranges, downloader = await run_downloader(peers, 0, 320, 32)
+    assert ranges == [(s, min(320, s + 31)) for s in range(0, 321, 32)]
+    assert downloader.peer_stats[peers[0].peer_node_id].failures > 0
+    assert downloader.peer_stats[peers[1].peer_node_id].batches == len(ranges)
+
+
+@pytest.mark.anyio
+async def test_failing_peer_is_not_asked_for_every_batch(seeded_random: random.Random) -> None:
+    peers = make_peers(seeded_random, [0.001, 0.001])
+    peers[0].fail = True
+    ranges, downloader = await run_downloader(peers, 0, 41 * 32 - 1, 32)
+    assert len(ranges) == 41
+    # the failing peer is demoted, and given up on after a few failures in a
+    # row (plus the requests that were already in flight at that point)
+    assert len(peers[0].requests) <= downloader.max_consecutive_failures + downloader.max_per_peer
+    assert downloader.peer_stats[peers[0].peer_node_id].batches == 0
+
+
+@pytest.mark.anyio
+async def test_all_peers_failing(seeded_random: random.Random) -> None:
+    peers = make_peers(seeded_random, [0.001, 0.001])
+    for p in peers:
+        p.fail = True
+    ranges, _ = await run_downloader(peers, 0, 320, 32)
+    assert ranges == []
+    # each peer was asked for the first batch exactly once
+    assert [p.requests.count((0, 31)) for p in peers] == [1, 1]
+
+
+@pytest.mark.anyio
+async def test_straggler_reissued(seeded_random: random.Random) -> None:
+    peers = make_peers(seeded_random, [10, 0.001])
+    # the first peer looks fast, but turns out to be very slow. The batch it's
+    # holding up is re-issued to the other peer instead of waiting for it
+    peer_stats = {
+        peers[0].peer_node_id: PeerDownloadStats(blocks_per_second=100000),
+        peers[1].peer_node_id: PeerDownloadStats(blocks_per_second=1000),
+    }
+    ranges, _ = await asyncio.wait_for(
+        run_downloader(peers, 0, 64, 32, min_straggler_time=0.05, max_per_peer=1, peer_stats=peer_stats),
+        timeout=5,
+    )
+    assert ranges == [(0, 31), (32, 63), (64, 64)]
+
+
+def test_peer_stats() -> None:
+    stats = PeerDownloadStats()
+    assert stats.score() == float("inf")
+    stats.record_success(32, 1.0)
+    assert stats.score() == 32
+    stats.record_success(32, 0.5)
+    assert 32 < stats.score() < 64
+    before = stats.score()
+    stats.record_failure()
+    assert stats.score() == before / 2
+    assert stats.batches == 2
+    assert stats.failures == 1
+
+    # a peer that never delivered a batch is no longer tried first
+    stats = PeerDownloadStats()
+    stats.record_failure()
+    assert stats.score() == 0
+    assert stats.consecutive_failures == 1
+    stats.record_success(32, 1.0)
+    assert stats.consecutive_failures == 0
+
+
+@pytest.mark.anyio
+async def test_no_peers() -> None:
+    ranges, _ = await run_downloader([], 0, 100, 32)
+    assert ranges == []
@@ -7,7 +7,7 @@ from typing import Optional
 
 import pytest
 
-from chia.full_node.block_height_map import BlockHeightMap, SesCache
+from chia.full_node.block_height_map import HEIGHT_TO_HASH_GROWTH, BlockHeightMap, SesCache
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.blockchain_format.sub_epoch_summary import SubEpochSummary
 from chia.util.db_wrapper import DBWrapper2
@@ -514,6 +514,48 @@ class TestBlockHeightMap:
                 for idx in range(0, 2000):
                     assert new_heights[idx * 32 : idx * 32 + 32] == gen_block_hash(idx)
 
+    @pytest.mark.anyio
+    async def test_cache_file_updated_in_place(self, tmp_dir: Path, db_version: int) -> None:
+        # the height-to-hash file is grown and updated as blocks are added,
+        # the hashes don't need to be flushed to be found on the next start
+        async with DBConnection(db_version) as db_wrapper:
+            await setup_db(db_wrapper)
+            await setup_chain(db_wrapper, 10, ses_every=20)
+            height_map = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            assert os.path.getsize(tmp_dir / "height-to-hash") == 11 * 32
+
+            for height in range(11, 2 * HEIGHT_TO_HASH_GROWTH + 11):
+                ses = gen_ses(height) if height % 20 == 0 else None
+                height_map.update_height(uint32(height), gen_block_hash(height), ses)
+            size = os.path.getsize(tmp_dir / "height-to-hash")
+            assert size >= (2 * HEIGHT_TO_HASH_GROWTH + 11) * 32
+            assert size <= (3 * HEIGHT_TO_HASH_GROWTH + 11) * 32
+
+            # a reorg replaces the hashes in place
+            height_map.rollback(HEIGHT_TO_HASH_GROWTH)
+            assert not height_map.contains_height(uint32(HEIGHT_TO_HASH_GROWTH + 1))
+            for height in range(HEIGHT_TO_HASH_GROWTH + 1, 2 * HEIGHT_TO_HASH_GROWTH + 11):
+                height_map.update_height(uint32(height), gen_block_hash(height + 0x10000), None)
+            assert os.path.getsize(tmp_dir / "height-to-hash") == size
+            # this writes the sub epoch summaries
+            await height_map.maybe_flush()
+            del height_map
+
+        async with DBConnection(db_version) as db_wrapper:
+            await setup_db(db_wrapper)
+            # only the main chain blocks around the last sub epoch summary are
+            # in the DB
+            await setup_chain(
+                db_wrapper, HEIGHT_TO_HASH_GROWTH + 10, ses_every=20, start_height=HEIGHT_TO_HASH_GROWTH - 30
+            )
+            height_map = await BlockHeightMap.create(tmp_dir, db_wrapper)
+            assert height_map.contains_height(uint32(HEIGHT_TO_HASH_GROWTH + 10))
+            assert not height_map.contains_height(uint32(HEIGHT_TO_HASH_GROWTH + 11))
+            for height in range(HEIGHT_TO_HASH_GROWTH + 11):
+                assert height_map.get_hash(uint32(height)) == gen_block_hash(height)
+            # the file isn't truncated
+            assert os.path.getsize(tmp_dir / "height-to-hash") == size
+
 
 @pytest.mark.anyio
 async def test_unsupported_version(tmp_dir: Path) -> None:
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import heapq
+import random
+from typing import List, Optional, Tuple
+
+import pytest
+from chia_rs import AugSchemeMPL
+
+from chia.consensus.cost_calculator import NPCResult
+from chia.full_node.bitcoin_fee_estimator import create_bitcoin_fee_estimator
+from chia.full_node.fee_estimation import MempoolInfo
+from chia.full_node.mempool import Mempool, MempoolRemoveReason, _heap_entries_below
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.serialized_program import SerializedProgram
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.clvm_cost import CLVMCost
+from chia.types.coin_spend import CoinSpend
+from chia.types.fee_rate import FeeRate
+from chia.types.mempool_item import BundleCoinSpend, MempoolItem
+from chia.types.spend_bundle import SpendBundle
+from chia.types.spend_bundle_conditions import Spend, SpendBundleConditions
+from chia.util.ints import uint32, uint64
+
+MAX_BLOCK_COST = 1000000
+
+
+def make_mempool(max_size: int = 5 * MAX_BLOCK_COST) -> Mempool:
+    info = MempoolInfo(
+        max_size_in_cost=CLVMCost(uint64(max_size)),
+        minimum_fee_per_cost_to_replace=FeeRate(uint64(5)),
+        max_block_clvm_cost=CLVMCost(uint64(MAX_BLOCK_COST)),
+    )
+    return Mempool(info, create_bitcoin_fee_estimator(uint64(MAX_BLOCK_COST)))
+
+
+def make_item(
+    idx: int,
+    cost: int,
+    fee: int,
+    *,
+    coins: Optional[List[Coin]] = None,
+    assert_before_height: Optional[int] = None,
+) -> MempoolItem:
+    if coins is None:
+        coins = [Coin(bytes32(idx.to_bytes(32, "big")), bytes32([0] * 32), uint64(idx))]
+    spends = [
+        Spend(
+            c.name(),
+            c.parent_coin_info,
+            c.puzzle_hash,
+            c.amount,
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+            [],
+            [],
+            [],
+            [],
+            [],
+            [],
+            [],
+            [],
+            0,
+        )
+        for c in coins
+    ]
+    conds = SpendBundleConditions(spends, 0, 0, 0, None, None, [], cost, 0, 0)
+    coin_spends = [CoinSpend(c, SerializedProgram(), SerializedProgram()) for c in coins]
+    sk = AugSchemeMPL.key_gen(idx.to_bytes(32, "big"))
+    spend_bundle = SpendBundle(coin_spends, AugSchemeMPL.sign(sk, b"item"))
+    return MempoolItem(
+        spend_bundle,
+        uint64(fee),
+        NPCResult(None, conds, uint64(cost)),
+        spend_bundle.name(),
+        uint32(0),
+        assert_before_height=None if assert_before_height is None else uint32(assert_before_height),
+        bundle_coin_spends={
+            cs.coin.name(): BundleCoinSpend(cs, False, [Coin(cs.coin.name(), bytes32([1] * 32), uint64(1))])
+            for cs in coin_spends
+        },
+    )
+
+
+def test_totals_after_eviction_and_expiry() -> None:
+    mempool = make_mempool()
+    items = [make_item(i, 500000, 500000 * (i + 1)) for i in range(10)]
+    for item in items:
+        assert mempool.add_to_pool(item) is None
+    assert mempool.total_mempool_cost() == 5000000
+    assert mempool.total_mempool_fees() == sum(item.fee for item in items)
+
+    # the pool is full, the lowest fee rate item is evicted
+    new_item = make_item(100, 500000, 500000 * 20)
+    assert mempool.add_to_pool(new_item) is None
+    assert mempool.get_item_by_id(items[0].name) is None
+    assert mempool.total_mempool_cost() == 5000000
+    assert mempool.total_mempool_fees() == sum(item.fee for item in items[1:]) + new_item.fee
+
+    expiring = make_item(101, 100000, 100000 * 30, assert_before_height=10)
+    assert mempool.add_to_pool(expiring) is None
+    mempool.new_tx_block(uint32(10), uint64(1000))
+    assert mempool.get_item_by_id(expiring.name) is None
+    remaining = [mempool.get_item_by_id(item.name) for item in items[1:] + [new_item]]
+    assert sum(item.cost for item in remaining if item is not None) == mempool.total_mempool_cost()
+    assert sum(item.fee for item in remaining if item is not None) == mempool.total_mempool_fees()
+
+    mempool.remove_from_pool(mempool.all_item_ids(), MempoolRemoveReason.CONFLICT)
+    assert mempool.size() == 0
+    assert mempool.total_mempool_cost() == 0
+    assert mempool.total_mempool_fees() == 0
+
+
+def test_same_feerate_ordered_by_seq() -> None:
+    mempool = make_mempool()
+    items = [make_item(i, 100000, 100000 * 5) for i in range(5)]
+    for item in items:
+        mempool.add_to_pool(item)
+    assert [item.name for item in mempool.items_by_feerate()] == [item.name for item in items]
+
+    # re-adding an item puts it last among the items with the same fee rate
+    mempool.remove_from_pool([items[0].name], MempoolRemoveReason.CONFLICT)
+    mempool.add_to_pool(items[0])
+    assert [item.name for item in mempool.items_by_feerate()] == [item.name for item in items[1:] + items[:1]]
+
+    # and the pool evicts the most recently added one first
+    full = make_mempool(max_size=500000)
+    for item in items:
+        full.add_to_pool(item)
+    assert full.all_item_ids() == [item.name for item in items[:5]]
+    assert full.add_to_pool(make_item(10, 100000, 100000 * 6)) is None
+    assert full.get_item_by_id(items[4].name) is None
+
+
+def test_expiry_heap_compaction() -> None:
+    mempool = make_mempool(max_size=1000 * MAX_BLOCK_COST)
+    items = [make_item(i, 1000, 1000, assert_before_height=1000 + i) for i in range(500)]
+    for item in items:
+        mempool.add_to_pool(item)
+    assert len(mempool._expiry_by_height) == 500
+
+    # removed items are left in the heap until they make up most of it
+    mempool.remove_from_pool([item.name for item in items[:450]], MempoolRemoveReason.CONFLICT)
+    assert len(mempool._expiry_by_height) == 500
+    mempool.new_tx_block(uint32(1), uint64(1))
+    assert len(mempool._expiry_by_height) == 50
+    assert sorted(e[2] for e in mempool._expiry_by_height) == sorted(item.name for item in items[450:])
+
+    # an item that was removed and added back without the expiry is not
+    # expired by its stale heap entry
+    mempool.remove_from_pool([items[450].name], MempoolRemoveReason.CONFLICT)
+    readded = make_item(450, 1000, 1000)
+    assert readded.name == items[450].name
+    mempool.add_to_pool(readded)
+    mempool.new_tx_block(uint32(1451), uint64(2))
+    assert mempool.size() == 49
+    assert mempool.get_item_by_id(readded.name) is not None
+    mempool.new_tx_block(uint32(2000), uint64(3))
+    assert mempool.all_item_ids() == [readded.name]
+
+
+def test_get_items_by_coin_ids() -> None:
+    mempool = make_mempool()
+    coins = [Coin(bytes32(i.to_bytes(32, "big")), bytes32([0] * 32), uint64(i)) for i in range(3)]
+    item1 = make_item(1, 1000, 1000, coins=coins[:2])
+    item2 = make_item(2, 1000, 2000, coins=coins[1:])
+    mempool.add_to_pool(item1)
+    mempool.add_to_pool(item2)
+    assert [i.name for i in mempool.get_items_by_coin_id(coins[0].name())] == [item1.name]
+    assert {i.name for i in mempool.get_items_by_coin_ids([c.name() for c in coins])} == {item1.name, item2.name}
+    mempool.remove_from_pool([item1.name], MempoolRemoveReason.CONFLICT)
+    assert mempool.get_items_by_coin_id(coins[0].name()) == []
+    assert [i.name for i in mempool.get_items_by_coin_id(coins[1].name())] == [item2.name]
+
+
+@pytest.mark.parametrize("limit", [0, 1, 50, 500, 1001])
+def test_heap_entries_below(seeded_random: random.Random, limit: int) -> None:
+    heap: List[Tuple[int, int, bytes32]] = []
+    for seq in range(300):
+        heapq.heappush(heap, (seeded_random.randint(0, 1000), seq, bytes32.random(seeded_random)))
+    before = list(heap)
+    assert list(_heap_entries_below(heap, limit)) == sorted(e for e in heap if e[0] < limit)
+    assert heap == before
+
+
+def test_block_template(seeded_random: random.Random) -> None:
+    mempool = make_mempool()
+    assert mempool.create_bundle_from_mempool_items() is None
+    added: List[MempoolItem] = []
+    for i in range(300):
+        if len(added) > 0 and seeded_random.random() < 0.3:
+            item = added.pop(seeded_random.randrange(len(added)))
+            mempool.remove_from_pool([item.name], MempoolRemoveReason.CONFLICT)
+        else:
+            cost = seeded_random.randint(10000, 200000)
+            item = make_item(i, cost, cost * seeded_random.randint(1, 5))
+            assert mempool.add_to_pool(item) is None
+            added.append(item)
+        added = [item for item in added if mempool.get_item_by_id(item.name) is not None]
+
+        # the maintained template matches a block made from scratch
+        expected = mempool.create_bundle_from_mempool_items(lambda _: True)
+        assert mempool.create_bundle_from_mempool_items() == expected
+        if expected is not None:
+            bundle, additions = expected
+            assert bundle.aggregated_signature == AugSchemeMPL.aggregate(
+                [item.spend_bundle.aggregated_signature for item in mempool.items_by_feerate()][: len(additions)]
+            )
+            assert sum(mempool.get_items_by_coin_id(cs.coin.name())[0].cost for cs in bundle.coin_spends) <= (
+                MAX_BLOCK_COST
+            )
+
+
+def test_block_template_filter() -> None:
+    mempool = make_mempool()
+    items = [make_item(i, 100000, 100000 * (i + 1)) for i in range(3)]
+    for item in items:
+        mempool.add_to_pool(item)
+    result = mempool.create_bundle_from_mempool_items(lambda name: name != items[2].name)
+    assert result is not None
+    assert [cs.coin for cs in result[0].coin_spends] == [items[1].removals[0], items[0].removals[0]]
+    # the filter doesn't affect the maintained template
+    result = mempool.create_bundle_from_mempool_items()
+    assert result is not None
+    assert len(result[0].coin_spends) == 3
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 from dataclasses import dataclass
 from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 import pytest
-from chia_rs import ELIGIBLE_FOR_DEDUP, G1Element, G2Element
+from chia_rs import ELIGIBLE_FOR_DEDUP, AugSchemeMPL, G1Element, G2Element
 from chiabip158 import PyBIP158
 
 from chia.consensus.constants import ConsensusConstants
@@ -20,6 +21,8 @@ from chia.full_node.mempool_manager import (
     compute_assert_height,
     optional_max,
     optional_min,
+    validate_clvm_and_signature,
+    validate_clvm_and_signature_batch,
 )
 from chia.protocols import wallet_protocol
 from chia.protocols.protocol_message_types import ProtocolMessageTypes
@@ -458,6 +461,63 @@ async def test_double_spend_prevalidation() -> None:
         await mempool_manager.pre_validate_spendbundle(sb_twice, None, sb_twice.name())
 
 
+def test_validate_clvm_and_signature_batch() -> None:
+    sk = AugSchemeMPL.key_gen(b"\x01" * 32)
+    valid = spend_bundle_from_conditions([[ConditionOpcode.CREATE_COIN, IDENTITY_PUZZLE_HASH, 1]])
+    conditions = [[ConditionOpcode.AGG_SIG_UNSAFE, bytes(sk.get_g1()), b"foobar"]]
+    signed = SpendBundle(
+        spend_bundle_from_conditions(conditions, TEST_COIN2).coin_spends, AugSchemeMPL.sign(sk, b"foobar")
+    )
+    bad_signature = SpendBundle(signed.coin_spends, AugSchemeMPL.sign(sk, b"foo"))
+    max_cost = DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM
+    results, new_cache_entries = validate_clvm_and_signature_batch(
+        [bytes(valid), bytes(bad_signature), bytes(signed)], max_cost, DEFAULT_CONSTANTS, TEST_HEIGHT
+    )
+    assert [err for err, _ in results] == [None, Err.BAD_AGGREGATE_SIGNATURE, None]
+    # the results match validating the spend bundles one at a time
+    for sb, (err, result_bytes) in zip([valid, signed], [results[0], results[2]]):
+        assert validate_clvm_and_signature(bytes(sb), max_cost, DEFAULT_CONSTANTS, TEST_HEIGHT)[:2] == (
+            None,
+            result_bytes,
+        )
+    _, _, signed_cache_entries = validate_clvm_and_signature(bytes(signed), max_cost, DEFAULT_CONSTANTS, TEST_HEIGHT)
+    # the pairing was computed by the invalid spend bundle first, so it's not
+    # returned
+    assert len(signed_cache_entries) == 1
+    assert new_cache_entries == {}
+    _, new_cache_entries = validate_clvm_and_signature_batch(
+        [bytes(signed), bytes(bad_signature)], max_cost, DEFAULT_CONSTANTS, TEST_HEIGHT
+    )
+    assert new_cache_entries == signed_cache_entries
+
+
+@pytest.mark.anyio
+async def test_pre_validate_spendbundle_batches() -> None:
+    mempool_manager = await instantiate_mempool_manager(zero_calls_get_coin_record)
+    spend_bundles = [
+        spend_bundle_from_conditions([[ConditionOpcode.CREATE_COIN, IDENTITY_PUZZLE_HASH, i + 1]]) for i in range(50)
+    ]
+    sk = AugSchemeMPL.key_gen(b"\x01" * 32)
+    invalid = SpendBundle(spend_bundles[0].coin_spends, AugSchemeMPL.sign(sk, b"foobar"))
+    results = await asyncio.gather(
+        *(mempool_manager.pre_validate_spendbundle(sb, None, sb.name()) for sb in spend_bundles + [invalid]),
+        return_exceptions=True,
+    )
+    for sb, result in zip(spend_bundles, results):
+        assert isinstance(result, NPCResult)
+        assert result.conds is not None
+        assert result.conds.spends[0].create_coin[0][1] == sb.additions()[0].amount
+    assert isinstance(results[-1], ValidationError)
+    assert results[-1].code == Err.BAD_AGGREGATE_SIGNATURE
+
+    # the spend bundles that queued up while the workers were busy were
+    # validated in batches
+    stats = mempool_manager.validation_stats
+    assert stats.validated == len(spend_bundles) + 1
+    assert 1 < stats.batches < len(spend_bundles) / 10
+    assert stats.queue_latency > 0
+
+
 @pytest.mark.anyio
 async def test_minting_coin() -> None:
     mempool_manager = await instantiate_mempool_manager(zero_calls_get_coin_record)
@@ -70,6 +70,13 @@ async def test_get_routes(harvester_farmer_environment: HarvesterFarmerEnvironme
     await validate_get_routes(harvester_rpc_client, harvester_service.rpc_server.rpc_api)
 
 
+@pytest.mark.anyio
+async def test_harvester_get_disk_stats(harvester_farmer_environment: HarvesterFarmerEnvironment) -> None:
+    _, _, harvester_service, harvester_rpc_client, _ = harvester_farmer_environment
+    disk_stats = await harvester_rpc_client.get_disk_stats()
+    assert disk_stats == harvester_service._node.disk_scheduler.disk_stats()
+
+
 @pytest.mark.parametrize("endpoint", ["get_harvesters", "get_harvesters_summary"])
 @pytest.mark.anyio
 async def test_farmer_get_harvesters_and_summary(
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from chia.harvester.disk_scheduler import DiskScheduler, LookupPriority
+
+
+@pytest.mark.anyio
+async def test_disk_scheduler_limits_and_priorities() -> None:
+    started: List[str] = []
+    running: Dict[int, int] = {0: 0, 1: 0}
+    max_running: Dict[int, int] = {0: 0, 1: 0}
+    lock = threading.Lock()
+    release_slow_disk = threading.Event()
+
+    def lookup(device: int, name: str) -> str:
+        with lock:
+            started.append(name)
+            running[device] += 1
+            max_running[device] = max(max_running[device], running[device])
+        if device == 0:
+            release_slow_disk.wait(10)
+        with lock:
+            running[device] -= 1
+        return name
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        scheduler = DiskScheduler(executor, 2)
+
+        def run(device: int, priority: LookupPriority, name: str) -> "asyncio.Task[str]":
+            return asyncio.create_task(
+                scheduler.run(device, Path(f"/disk{device}/{name}.plot"), priority, lookup, device, name)
+            )
+
+        slow = [run(0, LookupPriority.qualities, f"q{i}") for i in range(4)]
+        await asyncio.sleep(0)
+        proof = run(0, LookupPriority.full_proof, "proof")
+
+        # the slow disk has used up its two slots, the other disk isn't blocked by it
+        assert await run(1, LookupPriority.qualities, "fast") == "fast"
+        for _ in range(100):
+            if running[0] == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert [name for name in started if name != "fast"] == ["q0", "q1"]
+        assert scheduler.disk_stats()[0]["waiting"] == 3
+
+        release_slow_disk.set()
+        assert await asyncio.gather(*slow, proof) == ["q0", "q1", "q2", "q3", "proof"]
+
+    # the full proof was queued last, but started first
+    slow_disk_order = [name for name in started if name != "fast"]
+    assert slow_disk_order[2] == "proof"
+    assert max_running == {0: 2, 1: 1}
+
+    stats = {disk["device"]: disk for disk in scheduler.disk_stats()}
+    assert stats[0]["example_path"] == str(Path("/disk0"))
+    assert stats[0]["running"] == 0
+    assert stats[0]["waiting"] == 0
+    assert sum(stats[0]["latencies"]["qualities"]["counts"]) == 4
+    assert sum(stats[0]["latencies"]["full_proof"]["counts"]) == 1
+    assert sum(stats[1]["latencies"]["qualities"]["counts"]) == 1
+
+
+@pytest.mark.anyio
+async def test_disk_scheduler_cancelled_waiter() -> None:
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = DiskScheduler(executor, 1)
+        first = asyncio.create_task(scheduler.run(0, Path("a"), LookupPriority.qualities, release.wait, 10))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(scheduler.run(0, Path("b"), LookupPriority.qualities, lambda: 2))
+        await asyncio.sleep(0)
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        assert scheduler.disk_stats()[0]["waiting"] == 0
+
+        release.set()
+        assert await first is True
+        assert await scheduler.run(0, Path("c"), LookupPriority.qualities, lambda: 3) == 3
+    assert scheduler.disk_stats()[0]["running"] == 0
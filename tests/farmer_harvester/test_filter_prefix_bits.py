@@ -131,3 +131,7 @@ async def test_filter_prefix_bits_with_farmer_harvester(
     assert state_change == "farming_info"
     assert state_change_data is not None
     assert state_change_data.get("eligible_plots") == eligible_plots
+    assert state_change_data.get("filter_time", -1) >= 0
+    # the lookups of the eligible plots went through the disk scheduler
+    disk_stats = harvester_service._node.disk_scheduler.disk_stats()
+    assert sum(sum(disk["latencies"]["qualities"]["counts"]) for disk in disk_stats) == eligible_plots
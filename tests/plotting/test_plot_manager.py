@@ -194,6 +194,10 @@ async def test_plot_refreshing(environment):
         assert len(get_plot_directories(env.root_path)) == expected_directories
         await env.refresh_tester.run(expected_result)
         assert len(env.refresh_tester.plot_manager.plots) == expect_total_plots
+        # the plot filter snapshot follows the refreshes
+        plot_ids, plots = env.refresh_tester.plot_manager.plot_filter_snapshot()
+        assert plots == list(env.refresh_tester.plot_manager.plots.items())
+        assert plot_ids == b"".join(plot_info.prover.get_id() for _, plot_info in plots)
         assert len(env.refresh_tester.plot_manager.get_duplicates()) == expect_duplicates
         assert len(env.refresh_tester.plot_manager.failed_to_open_filenames) == 0
 
@@ -14,6 +14,7 @@ from chia.types.peer_info import PeerInfo
 from chia.util.ints import uint32
 from chia.wallet.derivation_record import DerivationRecord
 from chia.wallet.derive_keys import master_sk_to_wallet_sk, master_sk_to_wallet_sk_unhardened
+from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import puzzle_hash_for_pk
 from chia.wallet.util.wallet_types import WalletType
 from chia.wallet.wallet_state_manager import WalletStateManager
 
@@ -95,3 +96,25 @@ async def test_determine_coin_type(simulator_and_wallet: SimulatorsAndWallets, s
     assert (None, None) == await wallet_state_manager.determine_coin_type(
         peer, CoinState(Coin(bytes32(b"1" * 32), bytes32(b"1" * 32), 0), uint32(0), uint32(0)), None
     )
+
+
+@pytest.mark.anyio
+async def test_create_more_puzzle_hashes_in_batches(simulator_and_wallet: SimulatorsAndWallets) -> None:
+    _, [(wallet_node, _)], _ = simulator_and_wallet
+    wallet_state_manager: WalletStateManager = wallet_node.wallet_state_manager
+    wallet_id = wallet_state_manager.main_wallet.id()
+    last = await wallet_state_manager.puzzle_store.get_last_derivation_path_for_wallet(wallet_id)
+    assert last is not None
+    # a batch size that doesn't divide the number of new paths
+    wallet_state_manager.puzzle_hash_batch_size = 7
+    await wallet_state_manager.create_more_puzzle_hashes(num_additional_phs=30)
+    new_last = await wallet_state_manager.puzzle_store.get_last_derivation_path_for_wallet(wallet_id)
+    assert new_last is not None and new_last > last + 20
+    for index in range(last - 1, new_last + 1):
+        for hardened in (True, False):
+            record = await wallet_state_manager.puzzle_store.get_derivation_record(uint32(index), wallet_id, hardened)
+            assert record is not None
+            conversion_method = master_sk_to_wallet_sk if hardened else master_sk_to_wallet_sk_unhardened
+            pubkey = conversion_method(wallet_state_manager.private_key, uint32(index)).get_g1()
+            assert record.pubkey == pubkey
+            assert record.puzzle_hash == puzzle_hash_for_pk(pubkey)